@@ -30,6 +30,8 @@ def create_app():
     app.config["SQLALCHEMY_DATABASE_URI"] = database_url
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     app.config["TESTING"] = app_env == "testing"
+    # Energy per hour new avatars gain (or lose, if negative), 0 = no decay
+    app.config["AVATAR_ENERGY_RATE"] = float(os.getenv("AVATAR_ENERGY_RATE", "0"))
 
     # Bind database to the app
     db.init_app(app)
@@ -42,6 +44,70 @@ def create_app():
     from app.routes import main
     app.register_blueprint(main)
 
+    # Password hashing pool, bcrypt never runs on the request threads
+    from app.hashing import PasswordHasher, BCRYPT_ROUNDS, TESTING_BCRYPT_ROUNDS
+    default_rounds = TESTING_BCRYPT_ROUNDS if app.config["TESTING"] else BCRYPT_ROUNDS
+    app.config["BCRYPT_ROUNDS"] = int(os.getenv("BCRYPT_ROUNDS", default_rounds))
+    app.extensions["password_hasher"] = PasswordHasher(
+        rounds=app.config["BCRYPT_ROUNDS"],
+        workers=int(os.getenv("BCRYPT_WORKERS", "0")) or None,
+        max_pending=int(os.getenv("BCRYPT_MAX_PENDING", "0")) or None,
+        wait_timeout=float(os.getenv("BCRYPT_WAIT_SECONDS", "1"))
+    )
+
+    # Auth, verified login tokens are remembered until they expire
+    from app.auth import init_auth
+    init_auth(app, cache_size=int(os.getenv("TOKEN_CACHE_SIZE", "10000")))
+
+    # Per-process caches
+    from app.cache import LRUCache
+    app.extensions["task_stats_cache"] = LRUCache(
+        maxsize=int(os.getenv("TASK_STATS_CACHE_SIZE", "1024")),
+        ttl=int(os.getenv("TASK_STATS_CACHE_TTL", "60"))
+    )
+    from app.owned import OwnedItems
+    app.extensions["owned_items"] = OwnedItems(maxsize=int(os.getenv("OWNED_ITEMS_CACHE_SIZE", "10000")))
+
+    # Customization item catalog, loaded now so the first /items call doesn't pay for it
+    from app.catalog import Catalog
+    app.extensions["catalog"] = Catalog(
+        ttl=int(os.getenv("CATALOG_TTL_SECONDS", "300")),
+        max_age=int(os.getenv("CATALOG_MAX_AGE", "60"))
+    )
+    app.extensions["catalog"].warm(app)
+
+    # CLI commands, e.g. `flask rebuild-streaks`
+    from app.commands import register_commands
+    register_commands(app)
+
+    # Background workers, off unless switched on in .env. Never while testing, or in CLI commands
+    # other than `flask run`, those only load the app to get at the database.
+    from app.workers import is_serving, start_worker
+    serving = not app.config["TESTING"] and is_serving()
+    if os.getenv("RENEWAL_WORKER", "0") == "1" and serving:
+        from app.renewals import renew_daily_tasks
+        start_worker(app, "daily-renewal", int(os.getenv("RENEWAL_INTERVAL_SECONDS", "300")), renew_daily_tasks)
+    if os.getenv("PURGE_WORKER", "0") == "1" and serving:
+        from app.purge import purge_deleted
+        start_worker(app, "purge", int(os.getenv("PURGE_INTERVAL_SECONDS", "3600")), purge_deleted)
+    if os.getenv("SNAPSHOT_WORKER", "0") == "1" and serving:
+        from app.wallets import snapshot_wallets
+        start_worker(app, "wallet-snapshots", int(os.getenv("SNAPSHOT_INTERVAL_SECONDS", "3600")), snapshot_wallets)
+    if os.getenv("CREDIT_COALESCING", "0") == "1" and serving:
+        from app.credits import start_credit_buffer
+        start_credit_buffer(
+            app,
+            window=int(os.getenv("CREDIT_WINDOW_MS", "200")) / 1000,
+            max_count=int(os.getenv("CREDIT_MAX_COUNT", "500"))
+        )
+    if os.getenv("REMINDER_WORKER", "0") == "1" and serving:
+        from app.reminders import SINKS, start_reminders
+        start_reminders(
+            app,
+            SINKS[os.getenv("REMINDER_SINK", "log")](),
+            refresh_interval=int(os.getenv("REMINDER_REFRESH_SECONDS", "60"))
+        )
+
     return app
 
 # Init app
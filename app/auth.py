@@ -0,0 +1,76 @@
+import time
+from functools import wraps
+from flask import current_app, g, jsonify, request
+import jwt
+from app.cache import LRUCache
+from app.models import Users
+from app.util import SECRET_KEY
+
+# Per-request authentication. The bearer token is verified at most once per request and the result
+# kept on flask.g, the user row is loaded the first time a route asks for it. Verified tokens are
+# also remembered across requests (app.extensions["token_cache"]) until they expire, so repeat
+# calls with the same token skip the HMAC check and JSON decoding altogether.
+
+# Sets up the verified token cache and the per-request reset on the app
+def init_auth(app, cache_size=10000):
+    app.extensions["token_cache"] = LRUCache(maxsize=cache_size)
+    # g normally lives and dies with the request, but not when the caller already pushed an app context
+    app.before_request(clear_auth)
+
+def clear_auth():
+    g.pop("identity", None)
+    g.pop("current_user", None)
+
+# The token from the Authorization header, None if there isn't one
+def get_bearer_token():
+    token = request.headers.get("Authorization")
+    if token and token.startswith("Bearer "):
+        token = token.split(" ")[1].strip()
+    return token or None
+
+# Decodes a token, using the verified token cache when we've seen it before
+def decode_token(token):
+    """Returns the token's user data, or None if it is invalid or expired."""
+    cache = current_app.extensions["token_cache"]
+    data = cache.get(token)
+    if data is not None:
+        return data
+
+    try:
+        decoded = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+    except jwt.InvalidTokenError:  # includes ExpiredSignatureError
+        return None
+    data = decoded.get("data")
+    # Cached until the moment the token expires, so an expired token is never served from here
+    remaining = decoded.get("exp", 0) - time.time()
+    if data is not None and remaining > 0:
+        cache.set(token, data, ttl=remaining)
+    return data
+
+# Who is making this request, as the data signed into their token
+def current_identity():
+    """The verified token data for this request, or None. Verified once per request."""
+    if "identity" not in g:
+        token = get_bearer_token()
+        g.identity = decode_token(token) if token else None
+    return g.identity
+
+# Looks up a user, deleted accounts are gone as far as the API is concerned
+def get_user(user_id):
+    return Users.query.filter(Users.id == user_id, Users.deleted_at.is_(None)).first()
+
+# The requesting user's row, loaded the first time it's asked for in a request
+def current_user():
+    if "current_user" not in g:
+        identity = current_identity()
+        g.current_user = get_user(identity.get("id")) if identity else None
+    return g.current_user
+
+# Route decorator, rejects the request with a 401 unless it carries a valid token
+def login_required(route):
+    @wraps(route)
+    def wrapper(*args, **kwargs):
+        if not current_identity():
+            return jsonify({"error": "Unauthorized or invalid token"}), 401
+        return route(*args, **kwargs)
+    return wrapper
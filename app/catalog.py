@@ -0,0 +1,123 @@
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import namedtuple
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from app import db
+from app.models import CustomizationItems
+
+# In-process copy of the customization item catalog. The catalog barely changes (app/seed.py loads it),
+# so /items and purchases read it from memory instead of querying it on every call. Items are kept
+# already serialized, in id order. Any ORM insert, update or delete of an item bumps the catalog
+# version once its transaction commits, and the next read reloads it. Changes made by another
+# process, or with Core statements, are picked up when the copy is older than `ttl` seconds.
+# The plain /items response is also rendered once per load, as JSON bytes and gzipped bytes.
+
+# How old the copy can get before it is reloaded anyway
+CATALOG_TTL_SECONDS = 300
+# How long browsers and CDNs may reuse the /items response before revalidating it
+CATALOG_MAX_AGE = 60
+
+# One loaded catalog, never changed after it's built, so readers don't need a lock.
+# positions maps item id => index in items, e.g. for the owned-items bitsets.
+# body and gzipped are the encoded items list, etag is derived from the content, not the version,
+# so a reload that finds the same items keeps clients' cached copies valid.
+CatalogSnapshot = namedtuple("CatalogSnapshot", ["version", "items", "by_id", "by_name", "positions", "body", "gzipped", "etag"])
+
+def item_to_dict(item):
+    return {
+        "id": item.id,
+        "item_type": item.item_type,
+        "name": item.name,
+        "item_cost": item.item_cost,
+        "model_key": item.model_key
+    }
+
+class Catalog:
+    def __init__(self, ttl=CATALOG_TTL_SECONDS, max_age=CATALOG_MAX_AGE):
+        self.ttl = ttl
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.version = 0
+        self.snapshot = None
+        self.loaded_at = 0.0
+
+    # Marks the loaded copy as stale
+    def invalidate(self):
+        with self.lock:
+            self.version += 1
+
+    def is_fresh(self):
+        snapshot = self.snapshot
+        return (
+            snapshot is not None
+            and snapshot.version == self.version
+            and time.monotonic() - self.loaded_at < self.ttl
+        )
+
+    # Reads the whole catalog, needs an app context
+    def load(self):
+        with self.lock:
+            # Someone else may have reloaded it while we waited for the lock
+            if self.is_fresh():
+                return self.snapshot
+            # Every load gets its own version, a reload after the ttl may see items changed elsewhere
+            self.version += 1
+            items = [item_to_dict(item) for item in CustomizationItems.query.order_by(CustomizationItems.id)]
+            body = json.dumps(items, separators=(",", ":")).encode()
+            self.snapshot = CatalogSnapshot(
+                version=self.version,
+                items=items,
+                by_id={item["id"]: item for item in items},
+                by_name={item["name"]: item for item in items},
+                positions={item["id"]: position for position, item in enumerate(items)},
+                body=body,
+                gzipped=gzip.compress(body, mtime=0),
+                etag=f"items-{hashlib.sha1(body).hexdigest()[:16]}"
+            )
+            self.loaded_at = time.monotonic()
+            return self.snapshot
+
+    def get(self):
+        """The current catalog, reloaded first if it changed or got too old"""
+        if self.is_fresh():
+            return self.snapshot
+        return self.load()
+
+    # Loads the catalog ahead of the first request, the tables may not exist yet (fresh database, migrations)
+    def warm(self, app):
+        with app.app_context():
+            try:
+                self.load()
+            except SQLAlchemyError:
+                db.session.rollback()
+            finally:
+                db.session.remove()
+
+# The app's catalog
+def get_catalog():
+    return current_app.extensions["catalog"].get()
+
+##### INVALIDATION #####
+# Item writes are noted on the session, the version is bumped once they commit (and dropped on rollback)
+@event.listens_for(CustomizationItems, "after_insert")
+@event.listens_for(CustomizationItems, "after_update")
+@event.listens_for(CustomizationItems, "after_delete")
+def note_catalog_change(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info["catalog_changed"] = True
+
+@event.listens_for(Session, "after_commit")
+def bump_catalog_version(session):
+    if session.info.pop("catalog_changed", False) and has_app_context() and "catalog" in current_app.extensions:
+        current_app.extensions["catalog"].invalidate()
+
+@event.listens_for(Session, "after_rollback")
+def drop_catalog_change(session):
+    session.info.pop("catalog_changed", None)
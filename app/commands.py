@@ -0,0 +1,41 @@
+import click
+from app import db
+from app.models import Users
+from app.streaks import rebuild_streak
+from app.renewals import renew_daily_tasks, RENEWAL_BATCH_SIZE
+from app.purge import purge_deleted, PURGE_BATCH_SIZE
+from app.wallets import snapshot_wallets, SNAPSHOT_BATCH_SIZE
+
+# Flask CLI commands, run with `flask <command>` (see the Makefile)
+def register_commands(app):
+    @app.cli.command("rebuild-streaks")
+    @click.option("--user-id", type=int, default=None, help="Only rebuild this user's streak.")
+    def rebuild_streaks(user_id):
+        """Recompute streaks from each user's completed tasks."""
+        user_ids = [user_id] if user_id else [row.id for row in db.session.query(Users.id).order_by(Users.id)]
+        for uid in user_ids:
+            streak = rebuild_streak(uid)
+            db.session.commit()
+            click.echo(f"User {uid}: {streak.current_streak} day streak, longest {streak.longest_streak}")
+        click.echo(f"Rebuilt {len(user_ids)} streak(s).")
+
+    @app.cli.command("renew-daily-tasks")
+    @click.option("--batch-size", type=int, default=RENEWAL_BATCH_SIZE, help="Tasks rolled over per transaction.")
+    def renew_daily_tasks_command(batch_size):
+        """Roll over every daily task whose day has ended."""
+        renewed = renew_daily_tasks(batch_size=batch_size)
+        click.echo(f"Renewed {renewed} daily task(s).")
+
+    @app.cli.command("purge-deleted")
+    @click.option("--batch-size", type=int, default=PURGE_BATCH_SIZE, help="Rows deleted per transaction.")
+    def purge_deleted_command(batch_size):
+        """Delete soft deleted users' data and expired task tombstones."""
+        users, rows = purge_deleted(batch_size=batch_size)
+        click.echo(f"Purged {users} user(s), {rows} row(s) in total.")
+
+    @app.cli.command("snapshot-wallets")
+    @click.option("--batch-size", type=int, default=SNAPSHOT_BATCH_SIZE, help="Users folded per transaction.")
+    def snapshot_wallets_command(batch_size):
+        """Fold new wallet ledger entries into balance snapshots."""
+        taken = snapshot_wallets(batch_size=batch_size)
+        click.echo(f"Took {taken} wallet snapshot(s).")
@@ -0,0 +1,175 @@
+import atexit
+import signal
+import threading
+import traceback
+from collections import defaultdict
+from flask import current_app, has_app_context
+from app import db
+from app.models import Users, Wallets
+from app.wallets import adjust_balance
+
+# Write-behind for wallet credits (optional, CREDIT_COALESCING=1). Small rewards arrive much faster than
+# one UPDATE and commit each on the same wallet row can keep up with, so credits are added up per user
+# in memory and written every `window` seconds (or as soon as `max_count` are waiting) as one increment
+# per user, all in one transaction. Balance reads add what is still buffered, so a user always sees
+# their own credits. Debits settle the user's buffered credits first. Buffered credits only live in
+# this process, stop() (registered to run at exit) writes out whatever is left. A SIGTERM (docker stop,
+# a redeploy) would kill Python without running exit handlers, so it is turned into a normal exit.
+
+# Seconds credits wait in the buffer at most
+CREDIT_WINDOW_SECONDS = 0.2
+# Buffered credits that trigger a flush before the window is up
+CREDIT_MAX_COUNT = 500
+
+class CreditBuffer(threading.Thread):
+    def __init__(self, app, window=CREDIT_WINDOW_SECONDS, max_count=CREDIT_MAX_COUNT):
+        super().__init__(name="credit-buffer", daemon=True)
+        self.app = app
+        self.window = window
+        self.max_count = max_count
+        self.pending = defaultdict(int)  # user id => buffered amount
+        self.counts = defaultdict(int)  # user id => how many credits that amount is made of
+        self.count = 0
+        # Being written right now, still counted by reads until the commit is done
+        self.flushing = {}
+        # Bumped once a batch is committed, a read that saw it change may have counted the batch twice
+        self.epoch = 0
+        self.lock = threading.Lock()  # guards everything above
+        # Signalled (under lock) when a batch is done, for reads waiting on their user's credits
+        self.flushed = threading.Condition(self.lock)
+        # Held while a batch is written, so only one is written at a time. Reads never take it.
+        self.flush_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopped = False
+
+    def add(self, user_id, amount):
+        with self.lock:
+            self.pending[user_id] += amount
+            self.counts[user_id] += 1
+            self.count += 1
+            if self.count >= self.max_count:
+                self.wake.set()
+
+    def buffered(self, user_id):
+        with self.lock:
+            return self.pending.get(user_id, 0) + self.flushing.get(user_id, 0)
+
+    def balance(self, user_id):
+        """A live user's balance including their buffered credits, None if they have no wallet"""
+        while True:
+            # While the user's credits are being written the database may or may not have them yet,
+            # wait for that batch only (no database work happens under the lock)
+            with self.flushed:
+                while user_id in self.flushing:
+                    self.flushed.wait()
+                epoch = self.epoch
+            balance = db.session.query(Wallets.balance).join(Users).filter(Wallets.user_id == user_id, Users.deleted_at.is_(None)).scalar()
+            with self.lock:
+                # No batch started or finished while we read, so the database has none of pending
+                if self.epoch == epoch and user_id not in self.flushing:
+                    return None if balance is None else balance + self.pending.get(user_id, 0)
+
+    # Writes out everything buffered (or just one user's credits), returns how many users were written
+    def flush(self, user_id=None):
+        with self.flush_lock:
+            with self.lock:
+                if user_id is None:
+                    batch, counts = dict(self.pending), dict(self.counts)
+                    self.pending, self.counts, self.count = defaultdict(int), defaultdict(int), 0
+                elif user_id in self.pending:
+                    batch, counts = {user_id: self.pending.pop(user_id)}, {user_id: self.counts.pop(user_id, 0)}
+                    self.count -= counts[user_id]
+                else:
+                    batch, counts = {}, {}
+                self.flushing = batch
+            if not batch:
+                return 0
+            # Its own app context, so it never shares a session with a request
+            with self.app.app_context():
+                try:
+                    # Same order every time, so two processes flushing at once can't deadlock on wallet rows
+                    for buffered_user, amount in sorted(batch.items()):
+                        if amount and adjust_balance(buffered_user, amount, "credits") is None:
+                            print(f"Dropped {amount} buffered coins for user {buffered_user}, they have no wallet")
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    # Nothing was written, put the credits back for the next flush
+                    with self.lock:
+                        for buffered_user, amount in batch.items():
+                            self.pending[buffered_user] += amount
+                            self.counts[buffered_user] += counts[buffered_user]
+                            self.count += counts[buffered_user]
+                        self.finish_batch()
+                    raise
+                finally:
+                    db.session.remove()
+            with self.lock:
+                self.finish_batch()
+            return len(batch)
+
+    # Called under lock once a batch is committed or put back
+    def finish_batch(self):
+        self.flushing = {}
+        self.epoch += 1
+        self.flushed.notify_all()
+
+    def run(self):
+        while not self.stopped:
+            # Woken early by a full buffer or stop()
+            self.wake.wait(self.window)
+            self.wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                traceback.print_exc()
+
+    def stop(self, timeout=None):
+        """Stop the thread and write out whatever is still buffered"""
+        self.stopped = True
+        self.wake.set()
+        if self.is_alive():
+            self.join(timeout)
+        self.flush()
+
+# The app's credit buffer, None when coalescing is off
+def get_credit_buffer():
+    if has_app_context():
+        return current_app.extensions.get("credit_buffer")
+    return None
+
+# Writes out a user's buffered credits before something that needs their real balance, e.g. a debit
+def settle_credits(user_id):
+    buffer = get_credit_buffer()
+    if buffer is not None and buffer.buffered(user_id):
+        buffer.flush(user_id)
+
+# Makes SIGTERM exit the way Ctrl+C (SIGINT) already does, unwinding the main thread so atexit runs.
+# The buffer isn't flushed in the handler itself, the main thread may be holding its flush lock.
+def exit_on_sigterm():
+    # Handlers can only be set from the main thread, and an ignored SIGTERM stays ignored
+    if threading.current_thread() is not threading.main_thread():
+        return False
+    previous = signal.getsignal(signal.SIGTERM)
+    if previous == signal.SIG_IGN:
+        return False
+
+    def handler(signum, frame):
+        # Someone else's handler (e.g. a WSGI server's graceful shutdown) gets to exit its own way
+        if callable(previous):
+            return previous(signum, frame)
+        raise SystemExit(128 + signum)
+
+    signal.signal(signal.SIGTERM, handler)
+    return True
+
+# Starts the buffer and keeps it on the app, where POST /balance finds it
+def start_credit_buffer(app, window=CREDIT_WINDOW_SECONDS, max_count=CREDIT_MAX_COUNT):
+    buffer = CreditBuffer(app, window, max_count)
+    app.extensions["credit_buffer"] = buffer
+    buffer.start()
+    atexit.register(buffer.stop, timeout=5)
+    if not exit_on_sigterm():
+        print("Credit buffer can't catch SIGTERM here, buffered credits are lost if the process is terminated")
+    print(f"Started credit buffer, flushing every {window}s or {max_count} credits")
+    return buffer
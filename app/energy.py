@@ -0,0 +1,70 @@
+from collections import defaultdict
+from app import db
+from app.models import Avatar, Tasks, ENERGY_MAX, energy_at
+from app.reminders import utcnow
+from sqlalchemy import update
+
+# Avatar energy writes. Energy drifts at each avatar's rate without anything being written (see
+# Avatar.energy_at), so there is no background job touching every avatar. Events like completing a
+# task fold the drift so far into the stored value and add their own amount in one conditional
+# UPDATE, which only matches if nobody else wrote the avatar since we read it. Each completed task
+# remembers how much energy it actually added (Tasks.energy_awarded, less than ENERGY_PER_TASK when the
+# avatar was near ENERGY_MAX), and un-completing it only takes that back.
+
+# Energy for each completed task, taken back if it is un-completed
+ENERGY_PER_TASK = 10
+# Times a write is retried after losing a race with another write to the same avatar
+ENERGY_WRITE_ATTEMPTS = 5
+
+# Adds amount to the user's avatar energy as of now, runs in the caller's transaction
+def add_energy(user_id, amount, now=None):
+    """Returns how much was actually added once clamped to 0..ENERGY_MAX, or None if the user has no avatar"""
+    now = now or utcnow()
+    for _ in range(ENERGY_WRITE_ATTEMPTS):
+        avatar = (
+            db.session.query(Avatar.avatar_energy, Avatar.energy_updated_at, Avatar.energy_rate)
+            .filter(Avatar.user_id == user_id)
+            .first()
+        )
+        if avatar is None:
+            return None
+        current = energy_at(avatar.avatar_energy, avatar.energy_updated_at, avatar.energy_rate, now)
+        energy = min(max(current + amount, 0), ENERGY_MAX)
+        written = db.session.execute(
+            update(Avatar.__table__)
+            .where(Avatar.user_id == user_id, Avatar.energy_updated_at == avatar.energy_updated_at)
+            .values(avatar_energy=energy, energy_updated_at=max(now, avatar.energy_updated_at))
+        ).rowcount
+        if written:
+            return energy - current
+    raise RuntimeError(f"Avatar energy for user {user_id} kept changing under us")
+
+# Rewards (or takes back) energy for task completions, given (user_id, task_id, completed) triples.
+# Runs after the tasks' own update, in the same transaction, so their rows are already locked.
+def reward_completions(changes, now=None):
+    completed, uncompleted = defaultdict(list), set()
+    for user_id, task_id, done in changes:
+        if done:
+            completed[user_id].append(task_id)
+        else:
+            uncompleted.add(task_id)
+
+    # Un-completed tasks give back what they were awarded, and are awarded nothing any more
+    if uncompleted:
+        awarded = defaultdict(float)
+        for row in db.session.query(Tasks.user_id, Tasks.energy_awarded).filter(Tasks.id.in_(uncompleted), Tasks.energy_awarded > 0):
+            awarded[row.user_id] += row.energy_awarded
+        for user_id, amount in sorted(awarded.items()):
+            add_energy(user_id, -amount, now)
+        db.session.execute(update(Tasks.__table__).where(Tasks.id.in_(uncompleted)).values(energy_awarded=0))
+
+    # Completed tasks share what the avatar actually took, full ones first, the rest get nothing
+    for user_id, task_ids in sorted(completed.items()):
+        applied = add_energy(user_id, len(task_ids) * ENERGY_PER_TASK, now) or 0
+        amounts = defaultdict(list)
+        for task_id in sorted(task_ids):
+            amount = min(ENERGY_PER_TASK, applied)
+            applied -= amount
+            amounts[amount].append(task_id)
+        for amount, ids in amounts.items():
+            db.session.execute(update(Tasks.__table__).where(Tasks.id.in_(ids)).values(energy_awarded=amount))
@@ -0,0 +1,70 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, has_app_context
+import bcrypt
+
+# Password hashing off the request threads. bcrypt is slow on purpose (~250ms at cost 12) and releases
+# the GIL while it runs, so a small thread pool caps how many hashes run at once. A login storm then
+# queues up behind the pool instead of taking every CPU from the other routes, and once the queue is
+# full, requests are turned away with HasherBusy (a 503) rather than piling up.
+
+# bcrypt cost factor, every +1 doubles the time per hash
+BCRYPT_ROUNDS = 12
+# Cost used while testing, so the suite doesn't spend its time hashing
+TESTING_BCRYPT_ROUNDS = 4
+
+# Raised when the pool is full and a hash didn't get a slot in time
+class HasherBusy(Exception):
+    pass
+
+class PasswordHasher:
+    def __init__(self, rounds=BCRYPT_ROUNDS, workers=None, max_pending=None, wait_timeout=1.0):
+        self.rounds = rounds
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        # Hashes running or waiting for a worker, past this callers wait up to wait_timeout for a slot
+        self.slots = threading.BoundedSemaphore(max_pending or self.workers * 4)
+        self.wait_timeout = wait_timeout
+
+    # Runs fn on the pool and waits for it, raises HasherBusy if there is no room
+    def run(self, fn, *args):
+        if not self.slots.acquire(timeout=self.wait_timeout):
+            raise HasherBusy()
+        try:
+            return self.pool.submit(fn, *args).result()
+        finally:
+            self.slots.release()
+
+    def hash(self, password):
+        """Hash a password at the configured cost, returns the hash as a str"""
+        salt = bcrypt.gensalt(rounds=self.rounds)
+        return self.run(bcrypt.hashpw, password.encode(), salt).decode()
+
+    def check(self, password, hashed):
+        """True if the password matches the stored hash"""
+        return self.run(bcrypt.checkpw, password.encode(), hashed.encode())
+
+    # The cost is stored in the hash itself, e.g. $2b$12$...
+    def needs_rehash(self, hashed):
+        try:
+            return int(hashed.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+
+# Used outside of an app, e.g. by scripts that import the models directly
+default_hasher = None
+default_hasher_lock = threading.Lock()
+
+# The app's hasher, set up in create_app
+def get_hasher():
+    global default_hasher
+    if has_app_context() and "password_hasher" in current_app.extensions:
+        return current_app.extensions["password_hasher"]
+    with default_hasher_lock:
+        if default_hasher is None:
+            default_hasher = PasswordHasher(rounds=int(os.getenv("BCRYPT_ROUNDS", BCRYPT_ROUNDS)))
+        return default_hasher
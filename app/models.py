@@ -1,8 +1,8 @@
 from app import db # db = SQLAlchemy instance from init app
 from datetime import datetime, timezone # used for dates
 from sqlalchemy.orm import relationship # needed for relationships
-from sqlalchemy import CheckConstraint
-import bcrypt # encrypts strings, like password
+from sqlalchemy import CheckConstraint, DDL, event, exists
+from app.hashing import get_hasher # encrypts strings, like password
 
 
 # Users Model
@@ -13,15 +13,31 @@ class Users(db.Model):
     last_name = db.Column(db.String(80), nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=False) # we store password in a hash, see methods below
+    # IANA timezone name, daily tasks roll over at this user's local midnight
+    timezone = db.Column(db.String(64), default='UTC', server_default='UTC', nullable=False)
+    # Bumped on every change to this user's tasks, used as the ETag for their task list and to
+    # stamp the changed tasks (Tasks.change_seq)
+    tasks_version = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    # Deleted accounts are hidden right away and their rows removed later by the purger (app/purge.py)
+    deleted_at = db.Column(db.DateTime, nullable=True, index=True)
 
-    # Hash the given password and stores in db
+    # Hash the given password and stores in db (on the hashing pool, see app/hashing.py)
     def set_password(self,password):
-        salt = bcrypt.gensalt()
-        self.password_hash = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+        self.password_hash = get_hasher().hash(password)
 
     # Check the given password with stored, returns true or false
     def check_password(self, password):
-        return bcrypt.checkpw(password.encode(), self.password_hash.encode())
+        return get_hasher().check(password, self.password_hash)
+
+    # True if the stored hash was made with a different cost than the one configured now
+    def password_needs_rehash(self):
+        return get_hasher().needs_rehash(self.password_hash)
+
+    # Tombstones the account and frees its email and username for someone else
+    def soft_delete(self):
+        self.deleted_at = datetime.now(timezone.utc)
+        self.email = f"deleted-{self.id}@deleted.invalid"
+        self.username = f"deleted-{self.id}"
 
     def __repr__(self):
         return f"<User email: {self.email} - Username: {self.username}>"
@@ -31,10 +47,20 @@ class Tasks(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     task_name = db.Column(db.String(255), nullable=False)
-    created_date = db.Column(db.DateTime, default=datetime.now(timezone.utc), nullable=False)
+    created_date = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
     due_date = db.Column(db.DateTime, nullable=True)
     task_renewed = db.Column(db.Boolean, default=False)
     task_complete = db.Column(db.Boolean, default=False)
+    # Set on every change, and deleted tasks are kept as tombstones, so clients can sync just what changed
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc), server_default=db.text('CURRENT_TIMESTAMP'), nullable=False)
+    # The owner's tasks_version when this task last changed. Unlike updated_at (set at flush) it goes up
+    # in commit order, the version bump locks the users row until the commit. Delta sync pages on it.
+    change_seq = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=True)
+    # Avatar energy this task's completion actually added, taken back again if it is un-completed
+    energy_awarded = db.Column(db.Float, default=0, server_default='0', nullable=False)
+    # Daily tasks are rolled over into a new task each day, this points back at the previous day's task
+    renewed_from_id = db.Column(db.Integer, db.ForeignKey('tasks.id'), nullable=True)
 
     # Task Type Enum (it needs to be one of 3 types)
     task_type = db.Column(db.Enum('short-term', 'long-term', 'daily', name='task_type_enum'), nullable=False)
@@ -42,15 +68,78 @@ class Tasks(db.Model):
     # Relationship to Users model
     user = relationship('Users', backref=db.backref('tasks', lazy=True))
 
+    # Composite indexes that match how the routes filter and sort tasks
+    __table_args__ = (
+        # /tasks?user_id=..&task_complete=..&task_type=.. ordered by due_date
+        db.Index('ix_tasks_user_complete_type_due', 'user_id', 'task_complete', 'task_type', 'due_date'),
+        # /streak, a user's completed tasks ordered by created_date
+        db.Index('ix_tasks_user_complete_created', 'user_id', 'task_complete', 'created_date'),
+        # /tasks/changes, a user's tasks changed since a sync token
+        db.Index('ix_tasks_user_change_seq', 'user_id', 'change_seq'),
+        # Daily renewal, the daily tasks that haven't been rolled over yet by due date
+        db.Index('ix_tasks_type_renewed_due', 'task_type', 'task_renewed', 'due_date'),
+        # Reminders, the open tasks coming due next
+        db.Index('ix_tasks_complete_due', 'task_complete', 'due_date'),
+        # Purger, tombstones past retention and the renewed copies pointing at a purged task
+        db.Index('ix_tasks_deleted', 'deleted_at'),
+        db.Index('ix_tasks_renewed_from', 'renewed_from_id'),
+    )
+
     def __repr__(self):
         return f"<Task {self.task_name} - Due: {self.due_date} - Complete: {self.task_complete}>"    # 
 
+# Tasks whose owner was deleted are hidden until the purger gets to them, for queries not already scoped to a live user
+def owner_not_deleted():
+    return ~exists().where(Users.id == Tasks.user_id, Users.deleted_at.isnot(None))
+
+# Full text search on task names, kept in sync by the database itself on insert, update and delete.
+# Postgres gets a generated tsvector column with a GIN index, SQLite (testing) gets an FTS5 table
+# fed by triggers. Neither is a mapped column, app/search.py queries them directly.
+TASK_SEARCH_DDL = {
+    'postgresql': [
+        "ALTER TABLE tasks ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('english', coalesce(task_name, ''))) STORED",
+        "CREATE INDEX IF NOT EXISTS ix_tasks_search_vector ON tasks USING gin (search_vector)",
+    ],
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5("
+        "task_name, content='tasks', content_rowid='id', tokenize='porter unicode61')",
+        "CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN "
+        "INSERT INTO tasks_fts(rowid, task_name) VALUES (new.id, new.task_name); END",
+        "CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN "
+        "INSERT INTO tasks_fts(tasks_fts, rowid, task_name) VALUES ('delete', old.id, old.task_name); END",
+        "CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF task_name ON tasks BEGIN "
+        "INSERT INTO tasks_fts(tasks_fts, rowid, task_name) VALUES ('delete', old.id, old.task_name); "
+        "INSERT INTO tasks_fts(rowid, task_name) VALUES (new.id, new.task_name); END",
+    ],
+}
+for dialect, statements in TASK_SEARCH_DDL.items():
+    for statement in statements:
+        event.listen(Tasks.__table__, 'after_create', DDL(statement).execute_if(dialect=dialect))
+# The FTS5 table isn't dropped along with tasks like the triggers are
+event.listen(Tasks.__table__, 'after_drop', DDL("DROP TABLE IF EXISTS tasks_fts").execute_if(dialect='sqlite'))
+
+# Avatar energy runs between 0 and ENERGY_MAX
+ENERGY_MAX = 100
+# Energy gained (or lost, if negative) per hour. Avatars keep their energy unless decay is switched on
+# (AVATAR_ENERGY_RATE, applied to avatars created from then on)
+ENERGY_RATE_PER_HOUR = 0.0
+
+# Energy `rate` per hour after `stored` was written at `updated_at`, as of `now` (naive UTC)
+def energy_at(stored, updated_at, rate, now):
+    hours = max((now - updated_at).total_seconds(), 0) / 3600
+    return min(max(stored + rate * hours, 0), ENERGY_MAX)
+
 # Avatar Model
 class Avatar(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, unique=True)
     avatar_name = db.Column(db.String(20), nullable=False)
-    avatar_energy = db.Column(db.Integer, default=100, nullable=False)
+    # Energy is never updated just because time passed: it is avatar_energy as of energy_updated_at,
+    # plus energy_rate per hour since then, worked out on read (see energy_at). Only events write it.
+    avatar_energy = db.Column(db.Float, default=ENERGY_MAX, nullable=False)
+    energy_updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc).replace(tzinfo=None), server_default=db.text('CURRENT_TIMESTAMP'), nullable=False)
+    energy_rate = db.Column(db.Float, default=ENERGY_RATE_PER_HOUR, server_default='0', nullable=False)
     # Store references to the customization items table
     skin_id = db.Column(db.Integer, db.ForeignKey('customization_items.id'), nullable=True)
     shirt_id = db.Column(db.Integer, db.ForeignKey('customization_items.id'), nullable=True)
@@ -68,6 +157,10 @@ class Avatar(db.Model):
         CheckConstraint('avatar_energy >= 0 AND avatar_energy <= 100', name='check_avatar_energy_range'),
     )
 
+    # The energy at `now` (naive UTC), from the stored value and the rate
+    def energy_at(self, now):
+        return energy_at(self.avatar_energy, self.energy_updated_at, self.energy_rate, now)
+
     def __repr__(self):
         return f"<Avatar {self.avatar_name} - Owner: {self.user_id}>"
     
@@ -100,6 +193,42 @@ class Wallets(db.Model):
     def __repr__(self):
         return f"<Wallet {self.id} for {self.user_id}>"
 
+# Wallet ledger, one row per balance change, appended in the same transaction as the change (see app/wallets.py)
+class WalletLedger(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # +/- coins, and the wallet balance right after this change
+    amount = db.Column(db.Integer, nullable=False)
+    balance_after = db.Column(db.Integer, nullable=False)
+    # What the change was for, e.g. 'purchase', 'checkout', 'adjustment'
+    reason = db.Column(db.String(32), nullable=False)
+    item_id = db.Column(db.Integer, db.ForeignKey('customization_items.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+
+    # A user's history is paged newest first by id
+    __table_args__ = (
+        db.Index('ix_wallet_ledger_user_id_id', 'user_id', 'id'),
+    )
+
+    def __repr__(self):
+        return f"<WalletLedger #{self.id} for {self.user_id}: {self.amount:+d} => {self.balance_after}>"
+
+# Wallet balance as of a ledger entry, taken periodically by folding the entries since the last one
+class WalletSnapshots(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # Last ledger entry folded into this snapshot
+    ledger_id = db.Column(db.Integer, nullable=False)
+    balance = db.Column(db.Integer, nullable=False)
+    taken_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_wallet_snapshots_user_id_ledger_id', 'user_id', 'ledger_id'),
+    )
+
+    def __repr__(self):
+        return f"<WalletSnapshot {self.user_id} @ {self.ledger_id}: {self.balance}>"
+
 class Transactions(db.Model):
     id = db.Column(db.Integer, primary_key = True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -115,3 +244,26 @@ class Transactions(db.Model):
 
     def __repr__(self):
         return f"<Transaction #{self.id} for {self.user_id} | Purchased Item: {self.item_id}>"
+
+# Streaks Model, one row per user kept up to date as tasks are completed so /streak never rescans history
+class Streaks(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    current_streak = db.Column(db.Integer, default=0, nullable=False)
+    longest_streak = db.Column(db.Integer, default=0, nullable=False)
+    # Last day of the current streak, the streak is only live if this is today
+    last_completion_date = db.Column(db.Date, nullable=True)
+
+    # Relationship to Users model
+    user = relationship('Users', backref=db.backref('streak', lazy=True, uselist=False))
+
+    def __repr__(self):
+        return f"<Streak {self.current_streak} days for {self.user_id} - Longest: {self.longest_streak}>"
+
+# Reminder scheduler progress, a single row. Reminders were sent for every task due up to fired_until,
+# a restarted scheduler picks up from there and still reminds tasks that came due while it was down.
+class ReminderCheckpoints(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    fired_until = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<ReminderCheckpoint reminders sent up to {self.fired_until}>"
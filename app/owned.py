@@ -0,0 +1,69 @@
+import sys
+import threading
+from flask import current_app, has_app_context
+from app import db
+from app.cache import LRUCache
+from app.models import Transactions
+
+# Which catalog items each user owns, for the "owned" flag on /items?user_id. A user's items are kept
+# as one int used as a bitset, bit N set means they own the item at position N of the catalog, so the
+# flag is a shift and a mask instead of a Transactions query per call. Bitsets are only good for the
+# catalog snapshot they were built against, so they are keyed by the catalog version too and a new
+# snapshot moves everyone onto fresh keys, the old entries just age out.
+
+class OwnedItems:
+    def __init__(self, maxsize=10000):
+        self.cache = LRUCache(maxsize)  # (user id, catalog version) => bitset
+        self.lock = threading.Lock()
+        # Bumped by every purchase, a bitset read from the database before then may be missing it
+        self.generation = 0
+
+    def get(self, user_id, catalog):
+        """The user's owned-items bitset for this catalog snapshot, loaded if it isn't cached"""
+        key = (user_id, catalog.version)
+        bits = self.cache.get(key)
+        if bits is not None:
+            return bits
+
+        generation = self.generation
+        bits = 0
+        for row in db.session.query(Transactions.item_id).filter_by(user_id=user_id):
+            position = catalog.positions.get(row.item_id)
+            if position is not None:
+                bits |= 1 << position
+        with self.lock:
+            # A purchase landed while we were reading, let the next call load it again
+            if generation == self.generation:
+                self.cache.set(key, bits)
+        return bits
+
+    # Called once a purchase is committed
+    def add(self, user_id, item_id, catalog):
+        with self.lock:
+            self.generation += 1
+            key = (user_id, catalog.version)
+            bits = self.cache.peek(key)
+            position = catalog.positions.get(item_id)
+            if bits is not None and position is not None:
+                self.cache.set(key, bits | 1 << position)
+
+    def discard(self, user_id):
+        with self.cache.lock:
+            keys = [key for key in self.cache.entries if key[0] == user_id]
+        for key in keys:
+            self.cache.delete(key)
+
+    def stats(self):
+        """Cache hit/miss stats plus roughly how much memory the bitsets take"""
+        with self.cache.lock:
+            nbytes = sum(sys.getsizeof(bits) for _, bits in self.cache.entries.values())
+        return {**self.cache.stats(), "bytes": nbytes}
+
+# Position check on a bitset from OwnedItems.get
+def owns(bits, position):
+    return bits >> position & 1 == 1
+
+# Drops a user's cached items, e.g. once the purger removed their transactions
+def forget_owned_items(user_id):
+    if has_app_context() and "owned_items" in current_app.extensions:
+        current_app.extensions["owned_items"].discard(user_id)
@@ -0,0 +1,32 @@
+from app import db
+from app.models import Users, Wallets, Transactions
+from app.wallets import adjust_balance
+from sqlalchemy import exists, insert
+
+# Buying items. A purchase is an insert into transactions plus one conditional UPDATE of the wallet
+# and its ledger entry (see app/wallets.py), all in the caller's transaction: the UPDATE only matches
+# if the balance covers the cost, so two purchases racing for the same coins can't both get them, and
+# the unique (user_id, item_id) constraint stops the same item being bought twice. Nothing is read
+# first, item costs come from the catalog.
+
+# Takes amount off a live user's wallet if the balance covers it, runs in the caller's transaction
+def charge_wallet(user_id, amount, reason="purchase", item_id=None):
+    """Returns the new balance, or None if there is no wallet or not enough in it"""
+    return adjust_balance(user_id, -amount, reason, item_id)
+
+# Records the user as owning the items, raises IntegrityError if they already own one of them
+def record_ownership(user_id, item_ids):
+    db.session.execute(insert(Transactions.__table__), [{"user_id": user_id, "item_id": item_id} for item_id in item_ids])
+
+# Why a purchase didn't go through, only looked up once it failed (and was rolled back)
+def purchase_failure(user_id, amount):
+    """Returns (error message, status code)"""
+    if not db.session.query(exists().where(Users.id == user_id, Users.deleted_at.is_(None))).scalar():
+        return "User not found", 400
+    balance = db.session.query(Wallets.balance).filter_by(user_id=user_id).scalar()
+    if balance is None:
+        return "Wallet not found", 400
+    if balance < amount:
+        return "Insufficient funds", 400
+    # The balance covered it by the time we looked, e.g. a credit landed in between
+    return "Purchase conflicted with another update, try again", 409
@@ -0,0 +1,86 @@
+from app import db
+from app.models import Users, Tasks, Avatar, Transactions, Wallets, WalletLedger, WalletSnapshots, Streaks
+from app.reminders import cancel_reminders
+from app.owned import forget_owned_items
+from sqlalchemy import delete, update
+from datetime import datetime, timedelta, timezone
+
+# Background purge of soft deleted rows. Deleting an account or a task only tombstones it (deleted_at),
+# which keeps the request fast no matter how much data is behind it. This removes the rows for real,
+# at most PURGE_BATCH_SIZE per transaction so it never holds locks for long.
+
+# Rows deleted per transaction
+PURGE_BATCH_SIZE = 1000
+# How long deleted tasks are kept as tombstones for /tasks/changes, older sync tokens get a 410
+TOMBSTONE_RETENTION = timedelta(days=30)
+
+# Tables holding a user's rows, their tasks are handled separately
+USER_TABLES = [Avatar, Transactions, WalletLedger, WalletSnapshots, Wallets]
+
+# Deletes one batch of tasks matching `condition`, returns how many went
+def purge_tasks(condition, batch_size):
+    ids = [row.id for row in db.session.query(Tasks.id).filter(condition).limit(batch_size)]
+    if not ids:
+        return 0
+    # Renewed copies point back at the task they came from, unhook them first (without touching
+    # updated_at, they haven't changed as far as syncing clients are concerned)
+    db.session.execute(
+        update(Tasks.__table__)
+        .where(Tasks.renewed_from_id.in_(ids))
+        .values(renewed_from_id=None, updated_at=Tasks.updated_at)
+    )
+    db.session.execute(delete(Tasks.__table__).where(Tasks.id.in_(ids)))
+    cancel_reminders(ids)
+    db.session.commit()
+    return len(ids)
+
+# Deletes one batch of a user's rows from `model`
+def purge_rows(model, user_id, batch_size):
+    ids = [row.id for row in db.session.query(model.id).filter(model.user_id == user_id).limit(batch_size)]
+    if ids:
+        db.session.execute(delete(model.__table__).where(model.id.in_(ids)))
+        db.session.commit()
+    return len(ids)
+
+# Removes everything belonging to a deleted user, then the user
+def purge_user(user_id, batch_size=PURGE_BATCH_SIZE):
+    """Delete a soft deleted user's rows in batches, returns how many rows were deleted"""
+    purged = 0
+    while True:
+        count = purge_tasks(Tasks.user_id == user_id, batch_size)
+        purged += count
+        if count < batch_size:
+            break
+    for model in USER_TABLES:
+        while True:
+            count = purge_rows(model, user_id, batch_size)
+            purged += count
+            if count < batch_size:
+                break
+
+    # Nothing points at the user anymore
+    db.session.execute(delete(Streaks.__table__).where(Streaks.user_id == user_id))
+    db.session.execute(delete(Users.__table__).where(Users.id == user_id, Users.deleted_at.isnot(None)))
+    db.session.commit()
+    forget_owned_items(user_id)
+    return purged + 1
+
+# Purges deleted users, then task tombstones older than the retention window
+def purge_deleted(now=None, batch_size=PURGE_BATCH_SIZE, retention=TOMBSTONE_RETENTION):
+    """Run one full purge, returns (users purged, rows deleted). Safe to re-run or stop at any point."""
+    now = now or datetime.now(timezone.utc)
+    if now.tzinfo is None:
+        now = now.replace(tzinfo=timezone.utc)
+    rows = 0
+
+    user_ids = [row.id for row in db.session.query(Users.id).filter(Users.deleted_at.isnot(None)).order_by(Users.id)]
+    for user_id in user_ids:
+        rows += purge_user(user_id, batch_size)
+
+    cutoff = now.astimezone(timezone.utc).replace(tzinfo=None) - retention
+    while True:
+        count = purge_tasks(Tasks.deleted_at < cutoff, batch_size)
+        rows += count
+        if count < batch_size:
+            break
+    return len(user_ids), rows
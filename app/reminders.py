@@ -0,0 +1,335 @@
+import heapq
+import queue
+import threading
+import traceback
+from datetime import datetime, timezone
+from flask import current_app, has_app_context
+from sqlalchemy import and_, event, or_
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from app import db
+from app.models import ReminderCheckpoints, Tasks, owner_not_deleted
+
+# Due date reminders. A scheduler thread keeps the next tasks coming due in a min-heap ordered by
+# due date and sleeps until the first one, then hands a reminder to its sink. Only a window of the
+# soonest tasks is held in memory, the next window is read (through ix_tasks_complete_due) once it
+# runs dry. Task writes in this process tell the scheduler what changed once they commit. Writes
+# from other processes (more app workers, the renewal job) are picked up by re-reading the head of
+# the window every so often, one bounded query. How far reminders have been sent is saved, so a
+# restarted scheduler carries on from there.
+
+# Tasks read into the heap per window
+REMINDER_BATCH_SIZE = 1000
+# How often the head of the window is re-read, in seconds
+REMINDER_REFRESH_SECONDS = 60
+
+# Dates are stored as naive UTC
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+# The next open tasks due after (due_date, id) `after`, soonest first
+def next_due(after, limit=REMINDER_BATCH_SIZE):
+    """Returns up to `limit` open tasks due after `after` as rows of (id, user_id, task_name, due_date)"""
+    after_due, after_id = after
+    return (
+        db.session.query(Tasks.id, Tasks.user_id, Tasks.task_name, Tasks.due_date)
+        .filter(
+            Tasks.task_complete == False,
+            Tasks.deleted_at.is_(None),
+            owner_not_deleted(),
+            or_(Tasks.due_date > after_due, and_(Tasks.due_date == after_due, Tasks.id > after_id))
+        )
+        .order_by(Tasks.due_date.asc(), Tasks.id.asc())
+        .limit(limit)
+        .all()
+    )
+
+# Where the last scheduler got to, None if none ever ran
+def load_fired_until():
+    checkpoint = db.session.get(ReminderCheckpoints, 1)
+    return checkpoint.fired_until if checkpoint else None
+
+# Records that reminders were sent for everything due up to fired_until, it never moves back
+def save_fired_until(fired_until):
+    checkpoint = db.session.get(ReminderCheckpoints, 1)
+    if checkpoint is None:
+        db.session.add(ReminderCheckpoints(id=1, fired_until=fired_until))
+    elif checkpoint.fired_until < fired_until:
+        checkpoint.fired_until = fired_until
+    db.session.commit()
+
+# What a sink receives
+def reminder_to_dict(task_id, user_id, task_name, due_date):
+    return {"task_id": task_id, "user_id": user_id, "task_name": task_name, "due_date": due_date.isoformat()}
+
+##### SINKS #####
+# A sink is anything with a send(reminder) method, it is called from the scheduler thread.
+
+# Prints reminders, the default until something real consumes them
+class LogSink:
+    def send(self, reminder):
+        print(f"Reminder: task {reminder['task_id']} for user {reminder['user_id']} is due ({reminder['due_date']})")
+
+# Collects reminders on a queue.Queue, for tests or for another thread to consume
+class QueueSink:
+    def __init__(self):
+        self.queue = queue.Queue()
+
+    def send(self, reminder):
+        self.queue.put(reminder)
+
+# Sinks that can be picked by name with REMINDER_SINK
+SINKS = {"log": LogSink, "queue": QueueSink}
+
+##### SCHEDULER #####
+class ReminderScheduler(threading.Thread):
+    def __init__(self, app, sink, batch_size=REMINDER_BATCH_SIZE, clock=utcnow, refresh_interval=REMINDER_REFRESH_SECONDS):
+        super().__init__(name="reminders", daemon=True)
+        self.app = app
+        self.sink = sink
+        self.batch_size = batch_size
+        self.clock = clock
+        self.refresh_interval = refresh_interval
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.heap = []  # (due_date, task_id)
+        self.scheduled = {}  # task_id => (due_date, user_id, task_name), the heap entry that still counts
+        # Everything due at or before this (due_date, id) is in the heap, None = every open task is.
+        # Reminders start from now, unless resume() finds where the last scheduler got to.
+        self.loaded_until = (clock(), 0)
+        # Reminders are sent for everything due up to here
+        self.fired_until = self.loaded_until[0]
+        # When the head of the window was last read from the table
+        self.refreshed_at = self.fired_until
+        # Tasks written and users deleted while a window is being read, the rows read for them may be stale
+        self.changed_during_load = None
+        self.users_cancelled_during_load = None
+
+    # Carries on from the last scheduler's checkpoint, tasks that came due while none was running are
+    # reminded on the first run. Needs an app context, call it before any task writes reach update().
+    def resume(self):
+        fired_until = load_fired_until()
+        if fired_until is None:
+            return
+        with self.condition:
+            self.fired_until = min(fired_until, self.fired_until)
+            self.loaded_until = (self.fired_until, 0)
+
+    # Reads open tasks due after `after`, keeping track of the tasks and users changed meanwhile
+    def read(self, after):
+        with self.condition:
+            self.changed_during_load = set()
+            self.users_cancelled_during_load = set()
+        try:
+            return next_due(after, self.batch_size)
+        except Exception:
+            with self.condition:
+                self.changed_during_load = None
+                self.users_cancelled_during_load = None
+            raise
+
+    # Pushes rows read by read(), and records how far the heap now covers. Call with the lock held.
+    def add_rows(self, rows, sent_until=None):
+        # Changes that came in while we were reading were already applied by update(), keep those
+        for row in rows:
+            if row.id in self.changed_during_load or row.user_id in self.users_cancelled_during_load:
+                continue
+            # Reminded already
+            if sent_until is not None and row.due_date <= sent_until:
+                continue
+            # Already scheduled from an earlier read
+            if self.scheduled.get(row.id, (None,))[0] != row.due_date:
+                self.push(row.id, row.user_id, row.task_name, row.due_date)
+        self.changed_during_load = None
+        self.users_cancelled_during_load = None
+        if len(rows) < self.batch_size:
+            self.loaded_until = None
+        else:
+            self.loaded_until = (rows[-1].due_date, rows[-1].id)
+        self.condition.notify()
+
+    # Reads the next window of tasks into the heap, needs an app context
+    def load(self):
+        with self.condition:
+            after = self.loaded_until
+        if after is None:
+            return
+        rows = self.read(after)
+        with self.condition:
+            self.add_rows(rows)
+
+    # Re-reads the head of the window, which picks up tasks other processes added or moved into it,
+    # and drops the ones they closed. The window restarts from there. Needs an app context.
+    def refresh(self):
+        with self.condition:
+            after = (self.fired_until, 0)
+        rows = self.read(after)
+        with self.condition:
+            until = None if len(rows) < self.batch_size else (rows[-1].due_date, rows[-1].id)
+            read_ids = {row.id for row in rows}
+            for task_id, (due_date, _, _) in list(self.scheduled.items()):
+                if task_id in read_ids or task_id in self.changed_during_load:
+                    continue
+                if until is None or (due_date, task_id) <= until:
+                    del self.scheduled[task_id]
+            self.add_rows(rows, sent_until=self.fired_until)
+            self.refreshed_at = self.clock()
+
+    def push(self, task_id, user_id, task_name, due_date):
+        self.scheduled[task_id] = (due_date, user_id, task_name)
+        heapq.heappush(self.heap, (due_date, task_id))
+
+    # Applies committed task changes, each one is (task_id, user_id, task_name, due_date or None if it needs no reminder)
+    def update(self, changes):
+        """Reschedule or cancel reminders for tasks that were just written"""
+        with self.condition:
+            for task_id, user_id, task_name, due_date in changes:
+                # The old heap entry is skipped once it surfaces, as it no longer matches self.scheduled
+                self.scheduled.pop(task_id, None)
+                if self.changed_during_load is not None:
+                    self.changed_during_load.add(task_id)
+                # Done, deleted, undated, or moved to a time we're already past
+                if due_date is None or due_date <= self.fired_until:
+                    continue
+                # Past the loaded window, it will be read with a later window
+                if self.loaded_until is None or (due_date, task_id) <= self.loaded_until:
+                    self.push(task_id, user_id, task_name, due_date)
+            self.condition.notify()
+
+    # Drops every reminder for these users, once their accounts are deleted
+    def cancel_users(self, user_ids):
+        with self.condition:
+            for task_id, (_, user_id, _) in list(self.scheduled.items()):
+                if user_id in user_ids:
+                    # Its heap entry is skipped once it surfaces, like a rescheduled one
+                    del self.scheduled[task_id]
+            if self.users_cancelled_during_load is not None:
+                self.users_cancelled_during_load.update(user_ids)
+            self.condition.notify()
+
+    # Pops every reminder due by `now`, returns (reminders, whether the window needs reloading)
+    def take_due(self, now):
+        due = []
+        with self.condition:
+            while self.heap:
+                due_date, task_id = self.heap[0]
+                if self.scheduled.get(task_id, (None,))[0] != due_date:
+                    heapq.heappop(self.heap)
+                    continue
+                if due_date > now:
+                    break
+                heapq.heappop(self.heap)
+                _, user_id, task_name = self.scheduled.pop(task_id)
+                due.append(reminder_to_dict(task_id, user_id, task_name, due_date))
+            self.fired_until = max(self.fired_until, now)
+            return due, not self.heap and self.loaded_until is not None
+
+    # Fires everything due by `now`, loading windows as they run out. Returns the reminders sent.
+    def run_pending(self, now=None):
+        now = now or self.clock()
+        sent = []
+        refresh = (now - self.refreshed_at).total_seconds() >= self.refresh_interval
+        if refresh:
+            self.refresh()
+        while True:
+            due, needs_load = self.take_due(now)
+            for reminder in due:
+                try:
+                    self.sink.send(reminder)
+                except Exception:
+                    traceback.print_exc()
+            sent.extend(due)
+            if not needs_load:
+                break
+            self.load()
+        if sent or refresh:
+            save_fired_until(self.fired_until)
+        return sent
+
+    # How long until the first reminder or the next re-read, whichever is sooner
+    def seconds_until_next(self, now):
+        with self.condition:
+            wait = max(self.refresh_interval - (now - self.refreshed_at).total_seconds(), 0)
+            if self.heap:
+                wait = min(wait, max((self.heap[0][0] - now).total_seconds(), 0))
+            return wait
+
+    def run(self):
+        while not self.stopped:
+            with self.app.app_context():
+                try:
+                    self.run_pending()
+                except Exception:
+                    db.session.rollback()
+                    traceback.print_exc()
+                finally:
+                    db.session.remove()
+            with self.condition:
+                if self.stopped:
+                    break
+                # Woken early by update() or stop()
+                self.condition.wait(self.seconds_until_next(self.clock()))
+
+    def stop(self, timeout=None):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.join(timeout)
+
+##### WRITE PATH HOOKS #####
+# Task writes call track_reminders() with the rows they wrote, before committing. The changes ride on
+# the session and only reach the scheduler once the commit succeeds, a rollback drops them.
+
+# Turns a task (or a RETURNING row) into a scheduler change
+def reminder_change(task):
+    open_task = not task.task_complete and task.deleted_at is None
+    return (task.id, task.user_id, task.task_name, task.due_date if open_task else None)
+
+def queue_changes(changes):
+    if has_app_context() and "reminders" in current_app.extensions:
+        db.session.info.setdefault("reminder_changes", []).extend(changes)
+
+def track_reminders(tasks):
+    """Queue reminder changes for tasks written in the current transaction, ids must be assigned"""
+    queue_changes(reminder_change(task) for task in tasks)
+
+# For tasks deleted outright, e.g. by the purger
+def cancel_reminders(task_ids):
+    queue_changes((task_id, None, None, None) for task_id in task_ids)
+
+# For users deleted in the current transaction, their tasks stay behind until the purger gets to them
+def cancel_user_reminders(user_id):
+    if has_app_context() and "reminders" in current_app.extensions:
+        db.session.info.setdefault("reminder_cancelled_users", set()).add(user_id)
+
+@event.listens_for(Session, "after_commit")
+def send_reminder_changes(session):
+    changes = session.info.pop("reminder_changes", None)
+    cancelled_users = session.info.pop("reminder_cancelled_users", None)
+    if has_app_context() and "reminders" in current_app.extensions:
+        if changes:
+            current_app.extensions["reminders"].update(changes)
+        if cancelled_users:
+            current_app.extensions["reminders"].cancel_users(cancelled_users)
+
+@event.listens_for(Session, "after_rollback")
+def drop_reminder_changes(session):
+    session.info.pop("reminder_changes", None)
+    session.info.pop("reminder_cancelled_users", None)
+
+# Starts the scheduler and keeps it on the app, where the write path hooks find it
+def start_reminders(app, sink, batch_size=REMINDER_BATCH_SIZE, refresh_interval=REMINDER_REFRESH_SECONDS):
+    scheduler = ReminderScheduler(app, sink, batch_size, refresh_interval=refresh_interval)
+    # Without the checkpoint (say the database is down) it starts from now, like a first run
+    with app.app_context():
+        try:
+            scheduler.resume()
+        except SQLAlchemyError:
+            db.session.rollback()
+            traceback.print_exc()
+        finally:
+            db.session.remove()
+    app.extensions["reminders"] = scheduler
+    scheduler.start()
+    print(f"Started reminder scheduler, sending to {type(sink).__name__}")
+    return scheduler
@@ -0,0 +1,111 @@
+from app import db
+from app.models import Tasks, Users
+from sqlalchemy import insert, literal, select, update
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# Daily task renewal. A daily task is due at the end of its day, once that passes it is rolled over:
+# the task is flagged task_renewed and a fresh copy is created for the user's next local day. The old
+# row is left alone, so completion history (and streaks) survive the roll over, and renewed_from_id
+# on the copy records which task it was renewed from.
+
+# Tasks rolled over per transaction
+RENEWAL_BATCH_SIZE = 1000
+
+# Looks up a user's timezone, unknown names fall back to UTC
+def get_zone(name):
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return timezone.utc
+
+# The next local midnight after `now` in `zone`, as a naive UTC datetime like the ones we store
+def next_day_boundary(now, zone):
+    local_today = now.astimezone(zone).date()
+    boundary = datetime.combine(local_today + timedelta(days=1), time.min, tzinfo=zone)
+    return boundary.astimezone(timezone.utc).replace(tzinfo=None)
+
+# Rolls over one batch of due daily tasks, returns (tasks found, tasks renewed)
+def renew_batch(now, batch_size, boundaries):
+    from app.routes import touch_tasks
+    from app.reminders import track_reminders
+
+    # Renewed tasks drop out of this range, so each batch just takes the first ones left
+    due = (
+        db.session.query(Tasks.id, Users.timezone)
+        .join(Users, Users.id == Tasks.user_id)
+        .filter(
+            Tasks.task_type == 'daily',
+            Tasks.task_renewed == False,
+            Tasks.deleted_at.is_(None),
+            Users.deleted_at.is_(None),
+            Tasks.due_date <= now.replace(tzinfo=None)
+        )
+        .limit(batch_size)
+        .all()
+    )
+    if not due:
+        return 0, 0
+
+    # Users in the same timezone share a day boundary, so the batch is rolled over one timezone at a time
+    by_zone = {}
+    for row in due:
+        by_zone.setdefault(row.timezone, []).append(row.id)
+
+    renewed = 0
+    stamp = now.replace(tzinfo=None)
+    for zone_name, ids in by_zone.items():
+        if zone_name not in boundaries:
+            boundaries[zone_name] = next_day_boundary(now, get_zone(zone_name))
+
+        # Claim the tasks first. The WHERE re-checks task_renewed, so if two workers race for the
+        # same tasks only one of them gets them back and creates the copies.
+        claimed = db.session.execute(
+            update(Tasks.__table__)
+            .where(Tasks.id.in_(ids), Tasks.task_renewed == False)
+            .values(task_renewed=True)
+            .returning(Tasks.id, Tasks.user_id)
+        ).all()
+        if not claimed:
+            continue
+
+        # One INSERT ... SELECT for the group's new copies, due at the next local midnight
+        copies = select(
+            Tasks.user_id,
+            Tasks.task_name,
+            Tasks.task_type,
+            literal(stamp, Tasks.created_date.type),
+            literal(stamp, Tasks.updated_at.type),
+            literal(boundaries[zone_name], Tasks.due_date.type),
+            literal(False),
+            literal(False),
+            Tasks.id
+        ).where(Tasks.id.in_([row.id for row in claimed]))
+        created = db.session.execute(insert(Tasks.__table__).from_select(
+            ["user_id", "task_name", "task_type", "created_date", "updated_at", "due_date",
+             "task_renewed", "task_complete", "renewed_from_id"],
+            copies
+        ).returning(Tasks.id, Tasks.user_id, Tasks.task_name, Tasks.due_date, Tasks.task_complete, Tasks.deleted_at)).all()
+        touch_tasks([row.user_id for row in claimed], [row.id for row in claimed + created])
+        track_reminders(created)
+        renewed += len(claimed)
+
+    db.session.commit()
+    return len(due), renewed
+
+# Rolls over every due daily task for every user
+def renew_daily_tasks(now=None, batch_size=RENEWAL_BATCH_SIZE):
+    """Renew all due daily tasks, one committed batch at a time. Safe to re-run or run concurrently."""
+    now = now or datetime.now(timezone.utc)
+    if now.tzinfo is None:
+        now = now.replace(tzinfo=timezone.utc)
+
+    renewed = 0
+    boundaries = {}
+    while True:
+        found, count = renew_batch(now, batch_size, boundaries)
+        renewed += count
+        # A short batch means we're done, a crash before then just leaves the rest for the next run
+        if found < batch_size:
+            break
+    return renewed
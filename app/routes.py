@@ -1,8 +1,24 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
 from app import db
-from app.models import Tasks, Users, Avatar, CustomizationItems, Wallets, Transactions
-from app.util import sign_token, verify_token  # custom util import for auth
-from datetime import datetime, timedelta, timezone
+from app.models import Tasks, Users, Avatar, CustomizationItems, Wallets, Transactions, Streaks, owner_not_deleted
+from app.catalog import get_catalog
+from app.credits import get_credit_buffer, settle_credits
+from app.energy import reward_completions
+from app.owned import owns
+from app.auth import current_identity, current_user, get_user, login_required
+from app.hashing import HasherBusy, get_hasher
+from app.purchases import charge_wallet, purchase_failure, record_ownership
+from app.purge import TOMBSTONE_RETENTION
+from app.reminders import cancel_user_reminders, track_reminders, utcnow
+from app.search import search_query
+from app.wallets import adjust_balance, ledger_entry_to_dict, ledger_page
+from app.streaks import record_completion, record_uncompletion, apply_changes, rebuild_streak, current_streak, task_day
+from app.util import sign_token, encode_cursor, decode_cursor, get_bool_arg, get_list_arg, pick_fields, stream_json_array, parse_datetime  # custom util import for auth
+from sqlalchemy import and_, or_, case, false, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timezone
+import hashlib
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 main = Blueprint("main", __name__)
 # Test route, should just see the message and get a log
@@ -12,14 +28,68 @@ def home():
     return jsonify({"message": "Flask API is running!"})
 
 #### TASKS ROUTES #####
+# Page size for task listings, clients can ask for less but never more than the max
+TASKS_PAGE_SIZE = 50
+TASKS_MAX_PAGE_SIZE = 200
+# Rows pulled from the database per round trip when streaming a listing
+STREAM_CHUNK_SIZE = 500
+
+# Marks the given users' task lists as changed, which changes their ETag, and stamps the changed tasks
+# with their owner's new version for delta sync. Runs in the caller's transaction.
+def touch_tasks(user_ids, task_ids=()):
+    user_ids, task_ids = set(user_ids), set(task_ids)
+    if user_ids:
+        db.session.execute(
+            update(Users.__table__)
+            .where(Users.id.in_(user_ids))
+            .values(tasks_version=Users.tasks_version + 1)
+        )
+    if task_ids:
+        # Read under the users row lock the bump above holds until commit, so stamps go up in commit order
+        version = select(Users.tasks_version).where(Users.id == Tasks.user_id).scalar_subquery()
+        db.session.execute(update(Tasks.__table__).where(Tasks.id.in_(task_ids)).values(change_seq=version))
+
+# Strong ETag for one representation of a user's task list, i.e. their tasks_version plus the query params
+def tasks_etag(user_id, version):
+    params = hashlib.sha1(repr(sorted(request.args.items(multi=True))).encode()).hexdigest()[:12]
+    return f"tasks-{user_id}-{version}-{params}"
+
+# Tags a task list response, clients must revalidate but can reuse the body on a 304
+def with_etag(response, etag):
+    if etag:
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+    return response
+
+# Task fields a listing can be narrowed to with ?fields=
+TASK_FIELDS = ["id", "user_id", "task_name", "created_date", "updated_at", "due_date", "task_renewed", "task_complete", "task_type"]
+
+# Converts a task to the JSON shape every task route returns, or just some of its fields
+def task_to_dict(task, fields=None):
+    if fields:
+        return pick_fields(task, fields)
+    return {
+        "id": task.id,
+        "user_id": task.user_id,
+        "task_name": task.task_name,
+        "created_date": task.created_date.isoformat(),
+        "updated_at": task.updated_at.isoformat(),
+        "due_date": task.due_date.isoformat() if task.due_date else None,
+        "task_renewed": task.task_renewed,
+        "task_complete": task.task_complete,
+        "task_type": task.task_type
+    }
+
 @main.route("/tasks", methods=["GET"])
 # GET tasks
 def get_tasks():
-    """Returns tasks"""
+    """Returns a page of tasks, ordered by due date"""
     # Query Params - we can customize requests, add additional args here.
     user_id = request.args.get("user_id", type=int)
     task_complete = request.args.get("task_complete", type=bool)
     task_type = request.args.get("task_type", type=str)
+    limit = request.args.get("limit", TASKS_PAGE_SIZE, type=int)
+    cursor = request.args.get("cursor", type=str)
 
     # We can specify what we want like so:
     """
@@ -28,39 +98,104 @@ def get_tasks():
       - `/tasks?task_complete=true` => returns completed
       - `/tasks?task_type=short-term` => choose what type return
       - `/tasks?task_complete=true&user_id=1` => we can also add combinations
+      - `/tasks?limit=20` => page size, capped at TASKS_MAX_PAGE_SIZE
+      - `/tasks?cursor=<next_cursor>` => the next page, pass back what the last page returned
+      - `/tasks?stream=true` => every matching task as one streamed JSON array, no paging
+      - `/tasks?fields=id,task_name,due_date` => only send (and only load) these fields
     """
 
-    # Base query
-    query = Tasks.query
+    # Sparse fieldsets, unknown fields are rejected rather than silently dropped
+    fields = get_list_arg("fields")
+    if fields:
+        unknown = [field for field in fields if field not in TASK_FIELDS]
+        if unknown:
+            return jsonify({"error": f"Unknown field(s): {', '.join(unknown)}"}), 400 # bad request
+
+    # Clamp the page size, the server always has the final say
+    limit = max(1, min(limit, TASKS_MAX_PAGE_SIZE))
+
+    # Conditional GET - a user's task list only changes when their tasks_version does, so a
+    # matching If-None-Match is answered from the users row without touching the tasks table.
+    # The version is read before the tasks, so a body is never older than its ETag.
+    etag = None
+    if user_id:
+        version = (
+            db.session.query(Users.tasks_version)
+            .filter(Users.id == user_id, Users.deleted_at.is_(None))
+            .scalar()
+        )
+        if version is not None:
+            etag = tasks_etag(user_id, version)
+            if request.if_none_match.contains(etag):
+                return with_etag(Response(status=304), etag) # not modified
+
+    # Base query, deleted tasks are tombstones that only /tasks/changes sends
+    query = Tasks.query.filter(Tasks.deleted_at.is_(None))
 
     # Apply filters, if applicable. Note- if we add new args allowed we'll need to update this.
     if user_id:
         query = query.filter(Tasks.user_id == user_id)
+        # Unknown or deleted user, nothing to list
+        if version is None:
+            query = query.filter(false())
+    else:
+        query = query.filter(owner_not_deleted())
     if task_complete is not None:
         query = query.filter(Tasks.task_complete == task_complete)
     if task_type:
         query = query.filter(Tasks.task_type == task_type)
 
-    # Ending soonest are higher up
-    query = query.order_by(Tasks.due_date.asc())
-
-    # Fetch results after filters
-    tasks = query.all()
+    # Keyset pagination - pick up right after the (due_date, id) of the last row we sent,
+    # so deep pages cost the same as the first one. Tasks without a due date sort last.
+    if cursor:
+        try:
+            last_due, last_id = decode_cursor(cursor)
+            last_due = datetime.fromisoformat(last_due) if last_due else None
+            last_id = int(last_id)
+        except (ValueError, TypeError):
+            return jsonify({"error": "Invalid cursor"}), 400 # bad request
+
+        if last_due is None:
+            query = query.filter(Tasks.due_date.is_(None), Tasks.id > last_id)
+        else:
+            query = query.filter(or_(
+                Tasks.due_date > last_due,
+                and_(Tasks.due_date == last_due, Tasks.id > last_id),
+                Tasks.due_date.is_(None)
+            ))
+
+    # Ending soonest are higher up, id breaks ties so the order is stable between pages
+    query = query.order_by(Tasks.due_date.asc().nulls_last(), Tasks.id.asc())
+
+    # Only select the columns asked for, as plain rows instead of ORM objects.
+    # id and due_date are always loaded since the next cursor is built from them.
+    if fields:
+        columns = [getattr(Tasks, field) for field in TASK_FIELDS if field in fields or field in ("id", "due_date")]
+        query = query.with_entities(*columns)
+
+    def serialize(task):
+        return task_to_dict(task, fields)
+
+    # Streaming mode - rows come from the database a chunk at a time and go straight out,
+    # so memory stays flat no matter how many tasks match
+    if get_bool_arg("stream"):
+        rows = query.yield_per(STREAM_CHUNK_SIZE)
+        response = Response(stream_with_context(stream_json_array(rows, serialize, STREAM_CHUNK_SIZE)), mimetype="application/json")
+        return with_etag(response, etag)
+
+    # Fetch one extra row to know if there is another page
+    tasks = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        last = tasks[-1]
+        next_cursor = encode_cursor(last.due_date.isoformat() if last.due_date else None, last.id)
 
     # Convert result to JSON
-    return jsonify([
-        {
-            "id": task.id,
-            "user_id": task.user_id,
-            "task_name": task.task_name,
-            "created_date": task.created_date.isoformat(),
-            "due_date": task.due_date.isoformat() if task.due_date else None,
-            "task_renewed": task.task_renewed,
-            "task_complete": task.task_complete,
-            "task_type": task.task_type
-        }
-        for task in tasks
-    ])
+    return with_etag(jsonify({
+        "tasks": [serialize(task) for task in tasks],
+        "next_cursor": next_cursor # None when this is the last page
+    }), etag)
 
 #  Create a new task
 @main.route("/tasks", methods=["POST"])
@@ -87,12 +222,15 @@ def create_task():
     user_id = data["user_id"]
     task_name = data["task_name"]
     task_type = data["task_type"]
-    due_date = data.get("due_date")
     task_renewed = data.get("task_renewed", False)  # default = false
     task_complete = data.get("task_complete", False)  # default = False
+    try:
+        due_date = parse_datetime(data.get("due_date"))
+    except ValueError:
+        return jsonify({"error": "Invalid due_date, expected an ISO date"}), 400 # bad request
 
     # Check if user exists
-    user = Users.query.get(user_id)
+    user = get_user(user_id)
     if not user:
         return jsonify({"error": "User not found"}), 404 # not found!
 
@@ -108,23 +246,244 @@ def create_task():
 
     # Add to adatabase
     db.session.add(new_task)
+    db.session.flush()
+    # Created already done, counts towards the streak in the same transaction
+    if new_task.task_complete:
+        record_completion(user_id, task_day(new_task))
+        reward_completions([(user_id, new_task.id, True)])
+    touch_tasks([user_id], [new_task.id])
+    track_reminders([new_task])
     db.session.commit()
 
     # Success message
     return jsonify({
         "message": "Task created successfully",
-        "task": {
-            "id": new_task.id,
-            "user_id": new_task.user_id,
-            "task_name": new_task.task_name,
-            "created_date": new_task.created_date.isoformat(),
-            "due_date": new_task.due_date.isoformat() if new_task.due_date else None,
-            "task_renewed": new_task.task_renewed,
-            "task_complete": new_task.task_complete,
-            "task_type": new_task.task_type
-        }
+        "task": task_to_dict(new_task)
     }), 201
 
+# Most tasks accepted by a single batch request
+TASKS_MAX_BATCH_SIZE = 500
+TASK_TYPES = Tasks.__table__.c.task_type.type.enums
+TASK_NAME_MAX_LENGTH = Tasks.__table__.c.task_name.type.length
+
+# Why a value can't be stored in a task field, None if it can. Batch writes are one statement,
+# so a bad value has to be caught up front or it fails every task in the batch.
+def invalid_task_value(field, value):
+    if field == "task_name" and (not isinstance(value, str) or not value or len(value) > TASK_NAME_MAX_LENGTH):
+        return f"task_name must be a non-empty string of at most {TASK_NAME_MAX_LENGTH} characters"
+    if field in ("task_renewed", "task_complete") and not isinstance(value, bool):
+        return f"{field} must be true or false"
+    if field == "task_type" and value not in TASK_TYPES:
+        return f"Invalid task_type: {value}"
+    return None
+
+# Validates one task from a batch, returns (row to insert, None) or (None, error message)
+def validate_batch_task(item, user_id, now):
+    if not isinstance(item, dict):
+        return None, "Task must be an object"
+    for field in ["task_name", "task_type", "due_date"]:
+        if field not in item:
+            return None, f"Missing required field: {field}"
+    if item.get("user_id", user_id) != user_id:
+        return None, "Task user_id does not match the batch user_id"
+    for field in ["task_name", "task_type", "task_renewed", "task_complete"]:
+        error = field in item and invalid_task_value(field, item[field])
+        if error:
+            return None, error
+    try:
+        due_date = parse_datetime(item["due_date"])
+    except ValueError:
+        return None, "Invalid due_date, expected an ISO date"
+
+    return {
+        "user_id": user_id,
+        "task_name": item["task_name"],
+        "task_type": item["task_type"],
+        "due_date": due_date,
+        "created_date": now,
+        "task_renewed": item.get("task_renewed", False),
+        "task_complete": item.get("task_complete", False)
+    }, None
+
+# Create many tasks at once
+@main.route("/tasks/batch", methods=["POST"])
+def create_tasks_batch():
+    """Creates a batch of tasks for one user in a single transaction"""
+    data = request.json
+
+    # Same fields as POST /tasks, but the user is given once for the whole batch
+    '''
+    {
+        "user_id": 3,
+        "tasks": [
+            {"task_name": "Stretch", "task_type": "daily", "due_date": "2025-03-25"},
+            {"task_name": "Essay", "task_type": "long-term", "due_date": "2025-04-01", "task_complete": false}
+        ]
+    }
+    '''
+    for field in ["user_id", "tasks"]:
+        if field not in data:
+            return jsonify({"error": f"Missing required field: {field}"}), 400 # bad request
+
+    user_id = data["user_id"]
+    items = data["tasks"]
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "tasks must be a non-empty list"}), 400 # bad request
+    if len(items) > TASKS_MAX_BATCH_SIZE:
+        return jsonify({"error": f"Too many tasks, the limit is {TASKS_MAX_BATCH_SIZE} per batch"}), 413 # too large
+
+    # Check the user once for the whole batch
+    user = get_user(user_id)
+    if not user:
+        return jsonify({"error": "User not found"}), 404 # not found!
+
+    # Validate everything up front, bad items are reported and skipped
+    now = datetime.now(timezone.utc)
+    results = []
+    rows = []
+    row_indexes = []
+    for index, item in enumerate(items):
+        row, error = validate_batch_task(item, user_id, now)
+        if error:
+            results.append({"index": index, "status": 400, "error": error})
+        else:
+            rows.append(row)
+            row_indexes.append(index)
+            results.append(None)
+
+    # One multi-row INSERT ... RETURNING for all the valid tasks, one commit.
+    # Postgres doesn't promise RETURNING rows (or ids) in VALUES order, so SQLAlchemy is asked to line
+    # them up with the input (sort_by_parameter_order, still one statement there). SQLite inserts the
+    # VALUES rows one after another, so sorting by id does the same, where asking would make it fall
+    # back to one INSERT per row.
+    if rows:
+        in_id_order = db.session.get_bind().dialect.name == "sqlite"
+        new_tasks = db.session.scalars(insert(Tasks).returning(Tasks, sort_by_parameter_order=not in_id_order), rows).all()
+        if in_id_order:
+            new_tasks.sort(key=lambda task: task.id)
+        # Serialize before the commit expires the objects, or each one would be reloaded
+        for index, task in zip(row_indexes, new_tasks):
+            results[index] = {"index": index, "status": 201, "task": task_to_dict(task)}
+        apply_changes((user_id, task_day(task), True) for task in new_tasks if task.task_complete)
+        reward_completions((user_id, task.id, True) for task in new_tasks if task.task_complete)
+        touch_tasks([user_id], [task.id for task in new_tasks])
+        track_reminders(new_tasks)
+        db.session.commit()
+
+    # 201 = all created, 207 = some created, 400 = nothing was valid
+    if len(rows) == len(items):
+        status = 201
+    elif rows:
+        status = 207
+    else:
+        status = 400
+
+    return jsonify({
+        "message": f"Created {len(rows)} of {len(items)} tasks",
+        "results": results
+    }), status
+
+# Fields that a bulk update is allowed to set
+TASK_UPDATE_FIELDS = ["task_name", "task_type", "due_date", "task_renewed", "task_complete"]
+
+# Update many tasks at once
+@main.route("/tasks/batch", methods=["PUT", "PATCH"])
+def update_tasks_batch():
+    """Applies the same update to a set of tasks with one UPDATE statement"""
+    data = request.json
+
+    # Pick tasks by id, by filter, or both. A filter has to be scoped to a user.
+    '''
+    {
+        "ids": [4, 5, 6],
+        "filter": {"user_id": 3, "task_type": "daily", "due_before": "2025-03-26"},
+        "values": {"task_complete": true},
+        "return": "count" (default) or "rows"
+    }
+    '''
+    ids = data.get("ids")
+    filters = data.get("filter") or {}
+    values = data.get("values")
+
+    if not isinstance(filters, dict):
+        return jsonify({"error": "filter must be an object"}), 400 # bad request
+    if not ids and "user_id" not in filters:
+        return jsonify({"error": "Provide ids or a filter with user_id"}), 400 # bad request
+    if "user_id" in filters and (not isinstance(filters["user_id"], int) or isinstance(filters["user_id"], bool)):
+        return jsonify({"error": "filter user_id must be a user id"}), 400 # bad request
+    if ids is not None and (
+        not isinstance(ids, list) or len(ids) > TASKS_MAX_BATCH_SIZE
+        or not all(isinstance(task_id, int) and not isinstance(task_id, bool) for task_id in ids)
+    ):
+        return jsonify({"error": f"ids must be a list of at most {TASKS_MAX_BATCH_SIZE} task ids"}), 400 # bad request
+    if not isinstance(values, dict) or not values:
+        return jsonify({"error": "Missing required field: values"}), 400 # bad request
+
+    # Validate the new values, and what the filter compares against, before they reach the UPDATE
+    unknown = [field for field in values if field not in TASK_UPDATE_FIELDS]
+    if unknown:
+        return jsonify({"error": f"Cannot update field(s): {', '.join(unknown)}"}), 400 # bad request
+    checks = list(values.items()) + [(field, filters[field]) for field in ("task_type", "task_complete") if field in filters]
+    for field, value in checks:
+        error = invalid_task_value(field, value)
+        if error:
+            return jsonify({"error": error}), 400 # bad request
+    try:
+        if "due_date" in values:
+            values["due_date"] = parse_datetime(values["due_date"])
+        due_before = parse_datetime(filters.get("due_before"))
+    except ValueError:
+        return jsonify({"error": "Invalid date, expected an ISO date"}), 400 # bad request
+
+    # Build the WHERE clause
+    conditions = [Tasks.deleted_at.is_(None), owner_not_deleted()]
+    if ids:
+        conditions.append(Tasks.id.in_(ids))
+    if "user_id" in filters:
+        conditions.append(Tasks.user_id == filters["user_id"])
+    if "task_type" in filters:
+        conditions.append(Tasks.task_type == filters["task_type"])
+    if "task_complete" in filters:
+        conditions.append(Tasks.task_complete == filters["task_complete"])
+    if due_before:
+        conditions.append(Tasks.due_date < due_before)
+
+    # One set-based UPDATE ... WHERE on the table, no ORM objects are loaded.
+    # RETURNING gives each changed row's owner and day, to bump task versions and keep streaks current,
+    # and what reminders need to reschedule
+    return_rows = data.get("return") == "rows"
+    returning = Tasks.__table__.c if return_rows else (
+        Tasks.id, Tasks.user_id, Tasks.task_name, Tasks.created_date, Tasks.due_date, Tasks.task_complete, Tasks.deleted_at
+    )
+
+    def run_update(*extra):
+        return db.session.execute(update(Tasks.__table__).where(*conditions, *extra).values(**values).returning(*returning)).all()
+
+    if "task_complete" in values:
+        # Tasks whose done state flips earn (or give back) avatar energy. They are picked out by the
+        # UPDATE itself, so a concurrent batch over the same tasks can't count them too. NULL counts as
+        # not done, like everywhere else. The tasks that stay as they are go first, once flipped the
+        # others would match them as well.
+        done = bool(values["task_complete"])
+        flipped = Tasks.task_complete.is_not(True) if done else Tasks.task_complete.is_(True)
+        unchanged = run_update(~flipped)
+        flips = run_update(flipped)
+        rows = unchanged + flips
+        reward_completions((row.user_id, row.id, done) for row in flips)
+        apply_changes((row.user_id, row.created_date.date(), done) for row in rows)
+    else:
+        rows = run_update()
+    count = len(rows)
+    touch_tasks([row.user_id for row in rows], [row.id for row in rows])
+    if {"task_name", "due_date", "task_complete"} & set(values):
+        track_reminders(rows)
+    db.session.commit()
+
+    response = {"message": f"Updated {count} tasks", "updated": count}
+    if return_rows:
+        response["tasks"] = [task_to_dict(row) for row in rows]
+    return jsonify(response), 200 # status = OK
+
 # Update Task
 @main.route("/tasks", methods=["PUT", "PATCH"])
 def update_task():
@@ -141,7 +500,7 @@ def update_task():
     # Check that its a valid id
     task = Tasks.query.get(task_id)
     # If not, reject
-    if not task:
+    if not task or task.deleted_at or task.user.deleted_at:
         return jsonify({"error": "Task not found"}), 404 # not found
     
     # Extract data and update fields, if provided
@@ -150,11 +509,25 @@ def update_task():
     if "task_type" in data:
         task.task_type = data["task_type"]
     if "due_date" in data:
-        task.due_date = data["due_date"]
+        try:
+            task.due_date = parse_datetime(data["due_date"])
+        except ValueError:
+            return jsonify({"error": "Invalid due_date, expected an ISO date"}), 400 # bad request
     if "task_renewed" in data:
         task.task_renewed = data["task_renewed"]
     if "task_complete" in data:
+        was_complete = bool(task.task_complete)
         task.task_complete = data["task_complete"]
+        # Keep the streak in step, in the same transaction as the task change
+        if bool(task.task_complete) != was_complete:
+            if task.task_complete:
+                record_completion(task.user_id, task_day(task))
+            else:
+                db.session.flush()
+                record_uncompletion(task.user_id, task_day(task))
+            reward_completions([(task.user_id, task.id, bool(task.task_complete))])
+    touch_tasks([task.user_id], [task.id])
+    track_reminders([task])
 
     # Commit to database
     db.session.commit()
@@ -162,18 +535,184 @@ def update_task():
     # Return the updated details
     return jsonify({
         "message": "Task updated successfully",
-        "task": {
-            "id": task.id,
-            "user_id": task.user_id,
-            "task_name": task.task_name,
-            "created_date": task.created_date.isoformat(),
-            "due_date": task.due_date.isoformat() if task.due_date else None,
-            "task_renewed": task.task_renewed,
-            "task_complete": task.task_complete,
-            "task_type": task.task_type
-        }
+        "task": task_to_dict(task)
     }), 200 # status = OK
 
+# Delta sync
+@main.route("/tasks/changes", methods=["GET"])
+def get_task_changes():
+    """Returns a user's tasks created, changed or deleted since a sync token"""
+    user_id = request.args.get("user_id", type=int)
+    since = request.args.get("since", type=str)
+    limit = request.args.get("limit", TASKS_MAX_PAGE_SIZE, type=int)
+
+    """
+      - `/tasks/changes?user_id=1` => everything, to start syncing
+      - `/tasks/changes?user_id=1&since=<next_token>` => only what changed since that response
+    """
+    if not user_id:
+        return jsonify({"error": "Missing required param: user_id"}), 400 # bad request
+    if not get_user(user_id):
+        return jsonify({"error": "User not found"}), 404 # not found
+    limit = max(1, min(limit, TASKS_MAX_PAGE_SIZE))
+
+    # Includes tombstones, backed by ix_tasks_user_change_seq
+    query = Tasks.query.filter(Tasks.user_id == user_id)
+
+    # The token is the (change_seq, id) of the last change the client has seen, and when the server
+    # issued it. change_seq goes up in commit order, so a change committed after a sync is never behind
+    # its token. Taken before the read, anything deleted after this is still there to be seen.
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    if since:
+        try:
+            values = decode_cursor(since)
+            # Tokens from before change_seq were (updated_at, id), those clients sync again from scratch
+            if len(values) == 2:
+                return jsonify({"error": "Sync token expired, sync again without since"}), 410 # gone
+            last_seq, last_id, issued_at = values
+            last_seq, last_id = int(last_seq), int(last_id)
+            issued_at = datetime.fromisoformat(issued_at)
+        except (ValueError, TypeError):
+            return jsonify({"error": "Invalid sync token"}), 400 # bad request
+        # Tombstones deleted since a token this old may have been purged, so the client could miss deletes. Start over.
+        if issued_at.tzinfo:
+            issued_at = issued_at.astimezone(timezone.utc).replace(tzinfo=None)
+        if issued_at < now - TOMBSTONE_RETENTION:
+            return jsonify({"error": "Sync token expired, sync again without since"}), 410 # gone
+        query = query.filter(or_(
+            Tasks.change_seq > last_seq,
+            and_(Tasks.change_seq == last_seq, Tasks.id > last_id)
+        ))
+
+    changes = query.order_by(Tasks.change_seq.asc(), Tasks.id.asc()).limit(limit + 1).all()
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    # Nothing new, hand back the same position, issued now
+    if changes:
+        last_seq, last_id = changes[-1].change_seq, changes[-1].id
+    elif not since:
+        last_seq, last_id = 0, 0
+    next_token = encode_cursor(last_seq, last_id, now.isoformat())
+
+    return jsonify({
+        "changes": [{**task_to_dict(task), "deleted": task.deleted_at is not None} for task in changes],
+        "next_token": next_token,
+        "has_more": has_more # true = call again with next_token right away
+    }), 200
+
+# Task statistics
+@main.route("/tasks/stats", methods=["GET"])
+def get_task_stats():
+    """Returns a user's completion rate and overdue count, overall and per task type"""
+    user_id = request.args.get("user_id", type=int)
+
+    """
+      - `/tasks/stats?user_id=1` => all of user 1's tasks
+      - `/tasks/stats?user_id=1&start=2025-01-01&end=2025-02-01` => only tasks created in [start, end)
+    """
+    if not user_id:
+        return jsonify({"error": "Missing required param: user_id"}), 400 # bad request
+    try:
+        start = parse_datetime(request.args["start"]) if "start" in request.args else None
+        end = parse_datetime(request.args["end"]) if "end" in request.args else None
+    except ValueError:
+        return jsonify({"error": "Invalid start or end, expected an ISO date"}), 400 # bad request
+
+    version = (
+        db.session.query(Users.tasks_version)
+        .filter(Users.id == user_id, Users.deleted_at.is_(None))
+        .scalar()
+    )
+    if version is None:
+        return jsonify({"error": "User not found"}), 404 # not found
+
+    # Every task write bumps tasks_version, so a write moves the user onto a fresh key and
+    # their old entries just age out. The TTL covers tasks going overdue with no write at all.
+    cache = current_app.extensions["task_stats_cache"]
+    key = (user_id, version, start, end)
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_task_stats(user_id, start, end)
+        cache.set(key, stats)
+    return jsonify(stats), 200
+
+# Aggregates a user's tasks per task type in the database, only the counts come back
+def compute_task_stats(user_id, start=None, end=None):
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    overdue = and_(Tasks.task_complete == False, Tasks.due_date < now)
+
+    query = db.session.query(
+        Tasks.task_type,
+        func.count(Tasks.id).label("total"),
+        func.sum(case((Tasks.task_complete == True, 1), else_=0)).label("completed"),
+        func.sum(case((overdue, 1), else_=0)).label("overdue")
+    ).filter(Tasks.user_id == user_id, Tasks.deleted_at.is_(None))
+    if start:
+        query = query.filter(Tasks.created_date >= start)
+    if end:
+        query = query.filter(Tasks.created_date < end)
+    rows = query.group_by(Tasks.task_type).all()
+
+    def summarize(total, completed, overdue):
+        return {
+            "total": total,
+            "completed": completed,
+            "completion_rate": completed / total if total else 0.0,
+            "overdue": overdue
+        }
+
+    by_type = {task_type: summarize(0, 0, 0) for task_type in TASK_TYPES}
+    for row in rows:
+        by_type[row.task_type] = summarize(row.total, int(row.completed or 0), int(row.overdue or 0))
+
+    totals = [sum(entry[name] for entry in by_type.values()) for name in ("total", "completed", "overdue")]
+    return {
+        "user_id": user_id,
+        **summarize(*totals),
+        "by_type": by_type
+    }
+
+# Full text search
+@main.route("/tasks/search", methods=["GET"])
+def search_tasks():
+    """Returns a page of tasks whose name matches the search text, best match first"""
+    text = request.args.get("q", "", type=str)
+    user_id = request.args.get("user_id", type=int)
+    limit = request.args.get("limit", TASKS_PAGE_SIZE, type=int)
+    cursor = request.args.get("cursor", type=str)
+
+    """
+      - `/tasks/search?q=laundry&user_id=1` => user 1's tasks mentioning laundry
+      - `/tasks/search?q=...&cursor=<next_cursor>` => the next page
+    """
+    query = search_query(text, user_id)
+    if query is None:
+        return jsonify({"error": "Missing required param: q"}), 400 # bad request
+    limit = max(1, min(limit, TASKS_MAX_PAGE_SIZE))
+
+    # Ranks aren't unique or stable enough to seek on, so the cursor carries the offset
+    offset = 0
+    if cursor:
+        try:
+            offset, = decode_cursor(cursor)
+            offset = int(offset)
+            if offset < 0:
+                raise ValueError("Negative offset")
+        except (ValueError, TypeError):
+            return jsonify({"error": "Invalid cursor"}), 400 # bad request
+
+    tasks = query.offset(offset).limit(limit + 1).all()
+    next_cursor = None
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        next_cursor = encode_cursor(offset + limit)
+
+    return jsonify({
+        "tasks": [task_to_dict(task) for task in tasks],
+        "next_cursor": next_cursor # None when this is the last page
+    }), 200
+
 # Delete Task
 @main.route("/tasks", methods=["DELETE"])
 def delete_task():
@@ -190,51 +729,50 @@ def delete_task():
     # Check that its a valid id
     task = Tasks.query.get(task_id)
     # If not, reject
-    if not task:
+    if not task or task.deleted_at or task.user.deleted_at:
         return jsonify({"error": "Task not found"}), 404 # Not found
     
-    # Delete task, if valid
-    db.session.delete(task)
+    # Delete task, if valid. It stays behind as a tombstone so syncing clients hear about it.
+    task.deleted_at = datetime.now(timezone.utc)
+    # A deleted completed task no longer counts towards the streak
+    if task.task_complete:
+        db.session.flush()
+        record_uncompletion(task.user_id, task_day(task))
+    touch_tasks([task.user_id], [task.id])
+    track_reminders([task])
     db.session.commit()
 
     return jsonify({"message": "Task deleted successfully"}), 200  # OK
 
 @main.route("/streak", methods=["GET"])
+@login_required
 def get_streak():
     """Returns the current task completion streak in days"""
-
-    # Get auth token
-    token = verify_token()
-    if not token:
-        return jsonify({"error": "Unauthorized or invalid token"}), 401
-
-    user_id = token.get("id")
-
-    # Get all tasks by user, that are complete, ordered by created date
-    completed_tasks = (
-        Tasks.query
-        .filter_by(user_id=user_id, task_complete=True)
-        .with_entities(Tasks.created_date)
-        .order_by(Tasks.created_date.desc())
-        .all()
-    )
-
-    completed_dates = {dt.created_date.date() for dt in completed_tasks}
-
-    streak = 0
-    today = datetime.now(timezone.utc).date()
-
-    while today in completed_dates:
-        streak += 1
-        today -= timedelta(days=1)
+    user = current_user()
+    if not user:
+        return jsonify({"error": "User not found"}), 404 # not found
+    user_id = user.id
+
+    # The streak row is kept current by the task routes, so this is a single primary key read.
+    # Users from before streaks were tracked get theirs built from history the first time.
+    streak = db.session.get(Streaks, user_id)
+    if not streak:
+        streak = rebuild_streak(user_id)
+        db.session.commit()
 
     return jsonify({
-        "streak_days": streak
+        "streak_days": current_streak(streak),
+        "longest_streak": streak.longest_streak
     }), 200
 
-    
-
 #### USER ROUTES #####
+# The password hashing pool is full, ask the client to back off rather than queueing without bound
+@main.errorhandler(HasherBusy)
+def hasher_busy(error):
+    response = jsonify({"error": "Too many sign ins right now, try again shortly"})
+    response.headers["Retry-After"] = "1"
+    return response, 503 # service unavailable
+
 # Login
 @main.route("/login", methods=["POST"])
 def login():
@@ -243,11 +781,22 @@ def login():
     email = data.get("email")
     password = data.get("password")
 
-    user = Users.query.filter_by(email=email).first()
+    user = Users.query.filter_by(email=email, deleted_at=None).first()
+    # bcrypt takes a while, hand the database connection back to the pool instead of holding it meanwhile
+    if user:
+        db.session.expunge(user)
+    db.session.close()
+
     # Check password, decoded via bcrypt method on user
     if not user or not user.check_password(password):
         return jsonify({"error": "Invalid email or password"}), 401  # Unauthorized
 
+    # Hashes from before a BCRYPT_ROUNDS change are upgraded the next time the user logs in
+    if user.password_needs_rehash():
+        user.set_password(password)
+        db.session.add(user)
+        db.session.commit()
+
     # Generate JWT token with user info
     token = sign_token({
         "id": user.id,
@@ -258,6 +807,14 @@ def login():
     # Send token to frontend
     return jsonify({"token": token}), 200 # OK
 
+# Items every new avatar starts with, by the avatar column they go in
+DEFAULT_ITEM_NAMES = {"skin_id": "Default Skin", "shirt_id": "White Shirt", "shoes_id": "Black Shoes"}
+
+# Ids of the default items, from the catalog. An item that isn't seeded yet is left empty.
+def get_default_item_ids():
+    by_name = get_catalog().by_name
+    return {column: by_name[name]["id"] if name in by_name else None for column, name in DEFAULT_ITEM_NAMES.items()}
+
 # Create new user
 @main.route("/signup", methods =["POST"])
 def signup():
@@ -277,46 +834,20 @@ def signup():
     email = data.get("email")
     password = data.get("password")
 
-    # See if user exists
-    user = Users.query.filter_by(email=email).first()
-    # Create or return conflict
-    if not user:
-        # Create the User
-        user = Users(username=username, email=email, first_name=first_name, last_name=last_name)
-        user.set_password(password)
-        # Add it
-        db.session.add(user)
-        db.session.commit()
-        print(f"User '{username}' created!")
-        # Avatar
-        # Get default items
-        default_skin = CustomizationItems.query.filter_by(name='Default Skin').first()
-        default_shirt = CustomizationItems.query.filter_by(name='White Shirt').first()
-        default_shoes = CustomizationItems.query.filter_by(name='Black Shoes').first()
-        # Create a default avatar for the User
-        avatar = Avatar(user_id = user.id, avatar_name = f"{user.username}'s Avatar", skin_id = default_skin.id, shirt_id = default_shirt.id, shoes_id=default_shoes.id )
-        # Add it
-        db.session.add(avatar)
-        db.session.commit()
-        print(f"Avatar '{avatar.avatar_name}' created!")
-
-        # Create Wallet
-        wallet = Wallets.query.filter_by(user_id = user.id).first()
-        if not wallet:
-            wallet = Wallets(user_id = user.id)
-            db.session.add(wallet)
-            db.session.commit()
-            print(f"Wallet {wallet.id} created for {user.email}!")
-    else:
-        # Conflict message
-        print(f"User '{email}' already exists.")
-        return jsonify({
-            "message": f"User with email '{email}' already exists.",
-        }), 409
-        # Success message
-    return jsonify({
-        "message": "User created successfully",
-        "user": {
+    # Hash first, before the request holds a database connection
+    password_hash = get_hasher().hash(password)
+    defaults = get_default_item_ids()
+
+    # The user, their default avatar and an empty wallet go in together in one transaction,
+    # so a failure part way never leaves a user without the other two
+    user = Users(username=username, email=email, first_name=first_name, last_name=last_name, password_hash=password_hash)
+    avatar = Avatar(user=user, avatar_name=f"{username}'s Avatar", energy_rate=current_app.config["AVATAR_ENERGY_RATE"], **defaults)
+    wallet = Wallets(user=user)
+    db.session.add_all([user, avatar, wallet])
+    try:
+        db.session.flush()
+        # Built before the commit expires the user, which would cost another SELECT
+        created = {
             "id": user.id,
             "username": user.username,
             "email": user.email,
@@ -324,20 +855,35 @@ def signup():
             "last_name": user.last_name,
             "password_hash": user.password_hash
         }
+        db.session.commit()
+    except IntegrityError:
+        # The unique constraints catch duplicates, no need to look before inserting
+        db.session.rollback()
+        if Users.query.filter_by(email=email).first():
+            print(f"User '{email}' already exists.")
+            return jsonify({
+                "message": f"User with email '{email}' already exists.",
+            }), 409
+        if Users.query.filter_by(username=username).first():
+            return jsonify({
+                "message": f"User with username '{username}' already exists.",
+            }), 409
+        raise
+    print(f"User '{username}' created with avatar and wallet!")
+
+    # Success message
+    return jsonify({
+        "message": "User created successfully",
+        "user": created
     }), 201
 
 # Update a User
 @main.route("/user", methods=["PUT", "PATCH"])
+@login_required
 def update_user():
     """Updates an existing user"""
-    # First check that its authorized user
-    token = verify_token()
-    if not token:
-        return jsonify({"error": "Unauthorized or invalid token"}), 401
-    
     # Check if user still exists
-    user_id = token.get("id")
-    user = Users.query.get(user_id)
+    user = current_user()
     if not user:
         return jsonify({"error": "User not found"}), 400
     
@@ -354,6 +900,13 @@ def update_user():
         user.last_name = data["last_name"]
     if "password" in data:
         user.set_password(data["password"])
+    if "timezone" in data:
+        # Must be an IANA name like "America/Denver", daily tasks roll over at its midnight
+        try:
+            ZoneInfo(data["timezone"])
+        except (ZoneInfoNotFoundError, ValueError, TypeError):
+            return jsonify({"error": f"Unknown timezone: {data['timezone']}"}), 400
+        user.timezone = data["timezone"]
 
     # Commit to database
     db.session.commit()
@@ -376,6 +929,7 @@ def update_user():
             "email": user.email,
             "first_name": user.first_name,
             "last_name": user.last_name,
+            "timezone": user.timezone,
             "password_hash": user.password_hash
         },
         "token": token,
@@ -383,75 +937,126 @@ def update_user():
 
 # Delete a User
 @main.route("/user", methods=["DELETE"])
+@login_required
 def delete_user():
     """Deletes an existing user"""
-    # First check that its authorized user
-    token = verify_token()
-    if not token:
-        return jsonify({"error": "Unauthorized or invalid token"}), 401
-    
     # Check if user still exists
-    user_id = token.get("id")
-    user = Users.query.get(user_id)
+    user = current_user()
     if not user:
         return jsonify({"error": "User not found"}), 400
     
-    # Before we delete the User, we'll need to remove their content due to foreign key restraints
+    # Only the user row is touched here, so this takes the same time for any account. Their tasks,
+    # avatar, items, wallet and streak are hidden from now on and deleted by the purger (app/purge.py).
+    user.soft_delete()
+    # Changes their task list ETag and stats cache key
+    touch_tasks([user.id])
+    # Reminders already scheduled for their tasks, new windows skip deleted owners
+    cancel_user_reminders(user.id)
+    db.session.commit()
 
-    # Delete user's tasks
-    Tasks.query.filter_by(user_id=user_id).delete()
+    return jsonify({"message": "User deleted successfully"}), 200
 
-    # Delete user's avatar
-    Avatar.query.filter_by(user_id=user_id).delete()
+#### AVATAR ROUTES #####
+@main.route("/avatar", methods=["GET"])
+@login_required
+def get_avatar():
+    """Returns the caller's avatar, with its energy as of right now"""
+    # User Id from token, no need for params
+    user_id = current_identity()["id"]
 
-    # Delete user's items once transaction table is complete
-    Transactions.query.filter_by(user_id=user_id).delete()
+    avatar = Avatar.query.join(Users).filter(Avatar.user_id == user_id, Users.deleted_at.is_(None)).first()
+    if not avatar:
+        return jsonify({"error": "Avatar not found for user."}), 404
 
-    # Delete user, if valid
-    db.session.delete(user)
-    db.session.commit()
-
-    return jsonify({"message": "User deleted successfully"}), 200
+    # Worked out from the stored value and the rate, reading it never writes anything
+    now = utcnow()
+    return jsonify({
+        "id": avatar.id,
+        "avatar_name": avatar.avatar_name,
+        "avatar_energy": round(avatar.energy_at(now)),
+        "energy_rate": avatar.energy_rate, # per hour, negative = tiring
+        "skin_id": avatar.skin_id,
+        "shirt_id": avatar.shirt_id,
+        "shoes_id": avatar.shoes_id,
+        "as_of": now.isoformat()
+    }), 200
 
 #### ITEM ROUTES #####
+# Item fields a listing can be narrowed to with ?fields=, "owned" needs a user_id
+ITEM_FIELDS = ["id", "item_type", "name", "item_cost", "model_key", "owned"]
+
 @main.route("/items", methods=["GET"])
 def get_items():
     """Returns all items, with an 'owned' flag if user_id is provided"""
 
     # Optional route params
     user_id = request.args.get("user_id", type=int)
-
-    # Get all items
-    items = db.session.query(CustomizationItems).all()
-
-    # If user_id is provided, fetch item_ids the user owns via transactions
-    owned_item_ids = set()
-    if user_id:
-        owned_item_ids = {
-            row.item_id for row in db.session.query(Transactions.item_id).filter_by(user_id=user_id).all()
-        }
-
-    return jsonify([
-        {
-            "id": item.id,
-            "item_type": item.item_type,
-            "name": item.name,
-            "item_cost": item.item_cost,
-            "model_key": item.model_key,
-            **({"owned": item.id in owned_item_ids} if user_id else {}) # this will only show up if user_id is passed
-        }
-        for item in items
-    ])
+    fields = get_list_arg("fields")
+    if fields:
+        unknown = [field for field in fields if field not in ITEM_FIELDS]
+        if unknown:
+            return jsonify({"error": f"Unknown field(s): {', '.join(unknown)}"}), 400 # bad request
+
+    catalog = get_catalog()
+
+    # The plain listing is the same for everyone, send the bytes rendered when the catalog was loaded
+    if not user_id and not fields and not get_bool_arg("stream"):
+        return catalog_response(catalog)
+
+    # If user_id is provided, get the bitset of items the user owns (cached, see app/owned.py)
+    owned = current_app.extensions["owned_items"].get(user_id, catalog) if user_id else 0
+
+    # Items come already serialized from the in-memory catalog, only owned is added per request
+    def item_to_dict(entry):
+        position, item = entry
+        if fields:
+            data = {field: item[field] for field in fields if field != "owned"}
+            if user_id and "owned" in fields:
+                data["owned"] = owns(owned, position)
+            return data
+        if user_id:
+            return {**item, "owned": owns(owned, position)} # this will only show up if user_id is passed
+        return item
+
+    items = enumerate(catalog.items)
+
+    # Streaming mode, same as /tasks?stream=true
+    if get_bool_arg("stream"):
+        return Response(stream_with_context(stream_json_array(items, item_to_dict, STREAM_CHUNK_SIZE)), mimetype="application/json")
+
+    return jsonify([item_to_dict(entry) for entry in items])
+
+# The pre-rendered /items body, gzipped if the client takes it. Each encoding has its own strong ETag.
+def catalog_response(catalog):
+    gzipped = request.accept_encodings["gzip"] > 0
+    etag = f"{catalog.etag}-gzip" if gzipped else catalog.etag
+    if request.if_none_match.contains(catalog.etag) or request.if_none_match.contains(f"{catalog.etag}-gzip"):
+        response = Response(status=304) # not modified
+    else:
+        response = Response(catalog.gzipped if gzipped else catalog.body, mimetype="application/json")
+        if gzipped:
+            response.headers["Content-Encoding"] = "gzip"
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = f"public, max-age={current_app.extensions['catalog'].max_age}"
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+# Hit rates and sizes of the per-process caches
+@main.route("/cache/stats", methods=["GET"])
+@login_required
+def get_cache_stats():
+    """Returns hit/miss counts and sizes of this process' caches"""
+    return jsonify({
+        "owned_items": current_app.extensions["owned_items"].stats(),
+        "task_stats": current_app.extensions["task_stats_cache"].stats(),
+        "tokens": current_app.extensions["token_cache"].stats()
+    }), 200
 
 # Log a Transaction
 @main.route("/items", methods=["POST"])
+@login_required
 def post_transaction():
     """Logs a transaction to the transactions table"""
-    # First check that its an authorized user
-    token = verify_token()
-    if not token:
-        return jsonify({"error": "Unauthorized or invalid token"}), 401
-    
     data = request.json
     required_fields = ["user_id", "item_id"]
 
@@ -464,69 +1069,154 @@ def post_transaction():
     user_id = data["user_id"]
     item_id = data["item_id"]
 
-    # See if they already have this item
-    transaction = Transactions.query.filter_by(user_id=user_id,item_id=item_id).first()
-
-    # Log if doesn't exist, or return
-    if not transaction:
-        item_to_purchase = CustomizationItems.query.filter_by(id=item_id).first()
-        # Verify that item, user and wallet all exist
-        if not item_to_purchase:
-            return jsonify({"error": "Item not found"}), 400
-
-        user = Users.query.filter_by(id = user_id).first()
-        if not user:
-            return jsonify({"error": "User not found"}), 400
-        
-        wallet = Wallets.query.filter_by(user_id = user_id).first()
-        if not wallet:
-            return jsonify({"error": "Wallet not found"}), 400
-        
-        # Verify that user has enough balance to cover the purchase
-        balance = wallet.balance
-        if item_to_purchase.item_cost > balance:
-            return jsonify({"error": "Insufficient funds"}), 400
-        
-        # Deduct cost of item from user wallet, update that in db
-        wallet.balance -= item_to_purchase.item_cost
-        db.session.add(wallet)
-        print(f"Wallet {wallet.id} transaction: Prev Balance: {balance} - {item_to_purchase.item_cost} = {wallet.balance}")
-
-        # Log transaction to db
-        transaction = Transactions(user_id = user_id, item_id = item_id)
-        db.session.add(transaction)
+    # Cost and name come from the catalog, the purchase itself doesn't read anything else first
+    catalog = get_catalog()
+    item_to_purchase = catalog.by_id.get(item_id)
+    if not item_to_purchase:
+        return jsonify({"error": "Item not found"}), 400
+    cost = item_to_purchase["item_cost"]
+
+    # Log the transaction and take the cost off the wallet in one go (see app/purchases.py)
+    settle_credits(user_id)
+    try:
+        record_ownership(user_id, [item_id])
+        balance = charge_wallet(user_id, cost, item_id=item_id)
+    except IntegrityError:
+        db.session.rollback()
+        # See if they already have this item
+        if Transactions.query.filter_by(user_id=user_id, item_id=item_id).first():
+            return jsonify({"message": "Item already owned."}), 200
+        # Otherwise the user or item row is gone
+        return jsonify({"error": "User not found" if not get_user(user_id) else "Item not found"}), 400
+    if balance is None:
+        db.session.rollback()
+        error, status = purchase_failure(user_id, cost)
+        return jsonify({"error": error}), status
+
+    db.session.commit()
+    current_app.extensions["owned_items"].add(user_id, item_id, catalog)
+    print(f"Transaction: {user_id} owns {item_id} for {cost}, balance now {balance}")
+
+    # Return the item info
+    return jsonify({
+        "message": "Purchase successful",
+        "item_id": item_to_purchase["id"],
+        "item_name": item_to_purchase["name"],
+        "remaining_balance": balance
+    }), 201
+
+# Most items a single checkout can hold
+CHECKOUT_MAX_ITEMS = 100
+
+# Buy several items at once, e.g. a whole outfit
+@main.route("/items/checkout", methods=["POST"])
+@login_required
+def checkout():
+    """Buys a cart of items for one user, one debit for the total and one commit"""
+    data = request.json
+
+    # Items already owned or not in the catalog are skipped, the rest are bought together or not at all.
+    # The buyer is whoever the token belongs to, user_id is optional and has to match it.
+    '''
+    {
+        "user_id": 3,
+        "item_ids": [4, 9, 12]
+    }
+    '''
+    if "item_ids" not in data:
+        return jsonify({"error": "Missing required field: item_ids"}), 400 # missing info
+
+    user_id = current_identity()["id"]
+    if data.get("user_id", user_id) != user_id:
+        return jsonify({"error": "You can only check out for yourself"}), 403 # forbidden
+    item_ids = data["item_ids"]
+    if not isinstance(item_ids, list) or not item_ids or not all(isinstance(item_id, int) and not isinstance(item_id, bool) for item_id in item_ids):
+        return jsonify({"error": "item_ids must be a non-empty list of ids"}), 400 # bad request
+    if len(item_ids) > CHECKOUT_MAX_ITEMS:
+        return jsonify({"error": f"Too many items, the limit is {CHECKOUT_MAX_ITEMS} per checkout"}), 413 # too large
+    item_ids = list(dict.fromkeys(item_ids)) # drop repeats, keep the order
+
+    catalog = get_catalog()
+    known = [item_id for item_id in item_ids if item_id in catalog.by_id]
+
+    # Another purchase may land between reading what they own and inserting, then read it again
+    settle_credits(user_id)
+    for attempt in range(2):
+        owned = {
+            row.item_id for row in
+            db.session.query(Transactions.item_id).filter(Transactions.user_id == user_id, Transactions.item_id.in_(known))
+        }
+        to_buy = [item_id for item_id in known if item_id not in owned]
+        total = sum(catalog.by_id[item_id]["item_cost"] for item_id in to_buy)
+        if not to_buy:
+            balance = db.session.query(Wallets.balance).join(Users).filter(Wallets.user_id == user_id, Users.deleted_at.is_(None)).scalar()
+            if balance is None:
+                error, status = purchase_failure(user_id, total)
+                return jsonify({"error": error}), status
+            break
+        try:
+            record_ownership(user_id, to_buy)
+            balance = charge_wallet(user_id, total, reason="checkout")
+        except IntegrityError:
+            db.session.rollback()
+            # A user or item row that is gone fails just like a purchase racing ours, tell them apart
+            if not get_user(user_id):
+                return jsonify({"error": "User not found"}), 400
+            existing = {row.id for row in db.session.query(CustomizationItems.id).filter(CustomizationItems.id.in_(to_buy))}
+            missing = [item_id for item_id in to_buy if item_id not in existing]
+            if missing:
+                return jsonify({"error": "Item not found", "item_ids": missing}), 400
+            if attempt == 0:
+                continue
+            return jsonify({"error": "Checkout conflicted with another purchase, try again"}), 409 # conflict
+        if balance is None:
+            db.session.rollback()
+            error, status = purchase_failure(user_id, total)
+            return jsonify({"error": error, "total_cost": total}), status
         db.session.commit()
-        print(f"Transaction '{transaction.id}: {transaction.user_id} owns {transaction.item_id}' logged!")
-
-        # Return the item info
-        return jsonify({
-            "message": "Purchase successful",
-            "item_id": item_to_purchase.id,
-            "item_name": item_to_purchase.name,
-            "remaining_balance": wallet.balance
-        }), 201
-    else:
-        return jsonify({"message": "Item already owned."}), 200
+        for item_id in to_buy:
+            current_app.extensions["owned_items"].add(user_id, item_id, catalog)
+        print(f"Checkout: {user_id} bought {len(to_buy)} item(s) for {total}, balance now {balance}")
+        break
+
+    # What happened to each item, in the order they were asked for
+    def outcome(item_id):
+        if item_id not in catalog.by_id:
+            return {"item_id": item_id, "status": "not_found"}
+        status = "owned" if item_id in owned else "purchased"
+        return {"item_id": item_id, "item_name": catalog.by_id[item_id]["name"], "status": status}
+
+    return jsonify({
+        "items": [outcome(item_id) for item_id in item_ids],
+        "total_cost": total,
+        "remaining_balance": balance
+    }), 201 if to_buy else 200
 
 #### WALLET ROUTES ##### 
 @main.route("/balance", methods=["GET"])
+@login_required
 def get_balance():
     """Returns a user's balance"""
-    # Check token, grab user_id from that
-    token = verify_token()
-    if not token:
-        return jsonify({"error": "Unauthorized or invalid token"}), 401
     # User Id from token, no need for params
-    user_id = token['id']
-
-    # Get balance
-    wallet = Wallets.query.filter_by(user_id=user_id).first()
+    user_id = current_identity()['id']
+
+    # Credits still buffered are counted in, so users always see their own rewards
+    buffer = get_credit_buffer()
+    if buffer is not None:
+        balance = buffer.balance(user_id)
+        if balance is None:
+            return jsonify({"error": "Wallet not found for user."}), 404
+        return jsonify({"balance": balance}), 200
+
+    # Get balance, deleted users' wallets are left for the purger
+    wallet = Wallets.query.join(Users).filter(Wallets.user_id == user_id, Users.deleted_at.is_(None)).first()
     if wallet:
         return jsonify({"balance": wallet.balance}), 200
     else:
         return jsonify({"error": "Wallet not found for user."}), 404
 
 @main.route("/balance", methods=["POST"])
+@login_required
 def post_balance():
     """Increases/decreases a user's balance"""
     data = request.json
@@ -544,24 +1234,67 @@ def post_balance():
         if field not in data:
             return jsonify({"error": f"Missing required field: {field}"}), 400 # bad request
 
-    # Check token, grab user_id from that
-    token = verify_token()
-    if not token:
-        return jsonify({"error": "Unauthorized or invalid token"}), 401
+    amount = data["amount"]
+    if not isinstance(amount, int) or isinstance(amount, bool):
+        return jsonify({"error": "amount must be a whole number"}), 400 # bad request
+
     # User Id from token, no need for params
-    user_id = token.get("id")
+    user_id = current_identity().get("id")
+
+    # With coalescing on, credits are buffered and written in batches (see app/credits.py)
+    buffer = get_credit_buffer()
+    if buffer is not None and amount > 0:
+        balance = buffer.balance(user_id)
+        if balance is None:
+            return jsonify({"error": "Wallet not found for user."}), 404
+        buffer.add(user_id, amount)
+        return jsonify({"balance": balance + amount}), 200
+    # Debits go straight to the database, on top of any credits still buffered
+    settle_credits(user_id)
+
+    # Modify balance in one atomic update, recorded in the wallet ledger (see app/wallets.py)
+    balance = adjust_balance(user_id, amount, "adjustment")
+    if balance is None:
+        db.session.rollback()
+        old_balance = db.session.query(Wallets.balance).join(Users).filter(Wallets.user_id == user_id, Users.deleted_at.is_(None)).scalar()
+        if old_balance is None:
+            return jsonify({"error": "Wallet not found for user."}), 404
+        return jsonify({"error": f"Cannot deduct balance below 0. Current Balance: {old_balance} | Amount: {amount}"}), 400
+    db.session.commit()
+    return jsonify({"balance": balance}), 200
 
-    # Get balance
-    wallet = Wallets.query.filter_by(user_id=user_id).first()
-    if wallet:
-        # Modify balanace
-        old_balance = wallet.balance
-        wallet.balance += data["amount"]
-        if wallet.balance < 0:
-            return jsonify({"error": f"Cannot deduct balance below 0. Current Balance: {old_balance} | Amount: {data['amount']}"}), 400
-        db.session.add(wallet)
-        db.session.commit()
-        return jsonify({"balance": wallet.balance}), 200
-    else:
-        return jsonify({"error": "Wallet not found for user."}), 404
+# Wallet history pages are at most this long
+HISTORY_MAX_PAGE_SIZE = 100
+
+@main.route("/balance/history", methods=["GET"])
+@login_required
+def get_balance_history():
+    """Returns the caller's wallet ledger, newest first, one page at a time"""
+    user_id = current_identity()["id"]
+    limit = request.args.get("limit", default=20, type=int)
+    cursor = request.args.get("cursor", type=str)
+
+    """
+      - `/balance/history?limit=20` => the 20 latest balance changes
+      - `/balance/history?cursor=<next_cursor>` => the next (older) page
+    """
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+    before_id = None
+    if cursor:
+        try:
+            before_id, = decode_cursor(cursor)
+            before_id = int(before_id)
+        except (ValueError, TypeError):
+            return jsonify({"error": "Invalid cursor"}), 400 # bad request
+
+    if not get_user(user_id):
+        return jsonify({"error": "User not found"}), 404 # not found
+
+    # Seek past the last id instead of using an offset, one extra row tells us if there's more
+    entries = ledger_page(user_id, limit + 1, before_id)
+    next_cursor = encode_cursor(entries[limit - 1].id) if len(entries) > limit else None
+    return jsonify({
+        "entries": [ledger_entry_to_dict(entry) for entry in entries[:limit]],
+        "next_cursor": next_cursor # None when this is the last page
+    }), 200
 
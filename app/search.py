@@ -0,0 +1,44 @@
+from app import db
+from app.models import Tasks, owner_not_deleted
+from sqlalchemy import column, func, literal_column, table
+import re
+
+# Full text search over task names. The index itself lives in the database (see TASK_SEARCH_DDL in
+# app/models.py), this builds the ranked query for whichever database we are running on.
+
+# The SQLite FTS5 table, rowid is the task id
+tasks_fts = table("tasks_fts", column("rowid"), column("task_name"))
+
+# Words in the search text, anything else (quotes, operators, punctuation) is dropped
+WORD = re.compile(r"\w+", re.UNICODE)
+
+# Turns free text into an FTS5 query where every word has to match, e.g. `buy "milk"` => "buy" "milk"
+def fts5_query(text):
+    return " ".join(f'"{word}"' for word in WORD.findall(text))
+
+# Builds the query for tasks matching `text`, best match first
+def search_query(text, user_id=None):
+    """Returns a Tasks query ordered by rank, or None if the text has nothing to search for"""
+    if not WORD.search(text):
+        return None
+
+    if db.session.get_bind().dialect.name == "postgresql":
+        # Matched through the GIN index on the generated search_vector column
+        vector = literal_column("tasks.search_vector")
+        terms = func.plainto_tsquery("english", text)
+        query = Tasks.query.filter(vector.op("@@")(terms))
+        rank = func.ts_rank(vector, terms).desc()
+    else:
+        # bm25() is lower for better matches
+        query = Tasks.query.join(tasks_fts, tasks_fts.c.rowid == Tasks.id).filter(
+            literal_column("tasks_fts").op("MATCH")(fts5_query(text))
+        )
+        rank = func.bm25(literal_column("tasks_fts")).asc()
+
+    # Deleted tasks stay in the index as tombstones, they just never match
+    query = query.filter(Tasks.deleted_at.is_(None), owner_not_deleted())
+    if user_id:
+        query = query.filter(Tasks.user_id == user_id)
+
+    # id breaks ties so the order is stable between pages
+    return query.order_by(rank, Tasks.id.asc())
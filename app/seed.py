@@ -2,6 +2,8 @@ from app import db, app # imports our sqlalchemy and our app instance
 from datetime import datetime, timedelta, timezone
 
 from app.models import Users, Tasks, Avatar, CustomizationItems, Wallets
+from app.streaks import rebuild_streak
+from app.wallets import adjust_balance
 
 #### Helper Functions - used to make seeding in bulk easier #####
 def get_or_create_user(username, email, first_name,last_name, password):
@@ -60,28 +62,30 @@ def seed_tasks(user):
     else:
         print(f"Tasks for {user.username} already exist.")
 
-# Seeds a streak to Users
+# Seeds a streak to Users, shaped like the history the daily renewal job leaves behind:
+# one completed "Get out of bed" per day, each renewed into the next day's copy
 def seed_streaks(user, number):
     existing_streak = Tasks.query.filter_by(user_id=user.id, task_name="Get out of bed").first()
     if not existing_streak:
-        # Get current data, empty arr
+        # Get current data
         now_utc = datetime.now(timezone.utc)
-        streak_tasks = []
-        # Just iterate through and append different tasks each a day out
-        for i in range(number):
+        previous = None
+        # Oldest first, so each day can point back at the one before it
+        for i in range(number - 1, -1, -1):
             task_day = now_utc - timedelta(days=i)
-            streak_tasks.append(
-                Tasks(
-                    user_id=user.id,
-                    task_name="Get out of bed",
-                    created_date=task_day,
-                    due_date=task_day,
-                    task_renewed=False,
-                    task_complete=True,
-                    task_type="daily"
-                )
+            task = Tasks(
+                user_id=user.id,
+                task_name="Get out of bed",
+                created_date=task_day,
+                due_date=task_day,
+                task_renewed=i > 0, # every day but today has been rolled over
+                task_complete=True,
+                task_type="daily",
+                renewed_from_id=previous.id if previous else None
             )
-        db.session.add_all(streak_tasks)
+            db.session.add(task)
+            db.session.flush()
+            previous = task
         db.session.commit()
         print(f"Seeded {number}-day streak for user {user.username}")
     else:
@@ -113,8 +117,11 @@ def seed_avatar(user_id, avatar_name, skin_id, shirt_id, shoes_id):
 def seed_wallets(user_id):
     wallet = Wallets.query.filter_by(user_id = user_id).first()
     if not wallet:
-        wallet = Wallets(user_id = user_id, balance = 9000)
+        wallet = Wallets(user_id = user_id, balance = 0)
         db.session.add(wallet)
+        db.session.flush()
+        # Starting coins go through the ledger like any other balance change
+        adjust_balance(user_id, 9000, "opening")
         db.session.commit()
         print(f"Wallet for User ID {user_id}: {wallet.id} created! ")
 # Initialize
@@ -133,6 +140,11 @@ with app.app_context():
     seed_streaks(user2, 10)
     seed_streaks(user1, 3)
 
+    # Seeded tasks skip the task routes, so build the streak rows from them
+    for user in (user1, user2, user3):
+        rebuild_streak(user.id)
+    db.session.commit()
+
     # Seed the Items
     # Seed Shirts
     seed_items('shirt', 'White Shirt', 'white_shirt', 0)
@@ -0,0 +1,112 @@
+from app import db
+from app.models import Tasks, Streaks
+from datetime import datetime, timedelta, timezone
+
+# Streak bookkeeping. A day counts towards a user's streak when one of their tasks created that day
+# is complete. These helpers keep each user's Streaks row current as tasks change, they only touch
+# the session, so the caller's commit saves the streak together with the task change.
+
+# The day a task counts towards
+def task_day(task):
+    return task.created_date.date()
+
+# Gets the user's streak row, locking it (on Postgres) so concurrent completions don't race
+def get_streak_row(user_id):
+    streak = db.session.get(Streaks, user_id, with_for_update=True)
+    if not streak:
+        # Users from before streaks were tracked, build theirs from history before changing it
+        streak = rebuild_streak(user_id)
+    return streak
+
+# A task for `day` was completed
+def record_completion(user_id, day):
+    """Count `day` towards the user's streak"""
+    streak = get_streak_row(user_id)
+    last = streak.last_completion_date
+
+    if last is None or day > last + timedelta(days=1):
+        # First completion, or a gap since the last one, start over
+        streak.current_streak = 1
+        streak.last_completion_date = day
+    elif day == last + timedelta(days=1):
+        # The next day, extend the streak
+        streak.current_streak += 1
+        streak.last_completion_date = day
+    elif day < last - timedelta(days=streak.current_streak - 1):
+        # Back-filling a day before the current streak, it may join it with an older one
+        return rebuild_streak(user_id)
+    # Otherwise the day is already part of the current streak
+
+    streak.longest_streak = max(streak.longest_streak, streak.current_streak)
+    return streak
+
+# A task for `day` was un-completed or deleted
+def record_uncompletion(user_id, day):
+    """Take `day` away from the user's streak, if nothing else was completed that day"""
+    streak = db.session.get(Streaks, user_id)
+    if not streak or not streak.last_completion_date:
+        return rebuild_streak(user_id)
+
+    last = streak.last_completion_date
+    start = last - timedelta(days=streak.current_streak - 1)
+    if not start <= day <= last:
+        # Outside the current streak, only the longest streak could change and we keep that as a record
+        return streak
+
+    # Still counts if another task for that day is complete (index-backed by ix_tasks_user_complete_created)
+    day_start = datetime.combine(day, datetime.min.time())
+    still_complete = db.session.query(
+        Tasks.query.filter(
+            Tasks.user_id == user_id,
+            Tasks.task_complete == True,
+            Tasks.deleted_at.is_(None),
+            Tasks.created_date >= day_start,
+            Tasks.created_date < day_start + timedelta(days=1)
+        ).exists()
+    ).scalar()
+    if still_complete:
+        return streak
+    return rebuild_streak(user_id)
+
+# Applies a list of (user_id, day, completed) changes, e.g. from a bulk update
+def apply_changes(changes):
+    for user_id, day, completed in sorted(set(changes)):
+        if completed:
+            record_completion(user_id, day)
+        else:
+            record_uncompletion(user_id, day)
+
+# Recomputes a user's streak from their completed tasks
+def rebuild_streak(user_id):
+    """Walk the user's whole completion history and reset their streak row from it"""
+    rows = (
+        Tasks.query
+        .filter_by(user_id=user_id, task_complete=True, deleted_at=None)
+        .with_entities(Tasks.created_date)
+        .order_by(Tasks.created_date.asc())
+        .all()
+    )
+    days = sorted({row.created_date.date() for row in rows})
+
+    current = longest = 0
+    previous = None
+    for day in days:
+        current = current + 1 if previous and day == previous + timedelta(days=1) else 1
+        longest = max(longest, current)
+        previous = day
+
+    streak = db.session.get(Streaks, user_id, with_for_update=True)
+    if not streak:
+        streak = Streaks(user_id=user_id)
+        db.session.add(streak)
+    streak.current_streak = current
+    streak.longest_streak = longest
+    streak.last_completion_date = previous
+    return streak
+
+# The streak as of today, 0 if nothing was completed today
+def current_streak(streak, today=None):
+    today = today or datetime.now(timezone.utc).date()
+    if streak and streak.last_completion_date == today:
+        return streak.current_streak
+    return 0
@@ -1,4 +1,6 @@
 import jwt
+import json
+import base64
 from datetime import datetime, timedelta, timezone
 from flask import request
 
@@ -33,3 +35,71 @@ def verify_token():
         return None  # Token expired
     except jwt.InvalidTokenError:
         return None  # Invalid token
+
+# Encodes values into an opaque, url-safe cursor string for keyset pagination
+def encode_cursor(*values):
+    """Pack the sort key of the last row into an opaque cursor."""
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+# Decodes a cursor made by encode_cursor, raises ValueError if it was tampered with
+def decode_cursor(cursor):
+    """Unpack a cursor back into its list of sort key values."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+# Reads a true/false style query param, like ?stream=true or ?stream=1
+def get_bool_arg(name, default=False):
+    """Parse a boolean query param, anything other than true/1/yes is False."""
+    value = request.args.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes")
+
+# Emits a JSON array piece by piece, so only chunk_size serialized rows are held in memory at once
+def stream_json_array(rows, serialize, chunk_size=500):
+    """Yield a JSON array of serialize(row) for rows, one chunk of rows per piece."""
+    yield "["
+    chunk = []
+    first = True
+    for row in rows:
+        chunk.append(json.dumps(serialize(row)))
+        if len(chunk) >= chunk_size:
+            yield ("" if first else ",") + ",".join(chunk)
+            chunk = []
+            first = False
+    if chunk:
+        yield ("" if first else ",") + ",".join(chunk)
+    yield "]"
+
+# Turns an ISO date string like "2025-03-25" or "2025-03-25T10:00:00" into a datetime
+def parse_datetime(value):
+    """Parse an ISO 8601 date/datetime, raises ValueError if it isn't one."""
+    if value is None or isinstance(value, datetime):
+        return value
+    if not isinstance(value, str):
+        raise ValueError(f"Invalid date: {value!r}")
+    return datetime.fromisoformat(value)
+
+# Reads a comma separated query param, like ?fields=id,task_name
+def get_list_arg(name):
+    """Parse a comma separated query param into a list, None if it wasn't given."""
+    value = request.args.get(name)
+    if not value:
+        return None
+    return [part.strip() for part in value.split(",") if part.strip()]
+
+# Picks the requested fields off a row or model, writing dates out as ISO strings
+def pick_fields(obj, fields):
+    """Serialize only `fields` of obj."""
+    data = {}
+    for field in fields:
+        value = getattr(obj, field)
+        data[field] = value.isoformat() if isinstance(value, datetime) else value
+    return data
@@ -0,0 +1,117 @@
+from datetime import datetime, timezone
+from app import db
+from app.models import Users, Wallets, WalletLedger, WalletSnapshots
+from sqlalchemy import exists, func, insert, select, update
+
+# Wallet balance changes. Every change is one atomic UPDATE of the wallet (balance = balance + amount,
+# only if it stays >= 0) plus one row appended to the wallet ledger, in the caller's transaction, so
+# concurrent changes never lose each other and the ledger always adds up to the balance. The UPDATE
+# locks the wallet row before the ledger row gets its id, so a user's entries are in id order.
+# Wallets.balance stays the live total, /balance is still a single row read. Snapshots fold the
+# ledger into a balance now and then, and flag any wallet whose ledger doesn't add up.
+
+# Users folded per transaction when taking snapshots
+SNAPSHOT_BATCH_SIZE = 500
+
+# Adds amount (negative to take coins away) to a live user's wallet and records it in the ledger
+def adjust_balance(user_id, amount, reason, item_id=None):
+    """Returns the new balance, or None if there is no wallet or it would go below 0"""
+    statement = (
+        update(Wallets.__table__)
+        .where(
+            Wallets.user_id == user_id,
+            Wallets.balance + amount >= 0,
+            exists().where(Users.id == user_id, Users.deleted_at.is_(None))
+        )
+        .values(balance=Wallets.balance + amount)
+    )
+    if db.session.get_bind().dialect.update_returning:
+        balance = db.session.execute(statement.returning(Wallets.balance)).scalar()
+    # No RETURNING, the row is locked by the update so reading it back is still exact
+    elif db.session.execute(statement).rowcount:
+        balance = db.session.execute(select(Wallets.balance).where(Wallets.user_id == user_id)).scalar()
+    else:
+        balance = None
+
+    if balance is not None:
+        db.session.execute(insert(WalletLedger.__table__).values(
+            user_id=user_id, amount=amount, balance_after=balance, reason=reason, item_id=item_id
+        ))
+    return balance
+
+# One page of a user's ledger, newest first, continuing below before_id if given
+def ledger_page(user_id, limit, before_id=None):
+    query = db.session.query(WalletLedger).filter(WalletLedger.user_id == user_id)
+    if before_id is not None:
+        query = query.filter(WalletLedger.id < before_id)
+    return query.order_by(WalletLedger.id.desc()).limit(limit).all()
+
+def ledger_entry_to_dict(entry):
+    return {
+        "id": entry.id,
+        "amount": entry.amount,
+        "balance_after": entry.balance_after,
+        "reason": entry.reason,
+        "item_id": entry.item_id,
+        "created_at": entry.created_at.isoformat()
+    }
+
+# Folds one batch of users' new ledger entries into snapshots, returns how many were taken
+def snapshot_batch(batch_size):
+    last = (
+        select(WalletSnapshots.user_id, func.max(WalletSnapshots.ledger_id).label("ledger_id"))
+        .group_by(WalletSnapshots.user_id)
+        .subquery()
+    )
+    pending = (
+        db.session.query(
+            WalletLedger.user_id,
+            last.c.ledger_id.label("since_id"),
+            func.max(WalletLedger.id).label("ledger_id"),
+            func.sum(WalletLedger.amount).label("amount")
+        )
+        .outerjoin(last, last.c.user_id == WalletLedger.user_id)
+        .filter(WalletLedger.id > func.coalesce(last.c.ledger_id, 0))
+        .group_by(WalletLedger.user_id, last.c.ledger_id)
+        .order_by(WalletLedger.user_id)
+        .limit(batch_size)
+        .all()
+    )
+    if not pending:
+        return 0
+
+    # Balances the fold starts from, and what the ledger says the balance was at its last entry
+    # (a ledger id only ever belongs to one user, so it picks out their last snapshot on its own)
+    previous = dict(
+        db.session.query(WalletSnapshots.user_id, WalletSnapshots.balance)
+        .filter(WalletSnapshots.ledger_id.in_([row.since_id for row in pending if row.since_id is not None]))
+        .all()
+    )
+    recorded = dict(
+        db.session.query(WalletLedger.id, WalletLedger.balance_after)
+        .filter(WalletLedger.id.in_([row.ledger_id for row in pending]))
+        .all()
+    )
+
+    now = datetime.now(timezone.utc)
+    snapshots = []
+    for row in pending:
+        balance = previous.get(row.user_id, 0) + row.amount
+        if balance != recorded[row.ledger_id]:
+            print(f"Wallet ledger for user {row.user_id} doesn't add up at entry {row.ledger_id}: "
+                  f"folded {balance}, recorded {recorded[row.ledger_id]}")
+        # The recorded balance is what the wallet really held, later folds start from it
+        snapshots.append({"user_id": row.user_id, "ledger_id": row.ledger_id, "balance": recorded[row.ledger_id], "taken_at": now})
+    db.session.execute(insert(WalletSnapshots.__table__), snapshots)
+    db.session.commit()
+    return len(snapshots)
+
+# Takes a snapshot for every user with ledger entries since their last one
+def snapshot_wallets(batch_size=SNAPSHOT_BATCH_SIZE):
+    """Fold new ledger entries into snapshots, returns how many were taken. Safe to re-run or stop at any point."""
+    taken = 0
+    while True:
+        count = snapshot_batch(batch_size)
+        taken += count
+        if count < batch_size:
+            return taken
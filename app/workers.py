@@ -0,0 +1,56 @@
+import click
+import threading
+import traceback
+from flask.cli import get_debug_flag, run_command
+from werkzeug.serving import is_running_from_reloader
+from app import db
+
+# A background thread that runs `job` inside an app context every `interval` seconds.
+# Jobs must be safe to run again after a failure, a crashed run is just retried next time.
+class PeriodicWorker(threading.Thread):
+    def __init__(self, app, name, interval, job):
+        super().__init__(name=name, daemon=True)
+        self.app = app
+        self.interval = interval
+        self.job = job
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            with self.app.app_context():
+                try:
+                    self.job()
+                except Exception:
+                    db.session.rollback()
+                    print(f"Worker '{self.name}' failed, retrying in {self.interval}s")
+                    traceback.print_exc()
+                finally:
+                    db.session.remove()
+            self.stop_event.wait(self.interval)
+
+    def stop(self, timeout=None):
+        """Ask the worker to finish its current run and exit."""
+        self.stop_event.set()
+        self.join(timeout)
+
+# Starts a worker and keeps track of it on the app, so it can be found and stopped later
+def start_worker(app, name, interval, job):
+    worker = PeriodicWorker(app, name, interval, job)
+    app.extensions.setdefault("workers", {})[name] = worker
+    worker.start()
+    print(f"Started background worker '{name}', every {interval}s")
+    return worker
+
+# Whether this process serves requests, and should run the background workers. Every Flask CLI command
+# loads the app (`flask db upgrade`, `flask purge-deleted`, ...) but only `flask run` serves, and with the
+# reloader on (--debug) only in its child process. Outside the CLI, e.g. under a WSGI server, it serves.
+def is_serving():
+    ctx = click.get_current_context(silent=True)
+    if ctx is None:
+        return True
+    if ctx.command is not run_command:
+        return False
+    reload = ctx.params.get("reload")
+    if reload is None:
+        reload = get_debug_flag()
+    return not reload or is_running_from_reloader()
@@ -0,0 +1,98 @@
+# Avatar energy at scale: N avatars in a SQLite database file. Compares what a classic decay tick (one
+# mass UPDATE of every avatar) costs against energy worked out on read, where time passing writes
+# nothing: counts the statements the app sends while idle and while serving GET /avatar, and times
+# a completion event, the only thing that writes energy now.
+# Run with: PYTHONPATH=. python benchmarks/bench_avatar_energy.py [N]
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+db_file = os.path.join(tempfile.mkdtemp(), "bench_avatar_energy.db")
+os.environ["APP_ENV"] = "local"
+os.environ["LOCAL_DATABASE_URL"] = f"sqlite:///{db_file}"
+
+from sqlalchemy import event, insert, text
+from app import create_app, db
+from app.energy import add_energy
+from app.models import Users, Avatar
+from app.reminders import utcnow
+from app.util import sign_token
+
+CHUNK = 50000
+READS = 2000
+EVENTS = 2000
+# How often a tick based design would decay every avatar
+TICKS_PER_HOUR = 60
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))] * 1000
+
+def main(n):
+    app = create_app()
+    start = time.perf_counter()
+    with app.app_context():
+        db.create_all()
+        now = utcnow()
+        for first in range(1, n + 1, CHUNK):
+            ids = range(first, min(first + CHUNK, n + 1))
+            db.session.execute(insert(Users.__table__), [
+                {"id": i, "username": f"u{i}", "first_name": "F", "last_name": "L", "email": f"u{i}@example.com", "password_hash": "x"}
+                for i in ids
+            ])
+            db.session.execute(insert(Avatar.__table__), [
+                {"user_id": i, "avatar_name": f"Avatar {i}", "avatar_energy": 100, "energy_rate": -2.0,
+                 "energy_updated_at": now - timedelta(minutes=i % 3000)}
+                for i in ids
+            ])
+            db.session.commit()
+        engine = db.engine
+    print(f"{n} avatars loaded in {time.perf_counter() - start:.1f}s")
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+    writes = lambda: [s for s in statements if not s.lstrip().upper().startswith("SELECT")]
+
+    # What one decay tick over every avatar would cost
+    with app.app_context():
+        start = time.perf_counter()
+        ticked = db.session.execute(text("UPDATE avatar SET avatar_energy = MAX(avatar_energy - 1, 0)")).rowcount
+        db.session.rollback()
+        tick = time.perf_counter() - start
+    print(f"decay tick (one mass UPDATE)  : {tick * 1000:8.1f} ms, {ticked} rows written"
+          f" => {ticked * TICKS_PER_HOUR:,} row writes/hour at {TICKS_PER_HOUR} ticks/hour")
+
+    # Energy on read: the app sits idle, nothing is written however much time passes
+    statements.clear()
+    time.sleep(2)
+    print(f"energy on read, idle 2s       : {len(writes())} statements written")
+
+    client = app.test_client()
+    rng = random.Random(1)
+    samples = []
+    for user_id in (rng.randint(1, n) for _ in range(READS)):
+        headers = {"Authorization": f"Bearer {sign_token({'id': user_id})}"}
+        start = time.perf_counter()
+        response = client.get("/avatar", headers=headers)
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 200
+    print(f"GET /avatar x {READS}            : p50 {percentile(samples, 0.5):6.2f} ms  p99 {percentile(samples, 0.99):6.2f} ms,"
+          f" {len(writes())} statements written")
+
+    # The only writes left, one per event
+    statements.clear()
+    with app.app_context():
+        start = time.perf_counter()
+        for user_id in (rng.randint(1, n) for _ in range(EVENTS)):
+            add_energy(user_id, 10)
+            db.session.commit()
+        elapsed = time.perf_counter() - start
+    print(f"completion events x {EVENTS}     : {elapsed / EVENTS * 1000:6.2f} ms each,"
+          f" {len([s for s in writes() if s.lstrip().upper().startswith('UPDATE')]) / EVENTS:.1f} row writes each")
+    os.remove(db_file)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
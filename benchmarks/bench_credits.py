@@ -0,0 +1,79 @@
+# Hot wallet: T threads sending small POST /balance credits to the same wallet against a SQLite
+# database file, one UPDATE and commit per credit against the coalescing buffer (CREDIT_COALESCING).
+# Run with: PYTHONPATH=. python benchmarks/bench_credits.py [threads] [seconds]
+import os
+import sys
+import tempfile
+import threading
+import time
+
+db_file = os.path.join(tempfile.mkdtemp(), "bench_credits.db")
+os.environ["APP_ENV"] = "local"
+os.environ["LOCAL_DATABASE_URL"] = f"sqlite:///{db_file}"
+
+from sqlalchemy import event
+from app import create_app, db
+from app.credits import start_credit_buffer
+from app.models import Users, Wallets, WalletLedger
+from app.util import sign_token
+
+def storm(app, headers, threads, seconds):
+    counts = {}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def earner():
+        client = app.test_client()
+        while not stop.is_set():
+            status = client.post("/balance", json={"amount": 1}, headers=headers).status_code
+            with lock:
+                counts[status] = counts.get(status, 0) + 1
+
+    workers = [threading.Thread(target=earner) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    return counts
+
+def main(threads, seconds):
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        user = Users(username="earner", first_name="Ear", last_name="Ner", email="earner@example.com", password_hash="x")
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Wallets(user_id=user.id, balance=0))
+        db.session.commit()
+        user_id = user.id
+        engine = db.engine
+    headers = {"Authorization": f"Bearer {sign_token({'id': user_id})}"}
+
+    commits = []
+    event.listen(engine, "commit", lambda conn: commits.append(1))
+    print(f"{threads} threads crediting one wallet for {seconds}s each, {os.cpu_count()} CPU(s)")
+
+    buffer = None
+    for name in ("direct", "coalesced"):
+        if name == "coalesced":
+            buffer = start_credit_buffer(app)
+        commits.clear()
+        counts = storm(app, headers, threads, seconds)
+        if buffer is not None:
+            buffer.stop()
+        credits = counts.get(200, 0)
+        print(f"{name:<10}: {credits / seconds:8.1f} credits/s  | {len(commits) / max(credits, 1):.3f} commits per credit, statuses {counts}")
+        app.extensions.pop("credit_buffer", None)
+
+    # Every credit made it in, and the ledger adds up to the balance
+    with app.app_context():
+        balance = db.session.query(Wallets.balance).filter_by(user_id=user_id).scalar()
+        ledger = sum(entry.amount for entry in WalletLedger.query.filter_by(user_id=user_id))
+    print(f"final balance {balance}, ledger total {ledger}")
+    assert balance == ledger
+    os.remove(db_file)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 8, float(sys.argv[2]) if len(sys.argv) > 2 else 5)
@@ -0,0 +1,56 @@
+# Times the daily renewal job over N due daily tasks spread over users in a few timezones.
+# Run with: PYTHONPATH=. APP_ENV=testing python benchmarks/bench_daily_renewal.py [N]   (e.g. 1000000)
+import os
+import sys
+import time
+
+os.environ.setdefault("APP_ENV", "testing")
+
+from app import create_app, db
+from app.models import Users, Tasks
+from app.renewals import renew_daily_tasks
+from sqlalchemy import insert
+from datetime import datetime, timezone
+
+USERS = 1000
+ZONES = ["UTC", "America/Denver", "Asia/Tokyo"]
+
+def main(n):
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(Users), [
+            {"username": f"user{i}", "first_name": "F", "last_name": "L", "email": f"user{i}@example.com",
+             "password_hash": "x", "timezone": ZONES[i % len(ZONES)]}
+            for i in range(USERS)
+        ])
+        user_ids = [row.id for row in db.session.query(Users.id)]
+
+        # Due yesterday, so every one of them is rolled over
+        yesterday = datetime(2025, 3, 9)
+        chunk = 50000
+        for start in range(0, n, chunk):
+            db.session.execute(insert(Tasks.__table__), [
+                {"user_id": user_ids[i % USERS], "task_name": f"Daily {i}", "task_type": "daily",
+                 "created_date": yesterday, "updated_at": yesterday, "due_date": yesterday,
+                 "task_renewed": False, "task_complete": i % 3 == 0}
+                for i in range(start, min(start + chunk, n))
+            ])
+        db.session.commit()
+
+        now = datetime(2025, 3, 10, 12, tzinfo=timezone.utc)
+        start = time.perf_counter()
+        renewed = renew_daily_tasks(now=now)
+        first = time.perf_counter() - start
+
+        # Second run finds nothing to do
+        start = time.perf_counter()
+        again = renew_daily_tasks(now=now)
+        second = time.perf_counter() - start
+
+        assert renewed == n and again == 0, (renewed, again)
+        print(f"renewed {renewed} daily tasks : {first:8.2f} s  ({renewed / first:10.0f} tasks/s)")
+        print(f"idempotent re-run          : {second * 1000:8.1f} ms  (renewed {again})")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
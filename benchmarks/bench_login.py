@@ -0,0 +1,87 @@
+# Login storm: /login throughput, and GET /tasks latency while the storm runs, with bcrypt hashes
+# all running at once (how it was before the pool) against the bounded hashing pool.
+# Run with: PYTHONPATH=. python benchmarks/bench_login.py [login threads] [seconds]
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Threads need a real database file, an in-memory SQLite database is a single shared connection
+db_file = os.path.join(tempfile.mkdtemp(), "bench_login.db")
+os.environ["APP_ENV"] = "local"
+os.environ["LOCAL_DATABASE_URL"] = f"sqlite:///{db_file}"
+os.environ.setdefault("BCRYPT_ROUNDS", "10")
+
+from app import create_app, db
+from app.hashing import PasswordHasher
+from app.models import Users, Tasks
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))] * 1000
+
+# GET /tasks latencies over `seconds`, one request after another
+def time_tasks(client, user_id, seconds):
+    samples = []
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        client.get(f"/tasks?user_id={user_id}&limit=20")
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def storm(app, user_id, threads, seconds):
+    counts = {200: 0, 503: 0}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def login_loop():
+        client = app.test_client()
+        while not stop.is_set():
+            status = client.post("/login", json={"email": "bench@example.com", "password": "securepass"}).status_code
+            with lock:
+                counts[status] = counts.get(status, 0) + 1
+
+    workers = [threading.Thread(target=login_loop) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    samples = time_tasks(app.test_client(), user_id, seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    return counts, samples
+
+def main(threads, seconds):
+    app = create_app()
+    rounds = app.config["BCRYPT_ROUNDS"]
+    with app.app_context():
+        db.create_all()
+        user = Users(username="bench", first_name="Bench", last_name="Mark", email="bench@example.com")
+        user.set_password("securepass")
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        db.session.add_all([Tasks(user_id=user_id, task_name=f"Task {i}", task_type="daily") for i in range(200)])
+        db.session.commit()
+
+    baseline = time_tasks(app.test_client(), user_id, 2)
+    print(f"bcrypt cost {rounds}, {threads} login threads, {seconds}s each, {os.cpu_count()} CPU(s)")
+    print(f"GET /tasks, idle            : p50 {percentile(baseline, 0.5):7.1f} ms  p99 {percentile(baseline, 0.99):7.1f} ms")
+
+    setups = [
+        # Every login hashes at once, like bcrypt on the request thread
+        ("unbounded", PasswordHasher(rounds=rounds, workers=threads, max_pending=threads)),
+        ("pool", PasswordHasher(rounds=rounds)),
+    ]
+    for name, hasher in setups:
+        app.extensions["password_hasher"] = hasher
+        counts, samples = storm(app, user_id, threads, seconds)
+        print(f"GET /tasks, storm {name:<10}: p50 {percentile(samples, 0.5):7.1f} ms  p99 {percentile(samples, 0.99):7.1f} ms"
+              f"  | logins {counts[200] / seconds:6.1f}/s, 503s {counts.get(503, 0)}")
+        hasher.shutdown()
+
+    os.remove(db_file)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 16, float(sys.argv[2]) if len(sys.argv) > 2 else 5)
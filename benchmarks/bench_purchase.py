@@ -0,0 +1,83 @@
+# Purchase stress: T threads buying from M users' wallets at once against a SQLite database file.
+# Prints purchases per second and statements per purchase, then checks nobody was charged for more
+# than they could afford and every charge has its transaction row.
+# Run with: PYTHONPATH=. python benchmarks/bench_purchase.py [threads] [users]
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+db_file = os.path.join(tempfile.mkdtemp(), "bench_purchase.db")
+os.environ["APP_ENV"] = "local"
+os.environ["LOCAL_DATABASE_URL"] = f"sqlite:///{db_file}"
+
+from sqlalchemy import event, func
+from app import create_app, db
+from app.models import CustomizationItems, Users, Wallets, Transactions
+from app.util import sign_token
+
+ITEMS = 50
+ITEM_COST = 10
+# Each wallet affords half the catalog, so half the attempts run out of funds
+STARTING_BALANCE = ITEMS * ITEM_COST // 2
+
+def main(threads, users):
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([
+            CustomizationItems(item_type="shirt", name=f"Shirt {i}", item_cost=ITEM_COST, model_key=f"shirt_{i}")
+            for i in range(ITEMS)
+        ])
+        accounts = [Users(username=f"u{i}", first_name="F", last_name="L", email=f"u{i}@example.com", password_hash="x") for i in range(users)]
+        db.session.add_all(accounts)
+        db.session.flush()
+        db.session.add_all([Wallets(user_id=user.id, balance=STARTING_BALANCE) for user in accounts])
+        db.session.commit()
+        user_ids = [user.id for user in accounts]
+        item_ids = [item.id for item in CustomizationItems.query]
+        engine = db.engine
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+    counts = {}
+    lock = threading.Lock()
+
+    # Every thread goes through every user's catalog in its own order, so threads race on each wallet
+    def shopper(seed):
+        client = app.test_client()
+        rng = random.Random(seed)
+        for user_id in user_ids:
+            headers = {"Authorization": f"Bearer {sign_token({'id': user_id})}"}
+            for item_id in rng.sample(item_ids, len(item_ids)):
+                status = client.post("/items", json={"user_id": user_id, "item_id": item_id}, headers=headers).status_code
+                with lock:
+                    counts[status] = counts.get(status, 0) + 1
+
+    workers = [threading.Thread(target=shopper, args=(seed,)) for seed in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    attempts = sum(counts.values())
+    bought = counts.get(201, 0)
+    print(f"{threads} threads, {users} wallets, {attempts} attempts in {elapsed:.2f}s, {os.cpu_count()} CPU(s)")
+    print(f"purchases: {bought / elapsed:7.1f}/s   attempts: {attempts / elapsed:7.1f}/s   statuses {dict(sorted(counts.items()))}")
+    print(f"statements per attempt: {len(statements) / attempts:.1f}")
+
+    with app.app_context():
+        not_empty = Wallets.query.filter(Wallets.balance != 0).count()
+        rows = db.session.query(func.count(Transactions.id)).scalar()
+    affordable = users * STARTING_BALANCE // ITEM_COST
+    assert bought == rows == affordable, (bought, rows, affordable)
+    assert not_empty == 0
+    print(f"no double spend: {rows} items bought, every wallet at exactly 0")
+    os.remove(db_file)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 8, int(sys.argv[2]) if len(sys.argv) > 2 else 10)
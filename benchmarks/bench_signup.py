@@ -0,0 +1,64 @@
+# Signup latency: p50/p99 of N POST /signup calls against a SQLite database file (so every commit is a real
+# write). bcrypt runs at the lowest cost so the numbers are about the database work, not the hash.
+# Run with: PYTHONPATH=. python benchmarks/bench_signup.py [N]
+import os
+import sys
+import tempfile
+import time
+
+db_file = os.path.join(tempfile.mkdtemp(), "bench_signup.db")
+os.environ["APP_ENV"] = "local"
+os.environ["LOCAL_DATABASE_URL"] = f"sqlite:///{db_file}"
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+from sqlalchemy import event
+from app import create_app, db
+from app.models import CustomizationItems, Users, Avatar, Wallets
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))] * 1000
+
+def main(n):
+    app = create_app()
+    client = app.test_client()
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([
+            CustomizationItems(item_type="skin", name="Default Skin", item_cost=0, model_key="default_skin"),
+            CustomizationItems(item_type="shirt", name="White Shirt", item_cost=0, model_key="white_shirt"),
+            CustomizationItems(item_type="shoes", name="Black Shoes", item_cost=0, model_key="black_shoes"),
+        ])
+        db.session.commit()
+        engine = db.engine
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+    commits = []
+    event.listen(engine, "commit", lambda conn: commits.append(1))
+
+    samples = []
+    for i in range(n):
+        body = {"username": f"u{i}", "first_name": "F", "last_name": "L", "email": f"u{i}@example.com", "password": "pw"}
+        start = time.perf_counter()
+        response = client.post("/signup", json=body)
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 201, response.get_json()
+    per_signup = (len(statements) / n, len(commits) / n)
+
+    # And the duplicate path
+    start = time.perf_counter()
+    response = client.post("/signup", json={"username": "dupe", "first_name": "F", "last_name": "L", "email": "u0@example.com", "password": "pw"})
+    duplicate = time.perf_counter() - start
+    assert response.status_code == 409, response.get_json()
+
+    with app.app_context():
+        assert Users.query.count() == Avatar.query.count() == Wallets.query.count() == n
+
+    print(f"{n} x POST /signup: p50 {percentile(samples, 0.5):6.2f} ms  p99 {percentile(samples, 0.99):6.2f} ms"
+          f"  | {per_signup[0]:.1f} statements, {per_signup[1]:.1f} commits per signup")
+    print(f"duplicate email : {duplicate * 1000:6.2f} ms")
+    os.remove(db_file)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
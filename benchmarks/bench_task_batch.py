@@ -0,0 +1,45 @@
+# Compares creating N tasks with N POST /tasks calls against one POST /tasks/batch call.
+# Run with: PYTHONPATH=. APP_ENV=testing python benchmarks/bench_task_batch.py [N]
+import os
+import sys
+import time
+
+os.environ.setdefault("APP_ENV", "testing")
+
+from app import create_app, db
+from app.models import Users, Tasks
+
+def make_task(i):
+    return {"task_name": f"Bench task {i}", "task_type": "daily", "due_date": "2025-03-25"}
+
+def main(n):
+    app = create_app()
+    client = app.test_client()
+    with app.app_context():
+        db.create_all()
+        user = Users(username="bench", first_name="Bench", last_name="Mark", email="bench@example.com", password_hash="x")
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    # N single requests, one user lookup and one commit each
+    start = time.perf_counter()
+    for i in range(n):
+        client.post("/tasks", json={"user_id": user_id, **make_task(i)})
+    single = time.perf_counter() - start
+
+    # One batch request, one user lookup, one INSERT and one commit
+    start = time.perf_counter()
+    response = client.post("/tasks/batch", json={"user_id": user_id, "tasks": [make_task(i) for i in range(n)]})
+    batch = time.perf_counter() - start
+    assert response.status_code == 201, response.get_json()
+
+    with app.app_context():
+        assert Tasks.query.count() == 2 * n
+
+    print(f"{n} x POST /tasks       : {single * 1000:8.1f} ms  ({n / single:8.0f} tasks/s)")
+    print(f"1 x POST /tasks/batch  : {batch * 1000:8.1f} ms  ({n / batch:8.0f} tasks/s)")
+    print(f"speedup                : {single / batch:8.1f}x")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -51,6 +51,20 @@ def get_metadata():
     return target_db.metadata
 
 
+# Task search is created by raw DDL (TASK_SEARCH_DDL in app/models.py), not declared in the
+# metadata, so autogenerate must not see it as removed
+SEARCH_OBJECTS = ('search_vector', 'ix_tasks_search_vector')
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    if reflected and compare_to is None and name is not None:
+        if type_ == 'table' and name.startswith('tasks_fts'):
+            return False
+        if name in SEARCH_OBJECTS:
+            return False
+    return True
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -65,7 +79,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=get_metadata(), literal_binds=True
+        url=url, target_metadata=get_metadata(), literal_binds=True,
+        include_object=include_object
     )
 
     with context.begin_transaction():
@@ -93,6 +108,7 @@ def run_migrations_online():
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    conf_args.setdefault("include_object", include_object)
 
     connectable = get_engine()
 
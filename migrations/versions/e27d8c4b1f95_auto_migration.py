@@ -0,0 +1,59 @@
+"""Auto migration
+
+Revision ID: e27d8c4b1f95
+Revises: c6e13f5a90b4
+Create Date: 2026-10-18 13:37:26.409115
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e27d8c4b1f95'
+down_revision = 'c6e13f5a90b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Full text search on task names, see TASK_SEARCH_DDL in app/models.py (not auto generated)
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.execute(
+            "ALTER TABLE tasks ADD COLUMN search_vector tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('english', coalesce(task_name, ''))) STORED"
+        )
+        op.create_index('ix_tasks_search_vector', 'tasks', ['search_vector'], unique=False, postgresql_using='gin')
+    elif bind.dialect.name == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE tasks_fts USING fts5("
+            "task_name, content='tasks', content_rowid='id', tokenize='porter unicode61')"
+        )
+        op.execute(
+            "CREATE TRIGGER tasks_fts_insert AFTER INSERT ON tasks BEGIN "
+            "INSERT INTO tasks_fts(rowid, task_name) VALUES (new.id, new.task_name); END"
+        )
+        op.execute(
+            "CREATE TRIGGER tasks_fts_delete AFTER DELETE ON tasks BEGIN "
+            "INSERT INTO tasks_fts(tasks_fts, rowid, task_name) VALUES ('delete', old.id, old.task_name); END"
+        )
+        op.execute(
+            "CREATE TRIGGER tasks_fts_update AFTER UPDATE OF task_name ON tasks BEGIN "
+            "INSERT INTO tasks_fts(tasks_fts, rowid, task_name) VALUES ('delete', old.id, old.task_name); "
+            "INSERT INTO tasks_fts(rowid, task_name) VALUES (new.id, new.task_name); END"
+        )
+        # Index the tasks that already exist
+        op.execute("INSERT INTO tasks_fts(tasks_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.drop_index('ix_tasks_search_vector', table_name='tasks', postgresql_using='gin')
+        op.execute("ALTER TABLE tasks DROP COLUMN search_vector")
+    elif bind.dialect.name == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS tasks_fts_update")
+        op.execute("DROP TRIGGER IF EXISTS tasks_fts_delete")
+        op.execute("DROP TRIGGER IF EXISTS tasks_fts_insert")
+        op.execute("DROP TABLE IF EXISTS tasks_fts")
@@ -0,0 +1,69 @@
+import time
+import unittest
+from unittest import mock
+import jwt
+from sqlalchemy import event
+from app import create_app, db
+from app.auth import current_user, current_identity
+from app.models import Users, Wallets
+from app.util import SECRET_KEY, sign_token
+
+class AuthTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config["TESTING"] = True
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+        self.app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            db.create_all()
+            user = Users(username="authed", first_name="Auth", last_name="Ed", email="auth@example.com", password_hash="x")
+            db.session.add(user)
+            db.session.commit()
+            db.session.add(Wallets(user_id=user.id, balance=5))
+            db.session.commit()
+            self.user_id = user.id
+
+        self.token = sign_token({"id": self.user_id, "email": "auth@example.com"})
+        self.headers = {"Authorization": f"Bearer {self.token}"}
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_token_verified_once_across_requests(self):
+        with mock.patch("app.auth.jwt.decode", wraps=jwt.decode) as decode:
+            for _ in range(3):
+                self.assertEqual(self.client.get("/balance", headers=self.headers).status_code, 200)
+        self.assertEqual(decode.call_count, 1)
+        self.assertEqual(self.app.extensions["token_cache"].stats()["hits"], 2)
+
+    def test_cached_token_expires_with_the_token(self):
+        token = jwt.encode({"data": {"id": self.user_id}, "exp": int(time.time()) + 30}, SECRET_KEY, algorithm="HS256")
+        response = self.client.get("/balance", headers={"Authorization": f"Bearer {token}"})
+        self.assertEqual(response.status_code, 200)
+        expires, _ = self.app.extensions["token_cache"].entries[token]
+        self.assertLessEqual(expires - time.monotonic(), 30)
+
+    def test_bad_tokens_are_rejected_and_not_cached(self):
+        expired = jwt.encode({"data": {"id": self.user_id}, "exp": int(time.time()) - 10}, SECRET_KEY, algorithm="HS256")
+        for headers in ({}, {"Authorization": "Bearer nope"}, {"Authorization": f"Bearer {expired}"}):
+            self.assertEqual(self.client.get("/balance", headers=headers).status_code, 401)
+        self.assertEqual(len(self.app.extensions["token_cache"]), 0)
+
+    def test_user_loaded_once_per_request(self):
+        statements = []
+        with self.app.test_request_context(headers=self.headers):
+            listener = lambda conn, cursor, statement, *args: statements.append(statement)
+            event.listen(db.engine, "before_cursor_execute", listener)
+            try:
+                self.assertEqual(current_identity()["id"], self.user_id)
+                self.assertIs(current_user(), current_user())
+            finally:
+                event.remove(db.engine, "before_cursor_execute", listener)
+        self.assertEqual(len([s for s in statements if "FROM users" in s]), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,11 @@
 import unittest
+from unittest import mock
+from sqlalchemy import event
 from app import create_app, db
-from app.models import Users, Avatar, CustomizationItems
+from app.models import Users, Avatar, CustomizationItems, Tasks
+from app.energy import ENERGY_PER_TASK, add_energy
+from app.reminders import utcnow
+from app.util import sign_token
 from datetime import datetime, timedelta, timezone
 
 class AvatarModelTestCase(unittest.TestCase):
@@ -66,5 +71,126 @@ class AvatarModelTestCase(unittest.TestCase):
                 db.session.add(avatar)
                 db.session.commit()
 
+    def add_avatar(self, energy=50, rate=-2.0, hours_ago=0):
+        with self.app.app_context():
+            user = Users(username="tired", first_name="Ti", last_name="Red", email="tired@example.com", password_hash="x")
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(Avatar(user_id=user.id, avatar_name="Sleepy", avatar_energy=energy, energy_rate=rate,
+                                  energy_updated_at=utcnow() - timedelta(hours=hours_ago)))
+            db.session.commit()
+            self.user_id = user.id
+        self.headers = {"Authorization": f"Bearer {sign_token({'id': self.user_id})}"}
+
+    def get_avatar(self):
+        return self.client.get("/avatar", headers=self.headers)
+
+    def test_energy_worked_out_on_read(self):
+        self.add_avatar(energy=50, rate=-2.0, hours_ago=10)
+        writes = []
+        with self.app.app_context():
+            engine = db.engine
+        listener = lambda conn, cursor, statement, *args: writes.append(statement) if not statement.lstrip().upper().startswith("SELECT") else None
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            response = self.get_avatar()
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["avatar_energy"], 30)
+        self.assertEqual(writes, [])
+
+    def test_energy_is_clamped(self):
+        self.add_avatar(energy=10, rate=-2.0, hours_ago=100)
+        self.assertEqual(self.get_avatar().get_json()["avatar_energy"], 0)
+        with self.app.app_context():
+            avatar = Avatar.query.one()
+            self.assertEqual(avatar.energy_at(avatar.energy_updated_at + timedelta(days=365)), 0)
+            avatar.energy_rate = 5.0
+            self.assertEqual(avatar.energy_at(avatar.energy_updated_at + timedelta(days=365)), 100)
+
+    def test_completing_a_task_folds_and_rewards(self):
+        self.add_avatar(energy=50, rate=-2.0, hours_ago=5)
+        response = self.client.post("/tasks", json={
+            "user_id": self.user_id, "task_name": "Run", "task_type": "daily", "due_date": "2025-03-25", "task_complete": True
+        })
+        self.assertEqual(response.status_code, 201)
+        with self.app.app_context():
+            avatar = Avatar.query.one()
+            # 50 - 2 * 5 hours, plus the reward, stored as of now
+            self.assertAlmostEqual(avatar.avatar_energy, 40 + ENERGY_PER_TASK, places=2)
+            self.assertLess(utcnow() - avatar.energy_updated_at, timedelta(minutes=1))
+        task_id = response.get_json()["task"]["id"]
+
+        # Un-completing takes the reward back
+        self.client.put("/tasks", json={"id": task_id, "task_complete": False})
+        # Batch completing it again gives it back
+        self.client.patch("/tasks/batch", json={"ids": [task_id], "values": {"task_complete": True}})
+        self.assertEqual(self.get_avatar().get_json()["avatar_energy"], 50)
+        self.client.patch("/tasks/batch", json={"ids": [task_id], "values": {"task_complete": False}})
+        self.assertEqual(self.get_avatar().get_json()["avatar_energy"], 40)
+
+    def test_batch_rewards_only_flips(self):
+        self.add_avatar(energy=50, rate=0.0)
+        with self.app.app_context():
+            tasks = [Tasks(user_id=self.user_id, task_name=f"Task {i}", task_type="daily") for i in range(3)]
+            db.session.add_all(tasks)
+            db.session.commit()
+            ids = [task.id for task in tasks]
+            # Never set, counts as not done
+            db.session.query(Tasks).filter(Tasks.id == ids[0]).update({"task_complete": None})
+            db.session.commit()
+
+        def batch(done):
+            response = self.client.patch("/tasks/batch", json={"ids": ids, "values": {"task_complete": done}})
+            self.assertEqual(response.get_json()["updated"], 3)
+
+        batch(False)
+        self.assertEqual(self.get_avatar().get_json()["avatar_energy"], 50)
+        batch(True)
+        batch(True)
+        self.assertEqual(self.get_avatar().get_json()["avatar_energy"], 50 + 3 * ENERGY_PER_TASK)
+        batch(False)
+        self.assertEqual(self.get_avatar().get_json()["avatar_energy"], 50)
+
+    def test_give_back_only_what_was_added(self):
+        self.add_avatar(energy=95, rate=0.0)
+        with self.app.app_context():
+            tasks = [Tasks(user_id=self.user_id, task_name=f"Task {i}", task_type="daily") for i in range(3)]
+            db.session.add_all(tasks)
+            db.session.commit()
+            ids = [task.id for task in tasks]
+
+        # Only 5 fit under the cap, so un-completing all three takes back just those 5
+        self.client.patch("/tasks/batch", json={"ids": ids, "values": {"task_complete": True}})
+        self.assertEqual(self.get_avatar().get_json()["avatar_energy"], 100)
+        self.client.patch("/tasks/batch", json={"ids": ids, "values": {"task_complete": False}})
+        self.assertEqual(self.get_avatar().get_json()["avatar_energy"], 95)
+
+        # Already full, completing one adds nothing and un-completing it takes nothing
+        with self.app.app_context():
+            add_energy(self.user_id, 10)
+            db.session.commit()
+        self.client.put("/tasks", json={"id": ids[0], "task_complete": True})
+        self.client.put("/tasks", json={"id": ids[0], "task_complete": False})
+        self.assertEqual(self.get_avatar().get_json()["avatar_energy"], 100)
+
+    def test_lost_race_is_retried(self):
+        self.add_avatar(energy=50, rate=0.0)
+        with self.app.app_context():
+            # Another write lands between our read and our conditional update, the first attempt matches nothing
+            real_execute = db.session.execute
+            calls = []
+            def racing_execute(statement, *args, **kwargs):
+                if getattr(statement, "is_update", False) and not calls:
+                    calls.append(1)
+                    db.session.get(Avatar, 1).energy_updated_at = utcnow() + timedelta(seconds=1)
+                    db.session.flush()
+                return real_execute(statement, *args, **kwargs)
+            with mock.patch.object(db.session, "execute", racing_execute):
+                self.assertEqual(add_energy(self.user_id, 5), 5)
+            self.assertEqual(db.session.get(Avatar, 1).avatar_energy, 55)
+            self.assertEqual(calls, [1])
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+from unittest import mock
+from app.cache import LRUCache
+
+class LRUCacheTestCase(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(len(cache), 2)
+
+    def test_entries_expire(self):
+        cache = LRUCache(ttl=10)
+        with mock.patch("app.cache.time.monotonic", return_value=100):
+            cache.set("a", 1)
+        with mock.patch("app.cache.time.monotonic", return_value=105):
+            self.assertEqual(cache.get("a"), 1)
+        with mock.patch("app.cache.time.monotonic", return_value=111):
+            self.assertEqual(cache.get("a", "gone"), "gone")
+        self.assertEqual(len(cache), 0)
+
+    def test_peek_leaves_stats_and_order_alone(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.peek("a"), 1)
+        cache.set("c", 3)
+        self.assertIsNone(cache.peek("a"))
+        self.assertEqual(cache.stats()["hits"] + cache.stats()["misses"], 0)
+
+    def test_stats(self):
+        cache = LRUCache(maxsize=8)
+        cache.set("a", 1)
+        cache.get("a")
+        cache.get("b")
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "hit_rate": 0.5, "size": 1, "maxsize": 8})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,10 @@
+import gzip
+import json
 import unittest
 from app import create_app, db
-from app.models import CustomizationItems
+from app.models import CustomizationItems, Users, Wallets
+from app.util import sign_token
+from sqlalchemy import event
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.dialects.sqlite import dialect as sqlite_dialect
 
@@ -56,6 +60,151 @@ class CustomizationItemsModelTestCase(unittest.TestCase):
                 db.session.commit()  # This should raise IntegrityError
 
 
+    def test_get_items_stream_matches_list(self):
+        with self.app.app_context():
+            db.session.add_all([
+                CustomizationItems(item_type="shirt", name=f"Shirt {i}", item_cost=i, model_key=f"shirt_{i}")
+                for i in range(5)
+            ])
+            db.session.commit()
+
+        listed = self.client.get("/items").get_json()
+        response = self.client.get("/items?stream=true")
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.get_json(), listed)
+        self.assertEqual(len(listed), 5)
+
+    def test_get_items_sparse_fields(self):
+        with self.app.app_context():
+            db.session.add(CustomizationItems(item_type="shoes", name="Fast Shoes", item_cost=5, model_key="fast_shoes"))
+            db.session.commit()
+
+        response = self.client.get("/items?fields=name,item_cost")
+        self.assertEqual(response.get_json(), [{"name": "Fast Shoes", "item_cost": 5}])
+        self.assertEqual(self.client.get("/items?fields=secret").status_code, 400)
+
+    def add_item(self, name="Red Skin", item_cost=50):
+        with self.app.app_context():
+            item = CustomizationItems(item_type="skin", name=name, item_cost=item_cost, model_key=name.lower().replace(" ", "_"))
+            db.session.add(item)
+            db.session.commit()
+            return item.id
+
+    def count_item_queries(self, path):
+        statements = []
+        with self.app.app_context():
+            engine = db.engine
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            response = self.client.get(path)
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        return response, [s for s in statements if "customization_items" in s]
+
+    def test_items_served_from_catalog(self):
+        self.add_item()
+        self.client.get("/items")  # loads the catalog after the insert
+        response, queries = self.count_item_queries("/items")
+        self.assertEqual(response.get_json()[0]["name"], "Red Skin")
+        self.assertEqual(queries, [])
+
+    def test_item_changes_bump_catalog_version(self):
+        item_id = self.add_item()
+        catalog = self.app.extensions["catalog"]
+        self.assertEqual(self.client.get("/items").get_json()[0]["item_cost"], 50)
+        version = catalog.version
+
+        with self.app.app_context():
+            db.session.get(CustomizationItems, item_id).item_cost = 75
+            db.session.rollback()  # a rolled back change leaves the catalog alone
+            self.assertEqual(catalog.version, version)
+            db.session.get(CustomizationItems, item_id).item_cost = 75
+            db.session.commit()
+        self.assertEqual(catalog.version, version + 1)
+        self.assertEqual(self.client.get("/items").get_json()[0]["item_cost"], 75)
+
+    def test_catalog_reloads_after_ttl(self):
+        self.add_item()
+        catalog = self.app.extensions["catalog"]
+        self.client.get("/items")
+        catalog.ttl = 0
+        _, queries = self.count_item_queries("/items")
+        self.assertEqual(len(queries), 1)
+
+    def test_purchase_uses_catalog_cost(self):
+        item_id = self.add_item(item_cost=30)
+        with self.app.app_context():
+            user = Users(username="buyer", first_name="B", last_name="Uyer", email="buyer@example.com", password_hash="x")
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(Wallets(user_id=user.id, balance=100))
+            db.session.commit()
+            token = sign_token({"id": user.id, "email": user.email})
+            user_id = user.id
+
+        response = self.client.post("/items", json={"user_id": user_id, "item_id": item_id}, headers={"Authorization": f"Bearer {token}"})
+        self.assertEqual(response.status_code, 201, response.get_json())
+        self.assertEqual(response.get_json()["remaining_balance"], 70)
+
+    def test_owned_flag_from_cached_bitset(self):
+        first = self.add_item("Red Skin", 10)
+        second = self.add_item("Blue Skin", 10)
+        with self.app.app_context():
+            user = Users(username="owner", first_name="O", last_name="Wner", email="owner@example.com", password_hash="x")
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(Wallets(user_id=user.id, balance=100))
+            db.session.commit()
+            user_id = user.id
+            headers = {"Authorization": f"Bearer {sign_token({'id': user.id, 'email': user.email})}"}
+
+        def owned():
+            return {item["id"]: item["owned"] for item in self.client.get(f"/items?user_id={user_id}").get_json()}
+
+        self.assertEqual(owned(), {first: False, second: False})
+        self.client.post("/items", json={"user_id": user_id, "item_id": second}, headers=headers)
+
+        # The purchase updated the cached bitset, no Transactions query on the next read
+        response, _ = self.count_item_queries(f"/items?user_id={user_id}")
+        self.assertEqual({item["id"]: item["owned"] for item in response.get_json()}, {first: False, second: True})
+        stats = self.client.get("/cache/stats", headers=headers).get_json()["owned_items"]
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]), (1, 1, 1))
+        self.assertGreater(stats["bytes"], 0)
+
+        # A new catalog snapshot means the bitset is rebuilt against the new positions
+        self.add_item("Green Skin", 10)
+        self.assertEqual(owned()[second], True)
+        self.assertEqual(self.client.get("/cache/stats", headers=headers).get_json()["owned_items"]["misses"], 2)
+
+    def test_items_pre_encoded_with_etag(self):
+        self.add_item()
+        response = self.client.get("/items")
+        etag = response.headers["ETag"].strip('"')
+        self.assertIn("public", response.headers["Cache-Control"])
+        self.assertEqual(response.headers["Vary"], "Accept-Encoding")
+        self.assertEqual(response.get_json()[0]["name"], "Red Skin")
+
+        # Same content after a reload, same ETag
+        self.app.extensions["catalog"].invalidate()
+        self.assertEqual(self.client.get("/items", headers={"If-None-Match": f'"{etag}"'}).status_code, 304)
+
+        self.add_item("Blue Skin")
+        response = self.client.get("/items", headers={"If-None-Match": f'"{etag}"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"].strip('"'), etag)
+
+    def test_items_gzip_variant(self):
+        self.add_item()
+        plain = self.client.get("/items")
+        response = self.client.get("/items", headers={"Accept-Encoding": "gzip, deflate"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(response.data)), plain.get_json())
+        self.assertNotEqual(response.headers["ETag"], plain.headers["ETag"])
+        # Either variant's tag revalidates
+        revalidated = self.client.get("/items", headers={"Accept-Encoding": "gzip", "If-None-Match": plain.headers["ETag"]})
+        self.assertEqual(revalidated.status_code, 304)
+
 if __name__ == "__main__":
     unittest.main()
 
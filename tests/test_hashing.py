@@ -0,0 +1,85 @@
+import threading
+import unittest
+import bcrypt
+from app import create_app, db
+from app.models import Users
+from app.hashing import PasswordHasher, HasherBusy
+
+class PasswordHashingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config["TESTING"] = True
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+        self.app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            db.create_all()
+            user = Users(username="hasher", first_name="Hash", last_name="Er", email="hash@example.com")
+            user.set_password("securepass")
+            db.session.add(user)
+            db.session.commit()
+            self.user_id = user.id
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def login(self):
+        return self.client.post("/login", json={"email": "hash@example.com", "password": "securepass"})
+
+    def stored_hash(self):
+        with self.app.app_context():
+            return db.session.get(Users, self.user_id).password_hash
+
+    def test_hash_uses_configured_rounds(self):
+        rounds = self.app.config["BCRYPT_ROUNDS"]
+        self.assertTrue(self.stored_hash().startswith(f"$2b${rounds:02d}$"))
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_login_rehashes_old_cost(self):
+        with self.app.app_context():
+            user = db.session.get(Users, self.user_id)
+            user.password_hash = bcrypt.hashpw(b"securepass", bcrypt.gensalt(rounds=5)).decode()
+            db.session.commit()
+
+        self.assertEqual(self.login().status_code, 200)
+        upgraded = self.stored_hash()
+        self.assertTrue(upgraded.startswith(f"$2b${self.app.config['BCRYPT_ROUNDS']:02d}$"))
+        # Still the same password, and no rehash the next time
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(self.stored_hash(), upgraded)
+
+    def test_full_pool_returns_503(self):
+        hasher = PasswordHasher(rounds=4, workers=1, max_pending=1, wait_timeout=0.05)
+        self.app.extensions["password_hasher"] = hasher
+
+        # Take the only slot until the login has been turned away
+        release = threading.Event()
+        started = threading.Event()
+        blocker = threading.Thread(target=hasher.run, args=(lambda: (started.set(), release.wait(5)),))
+        blocker.start()
+        try:
+            started.wait(5)
+            response = self.login()
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers["Retry-After"], "1")
+        finally:
+            release.set()
+            blocker.join()
+
+        self.assertEqual(self.login().status_code, 200)
+        hasher.shutdown()
+
+    def test_busy_is_raised_directly(self):
+        hasher = PasswordHasher(rounds=4, workers=1, max_pending=1, wait_timeout=0)
+        self.assertTrue(hasher.slots.acquire())
+        with self.assertRaises(HasherBusy):
+            hasher.hash("x")
+        hasher.slots.release()
+        self.assertTrue(hasher.check("x", hasher.hash("x")))
+        hasher.shutdown()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import unittest
+from sqlalchemy import event
+from app import create_app, db
+from app.models import Users, Tasks, Avatar, CustomizationItems, Wallets, Transactions, Streaks
+from app.purge import purge_deleted
+from app.util import encode_cursor, sign_token
+from datetime import datetime, timedelta, timezone
+
+class PurgeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config["TESTING"] = True
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+        self.app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+        item = CustomizationItems(item_type="skin", name="Purge Skin", item_cost=1, model_key="purge_skin")
+        db.session.add(item)
+        self.user_ids = []
+        for name in ("leaving", "staying"):
+            user = Users(username=name, first_name=name, last_name="User", email=f"{name}@example.com")
+            user.set_password("securepass")
+            db.session.add(user)
+            db.session.commit()
+            self.user_ids.append(user.id)
+
+            db.session.add_all([
+                Avatar(user_id=user.id, avatar_name=name),
+                Wallets(user_id=user.id, balance=10),
+                Transactions(user_id=user.id, item_id=item.id),
+                Streaks(user_id=user.id, current_streak=1, longest_streak=1),
+            ])
+            # A chain of renewed daily tasks, plus some plain ones
+            previous = None
+            for i in range(3):
+                task = Tasks(user_id=user.id, task_name=f"Daily {i}", task_type="daily",
+                             renewed_from_id=previous.id if previous else None)
+                db.session.add(task)
+                db.session.flush()
+                previous = task
+            db.session.add_all([Tasks(user_id=user.id, task_name=f"Task {i}", task_type="short-term") for i in range(4)])
+            db.session.commit()
+        self.leaving, self.staying = self.user_ids
+        self.headers = {"Authorization": f"Bearer {sign_token({'id': self.leaving})}"}
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def count(self, model, user_id):
+        return model.query.filter_by(user_id=user_id).count()
+
+    def test_delete_user_only_touches_the_user_row(self):
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, "before_cursor_execute", listener)
+        try:
+            response = self.client.delete("/user", headers=self.headers)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", listener)
+        self.assertEqual(response.status_code, 200)
+        writes = [s for s in statements if s.lstrip().upper().startswith(("UPDATE", "DELETE", "INSERT"))]
+        self.assertTrue(writes)
+        self.assertTrue(all(s.lstrip().upper().startswith("UPDATE USERS") for s in writes), writes)
+
+    def test_deleted_user_is_hidden(self):
+        self.client.delete("/user", headers=self.headers)
+
+        login = self.client.post("/login", json={"email": "leaving@example.com", "password": "securepass"})
+        self.assertEqual(login.status_code, 401)
+        self.assertEqual(self.client.get(f"/tasks?user_id={self.leaving}").get_json()["tasks"], [])
+        self.assertEqual(self.client.get("/balance", headers=self.headers).status_code, 404)
+        self.assertEqual(self.client.get("/streak", headers=self.headers).status_code, 404)
+        self.assertEqual(self.client.get(f"/tasks/changes?user_id={self.leaving}").status_code, 404)
+        self.assertEqual(self.client.get(f"/tasks/stats?user_id={self.leaving}").status_code, 404)
+
+        # Unscoped listings and searches skip their tasks too
+        listed = self.client.get("/tasks").get_json()["tasks"]
+        self.assertEqual({task["user_id"] for task in listed}, {self.staying})
+        found = self.client.get("/tasks/search?q=daily").get_json()["tasks"]
+        self.assertEqual({task["user_id"] for task in found}, {self.staying})
+
+        # The email and username are free again
+        self.assertIsNone(Users.query.filter_by(email="leaving@example.com").first())
+        self.assertIsNone(Users.query.filter_by(username="leaving").first())
+
+    def test_purge_removes_everything_in_batches(self):
+        self.client.delete("/user", headers=self.headers)
+        users, rows = purge_deleted(batch_size=2)
+        self.assertEqual(users, 1)
+        # 7 tasks, avatar, transaction, wallet and the user (the streak row isn't counted)
+        self.assertEqual(rows, 11)
+
+        self.assertIsNone(db.session.get(Users, self.leaving))
+        for model in (Tasks, Avatar, Transactions, Wallets, Streaks):
+            self.assertEqual(self.count(model, self.leaving), 0, model.__name__)
+            self.assertEqual(self.count(model, self.staying), 7 if model is Tasks else 1, model.__name__)
+
+        # Nothing left to do the second time
+        self.assertEqual(purge_deleted(batch_size=2), (0, 0))
+
+    def test_purge_expired_tombstones(self):
+        now = datetime.now(timezone.utc)
+        tasks = Tasks.query.filter_by(user_id=self.staying).order_by(Tasks.id).all()
+        # The first daily task is long gone, the next one was only just deleted
+        tasks[0].deleted_at = now - timedelta(days=40)
+        tasks[1].deleted_at = now - timedelta(days=1)
+        db.session.commit()
+        old_id, recent_id = tasks[0].id, tasks[1].id
+
+        self.assertEqual(purge_deleted(now=now), (0, 1))
+        self.assertIsNone(db.session.get(Tasks, old_id))
+        self.assertIsNotNone(db.session.get(Tasks, recent_id))
+        # It was renewed from the purged task, and got unhooked
+        self.assertIsNone(db.session.get(Tasks, recent_id).renewed_from_id)
+
+    def test_stale_sync_token_is_gone(self):
+        stale = encode_cursor(1, 0, (datetime.now(timezone.utc) - timedelta(days=31)).isoformat())
+        response = self.client.get(f"/tasks/changes?user_id={self.staying}&since={stale}")
+        self.assertEqual(response.status_code, 410)
+        # Tokens from before change_seq, (updated_at, id), sync again from scratch too
+        old = encode_cursor(datetime.now(timezone.utc).isoformat(), 0)
+        self.assertEqual(self.client.get(f"/tasks/changes?user_id={self.staying}&since={old}").status_code, 410)
+
+if __name__ == "__main__":
+    unittest.main()
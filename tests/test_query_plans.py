@@ -0,0 +1,157 @@
+import os
+import re
+import json
+import unittest
+from unittest import mock
+from sqlalchemy import event
+from app import create_app, db
+from app.models import Users, Tasks, Avatar, CustomizationItems, Wallets, Transactions
+from app.reminders import next_due
+from app.util import sign_token
+from datetime import datetime, timedelta
+
+# Tables that must always be reached through an index by the routes below
+INDEXED_TABLES = ("tasks", "transactions", "users", "wallets", "wallet_ledger", "avatar")
+
+# Route calls to check, each one is (method, url, json body, needs auth)
+ROUTE_CALLS = [
+    ("GET", "/tasks?user_id={user_id}", None, False),
+    ("GET", "/tasks?user_id={user_id}&task_complete=true&task_type=daily", None, False),
+    ("GET", "/tasks/changes?user_id={user_id}", None, False),
+    ("GET", "/tasks/search?user_id={user_id}&q=plan", None, False),
+    ("GET", "/tasks/stats?user_id={user_id}&start=2025-01-01", None, False),
+    ("GET", "/streak", None, True),
+    ("POST", "/login", {"email": "plans@example.com", "password": "securepass"}, False),
+    ("GET", "/items?user_id={user_id}", None, False),
+    ("GET", "/balance", None, True),
+    ("GET", "/balance/history?limit=5", None, True),
+    ("GET", "/avatar", None, True),
+]
+
+# Runs every route in ROUTE_CALLS against the app and EXPLAINs each query it sent to the database.
+# SQLite always runs, Postgres runs when TEST_POSTGRES_URL points at a scratch database.
+class QueryPlanMixin:
+    def make_app(self):
+        return create_app()
+
+    def setUp(self):
+        self.app = self.make_app()
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            db.create_all()
+
+            user = Users(
+                username="plans",
+                first_name="Query",
+                last_name="Plans",
+                email="plans@example.com"
+            )
+            user.set_password("securepass")
+            db.session.add(user)
+            db.session.commit()
+            self.user_id = user.id
+
+            item = CustomizationItems(item_type="skin", name="Plan Skin", item_cost=10, model_key="plan_skin")
+            db.session.add(item)
+            db.session.add(Wallets(user_id=user.id, balance=100))
+            db.session.add(Avatar(user_id=user.id, avatar_name="Plan Avatar"))
+            db.session.commit()
+            db.session.add(Transactions(user_id=user.id, item_id=item.id))
+            db.session.add_all([
+                Tasks(user_id=user.id, task_name=f"Plan {i}", task_type="daily",
+                      due_date=datetime(2025, 1, 1) + timedelta(days=i), task_complete=i % 2 == 0)
+                for i in range(10)
+            ])
+            db.session.commit()
+
+        self.token = sign_token({"id": self.user_id, "email": "plans@example.com"})
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    # Runs `call` and returns every SELECT it sent, with its parameters
+    def capture_selects(self, call):
+        captured = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith("SELECT"):
+                captured.append((statement, parameters))
+
+        with self.app.app_context():
+            engine = db.engine
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            call()
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+        return captured
+
+    # Calls a route and returns every SELECT it ran, with its parameters
+    def capture_queries(self, method, url, body, auth):
+        def call():
+            headers = {"Authorization": f"Bearer {self.token}"} if auth else {}
+            response = self.client.open(url.format(user_id=self.user_id), method=method, json=body, headers=headers)
+            self.assertLess(response.status_code, 400, f"{method} {url} failed: {response.get_data(as_text=True)}")
+        return self.capture_selects(call)
+
+    def assert_no_full_scans(self, queries, label):
+        self.assertTrue(queries, f"{label} ran no queries")
+        with self.app.app_context():
+            for statement, parameters in queries:
+                scans = self.full_scans(statement, parameters)
+                self.assertEqual(scans, [], f"Full table scan in {label}:\n{statement}")
+
+    def test_route_queries_use_indexes(self):
+        for method, url, body, auth in ROUTE_CALLS:
+            with self.subTest(route=f"{method} {url}"):
+                queries = self.capture_queries(method, url, body, auth)
+                self.assert_no_full_scans(queries, f"{method} {url}")
+
+    # Background jobs that read tasks outside of a route
+    def test_reminder_query_uses_indexes(self):
+        def call():
+            with self.app.app_context():
+                next_due((datetime(2025, 1, 3), 0))
+        self.assert_no_full_scans(self.capture_selects(call), "reminders next_due")
+
+
+class SQLiteQueryPlanTestCase(QueryPlanMixin, unittest.TestCase):
+    # Returns the plan lines that walk a whole table, e.g. "SCAN tasks"
+    def full_scans(self, statement, parameters):
+        rows = db.session.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+        pattern = re.compile(r"^SCAN (%s)\b" % "|".join(INDEXED_TABLES))
+        return [row[-1] for row in rows if pattern.match(row[-1])]
+
+
+@unittest.skipUnless(os.getenv("TEST_POSTGRES_URL"), "TEST_POSTGRES_URL not set")
+class PostgresQueryPlanTestCase(QueryPlanMixin, unittest.TestCase):
+    def make_app(self):
+        # create_app picks the database from the environment, so point "local" at the scratch database
+        env = {"APP_ENV": "local", "LOCAL_DATABASE_URL": os.getenv("TEST_POSTGRES_URL")}
+        with mock.patch.dict(os.environ, env):
+            return create_app()
+
+    # Returns the Seq Scan nodes over indexed tables, with seq scans discouraged so
+    # the planner only picks one when there is no usable index
+    def full_scans(self, statement, parameters):
+        connection = db.session.connection()
+        connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        plan = connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+
+        scans = []
+        nodes = [plan[0]["Plan"]]
+        while nodes:
+            node = nodes.pop()
+            if node.get("Node Type") == "Seq Scan" and node.get("Relation Name") in INDEXED_TABLES:
+                scans.append(node["Relation Name"])
+            nodes.extend(node.get("Plans", []))
+        return scans
+
+
+if __name__ == "__main__":
+    unittest.main()
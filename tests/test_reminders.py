@@ -0,0 +1,135 @@
+import unittest
+from app import create_app, db
+from app.models import Users, Tasks
+from app.reminders import ReminderScheduler, QueueSink, load_fired_until, start_reminders, track_reminders, utcnow
+from app.util import sign_token
+from datetime import datetime, timedelta
+
+class ReminderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config["TESTING"] = True
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+        self.app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+        user = Users(username="reminded", first_name="Re", last_name="Minded", email="remind@example.com", password_hash="x")
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+
+        # A scheduler that isn't started, the tests drive it with run_pending()
+        self.now = datetime(2025, 3, 10, 12, 0)
+        self.sink = QueueSink()
+        self.scheduler = ReminderScheduler(self.app, self.sink, batch_size=2, clock=lambda: self.now)
+        self.app.extensions["reminders"] = self.scheduler
+
+    def tearDown(self):
+        scheduler = self.app.extensions.pop("reminders", None)
+        if scheduler and scheduler.is_alive():
+            scheduler.stop(timeout=5)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_task(self, minutes, **fields):
+        fields.setdefault("user_id", self.user_id)
+        task = Tasks(task_name=f"Due in {minutes}", task_type="short-term",
+                     due_date=self.now + timedelta(minutes=minutes), **fields)
+        db.session.add(task)
+        db.session.commit()
+        return task.id
+
+    def fired(self, minutes):
+        return [reminder["task_id"] for reminder in self.scheduler.run_pending(self.now + timedelta(minutes=minutes))]
+
+    def test_fires_in_due_order_across_windows(self):
+        ids = [self.add_task(minutes) for minutes in (5, 1, 3, 4, 2)]
+        self.add_task(-5)  # already overdue, not reminded again
+        self.add_task(2, task_complete=True)
+
+        self.assertEqual(self.fired(0), [])
+        self.assertEqual(self.fired(3), [ids[1], ids[4], ids[2]])
+        self.assertEqual(self.fired(60), [ids[3], ids[0]])
+        self.assertEqual(self.fired(120), [])
+        self.assertEqual(self.sink.queue.qsize(), 5)
+
+    def test_task_writes_reschedule(self):
+        moved = self.add_task(5)
+        done = self.add_task(6)
+        deleted = self.add_task(7)
+        self.assertEqual(self.fired(0), [])
+
+        self.client.post("/tasks", json={
+            "user_id": self.user_id, "task_name": "New", "task_type": "daily",
+            "due_date": (self.now + timedelta(minutes=2)).isoformat()
+        })
+        self.client.patch("/tasks", json={"id": moved, "due_date": (self.now + timedelta(minutes=30)).isoformat()})
+        self.client.patch("/tasks", json={"id": done, "task_complete": True})
+        self.client.delete("/tasks", json={"id": deleted})
+
+        reminders = self.scheduler.run_pending(self.now + timedelta(minutes=10))
+        self.assertEqual([reminder["task_name"] for reminder in reminders], ["New"])
+        self.assertEqual(self.fired(30), [moved])
+
+    def test_rolled_back_writes_are_ignored(self):
+        self.assertEqual(self.fired(0), [])
+        task = Tasks(user_id=self.user_id, task_name="Never", task_type="daily", due_date=self.now + timedelta(minutes=1))
+        db.session.add(task)
+        db.session.flush()
+        track_reminders([task])
+        db.session.rollback()
+        self.assertEqual(self.fired(5), [])
+
+    def test_deleted_users_are_not_reminded(self):
+        other = Users(username="stays", first_name="St", last_name="Ays", email="stays@example.com", password_hash="x")
+        db.session.add(other)
+        db.session.commit()
+        kept = self.add_task(2, user_id=other.id)
+        self.add_task(1)
+        self.assertEqual(self.fired(0), [])
+
+        # Their tasks are already in the heap, they stay in the table until the purge
+        headers = {"Authorization": f"Bearer {sign_token({'id': self.user_id})}"}
+        self.assertEqual(self.client.delete("/user", headers=headers).status_code, 200)
+        self.assertEqual(self.fired(5), [kept])
+
+    def test_rereads_writes_from_other_processes(self):
+        # A short first window, every open task is in the heap
+        closed = self.add_task(3)
+        self.assertEqual(self.fired(0), [])
+        self.assertIsNone(self.scheduler.loaded_until)
+
+        # Written straight to the table, as another process would, nothing tells the scheduler
+        first = self.add_task(2)
+        late = self.add_task(4)
+        db.session.get(Tasks, closed).task_complete = True
+        db.session.commit()
+        self.assertEqual(self.fired(5), [first, late])
+
+    def test_restart_resumes_where_it_left_off(self):
+        ids = [self.add_task(minutes) for minutes in (1, 10, 20)]
+        self.assertEqual(self.fired(5), [ids[0]])
+
+        # Down from minute 5 to minute 15, the task due at 10 is still reminded once it is back
+        self.now += timedelta(minutes=15)
+        restarted = ReminderScheduler(self.app, QueueSink(), batch_size=2, clock=lambda: self.now)
+        restarted.resume()
+        self.assertEqual([reminder["task_id"] for reminder in restarted.run_pending()], [ids[1]])
+        self.assertEqual(load_fired_until(), self.now)
+
+    def test_scheduler_thread_fires_when_due(self):
+        self.app.extensions.pop("reminders")
+        scheduler = start_reminders(self.app, QueueSink())
+        self.client.post("/tasks", json={
+            "user_id": self.user_id, "task_name": "Soon", "task_type": "daily",
+            "due_date": (utcnow() + timedelta(seconds=0.3)).isoformat()
+        })
+        reminder = scheduler.sink.queue.get(timeout=5)
+        self.assertEqual(reminder["task_name"], "Soon")
+
+if __name__ == "__main__":
+    unittest.main()
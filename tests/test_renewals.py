@@ -0,0 +1,123 @@
+import unittest
+import threading
+import click
+from unittest import mock
+from flask.cli import run_command
+from app import create_app, db
+from app.models import Users, Tasks
+from app.renewals import renew_daily_tasks, next_day_boundary, get_zone
+from app.util import sign_token
+from app.workers import is_serving, start_worker
+from datetime import datetime, timedelta, timezone
+
+class RenewalTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config["TESTING"] = True
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+        self.app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+
+        # Two users on either side of the world
+        self.utc_user = Users(username="utc", first_name="U", last_name="TC", email="utc@example.com", password_hash="x")
+        self.denver_user = Users(username="denver", first_name="D", last_name="Enver", email="denver@example.com",
+                                 password_hash="x", timezone="America/Denver")
+        db.session.add_all([self.utc_user, self.denver_user])
+        db.session.commit()
+
+        # 2025-03-10 07:00 UTC, which is 01:00 the same day in Denver (MDT, UTC-6)
+        self.now = datetime(2025, 3, 10, 7, 0, tzinfo=timezone.utc)
+        yesterday = datetime(2025, 3, 10, 0, 0)
+        for user in (self.utc_user, self.denver_user):
+            db.session.add_all([
+                Tasks(user_id=user.id, task_name="Stretch", task_type="daily", due_date=yesterday, task_complete=True),
+                Tasks(user_id=user.id, task_name="Read", task_type="daily", due_date=yesterday),
+                Tasks(user_id=user.id, task_name="Later", task_type="daily", due_date=yesterday + timedelta(days=2)),
+                Tasks(user_id=user.id, task_name="Essay", task_type="long-term", due_date=yesterday),
+            ])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_next_day_boundary(self):
+        self.assertEqual(next_day_boundary(self.now, get_zone("UTC")), datetime(2025, 3, 11, 0, 0))
+        # Local midnight in Denver is 06:00 UTC
+        self.assertEqual(next_day_boundary(self.now, get_zone("America/Denver")), datetime(2025, 3, 11, 6, 0))
+        self.assertEqual(get_zone("Not/AZone"), timezone.utc)
+
+    def test_renew_daily_tasks(self):
+        renewed = renew_daily_tasks(now=self.now, batch_size=1)
+        self.assertEqual(renewed, 4)
+
+        for user, next_due in ((self.utc_user, datetime(2025, 3, 11)), (self.denver_user, datetime(2025, 3, 11, 6))):
+            originals = Tasks.query.filter_by(user_id=user.id, renewed_from_id=None).all()
+            copies = Tasks.query.filter(Tasks.user_id == user.id, Tasks.renewed_from_id.isnot(None)).all()
+
+            # The old rows keep their completion, only the due daily ones are flagged
+            self.assertEqual(sorted(task.task_name for task in originals if task.task_renewed), ["Read", "Stretch"])
+            self.assertTrue([task for task in originals if task.task_name == "Stretch"][0].task_complete)
+
+            # Fresh, open copies due at the user's next midnight
+            self.assertEqual(sorted(task.task_name for task in copies), ["Read", "Stretch"])
+            self.assertTrue(all(not task.task_complete and task.due_date == next_due for task in copies))
+
+            # Both show up for syncing clients, stamped after everything the user had before
+            renewed_tasks = [task for task in originals if task.task_renewed] + copies
+            self.assertTrue(all(0 < task.change_seq <= user.tasks_version for task in renewed_tasks))
+            self.assertTrue(all(task.change_seq == 0 for task in originals if not task.task_renewed))
+
+    def test_renewal_is_idempotent(self):
+        self.assertEqual(renew_daily_tasks(now=self.now), 4)
+        self.assertEqual(renew_daily_tasks(now=self.now), 0)
+        self.assertEqual(Tasks.query.count(), 12)
+
+    def test_renew_command(self):
+        # Run for real "now", so the task due in two days is past due as well
+        result = self.app.test_cli_runner().invoke(args=["renew-daily-tasks"])
+        self.assertIn("Renewed 6 daily task(s).", result.output)
+
+    def test_update_user_timezone(self):
+        headers = {"Authorization": f"Bearer {sign_token({'id': self.utc_user.id})}"}
+        response = self.client.patch("/user", json={"timezone": "Europe/Paris"}, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["user"]["timezone"], "Europe/Paris")
+        response = self.client.patch("/user", json={"timezone": "Mars/Olympus"}, headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_worker_runs_renewal(self):
+        ran = threading.Event()
+
+        def job():
+            renew_daily_tasks(now=self.now)
+            ran.set()
+
+        worker = start_worker(self.app, "test-renewal", 60, job)
+        self.assertTrue(ran.wait(5))
+        worker.stop(timeout=5)
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(Tasks.query.filter(Tasks.renewed_from_id.isnot(None)).count(), 4)
+
+    def test_workers_only_where_serving(self):
+        # No CLI, e.g. under a WSGI server
+        self.assertTrue(is_serving())
+        # `flask db upgrade` and the like
+        with click.Context(click.Command("upgrade"), info_name="upgrade"):
+            self.assertFalse(is_serving())
+        with click.Context(run_command, info_name="run") as ctx:
+            ctx.params = {"reload": False}
+            self.assertTrue(is_serving())
+            # --debug, the reloader's parent process only watches files, its child serves
+            ctx.params = {"reload": True}
+            self.assertFalse(is_serving())
+            with mock.patch.dict("os.environ", {"WERKZEUG_RUN_MAIN": "true"}):
+                self.assertTrue(is_serving())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+from app import create_app, db
+from app.models import Users, Tasks, Streaks
+from app.streaks import rebuild_streak, current_streak
+from app.util import sign_token
+from datetime import datetime, timedelta, timezone
+
+class StreakTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config["TESTING"] = True
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+        self.app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            db.create_all()
+
+            user = Users(
+                username="streaker",
+                first_name="Streak",
+                last_name="User",
+                email="streak@example.com"
+            )
+            user.set_password("securepass")
+            db.session.add(user)
+            db.session.commit()
+            self.user_id = user.id
+
+            # One open task for each of the last 5 days, oldest first
+            now = datetime.now(timezone.utc)
+            tasks = [
+                Tasks(user_id=user.id, task_name=f"Day -{i}", task_type="daily", created_date=now - timedelta(days=i))
+                for i in range(4, -1, -1)
+            ]
+            db.session.add_all(tasks)
+            db.session.commit()
+            # Task ids by how many days ago they were created
+            self.task_ids = {4 - i: task.id for i, task in enumerate(tasks)}
+
+        self.headers = {"Authorization": f"Bearer {sign_token({'id': self.user_id})}"}
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def complete(self, days_ago, done=True):
+        response = self.client.patch("/tasks", json={"id": self.task_ids[days_ago], "task_complete": done})
+        self.assertEqual(response.status_code, 200)
+
+    def get_streak(self):
+        response = self.client.get("/streak", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_streak_grows_as_days_are_completed(self):
+        self.assertEqual(self.get_streak()["streak_days"], 0)
+        for days_ago in (2, 1, 0):
+            self.complete(days_ago)
+        self.assertEqual(self.get_streak(), {"streak_days": 3, "longest_streak": 3})
+
+    def test_streak_needs_today(self):
+        self.complete(2)
+        self.complete(1)
+        body = self.get_streak()
+        self.assertEqual(body["streak_days"], 0)
+        self.assertEqual(body["longest_streak"], 2)
+
+    def test_uncompleting_breaks_the_streak(self):
+        for days_ago in (2, 1, 0):
+            self.complete(days_ago)
+        self.complete(1, done=False)
+        self.assertEqual(self.get_streak()["streak_days"], 1)
+
+        # Deleting today's completed task ends it too
+        self.client.delete("/tasks", json={"id": self.task_ids[0]})
+        self.assertEqual(self.get_streak()["streak_days"], 0)
+
+    def test_backfilled_day_joins_streaks(self):
+        for days_ago in (4, 3, 1, 0):
+            self.complete(days_ago)
+        self.assertEqual(self.get_streak()["streak_days"], 2)
+        self.complete(2)
+        self.assertEqual(self.get_streak(), {"streak_days": 5, "longest_streak": 5})
+
+    def test_bulk_complete_updates_streak(self):
+        response = self.client.patch("/tasks/batch", json={
+            "filter": {"user_id": self.user_id, "task_type": "daily"}, "values": {"task_complete": True}
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_streak()["streak_days"], 5)
+
+    def test_first_completion_without_row_keeps_history(self):
+        # Completed before streaks were tracked, so there is no streak row yet
+        with self.app.app_context():
+            db.session.query(Tasks).filter(Tasks.id.in_([self.task_ids[2], self.task_ids[1]])).update(
+                {"task_complete": True}, synchronize_session=False
+            )
+            db.session.commit()
+            self.assertIsNone(db.session.get(Streaks, self.user_id))
+
+        self.complete(0)
+        self.assertEqual(self.get_streak(), {"streak_days": 3, "longest_streak": 3})
+
+    def test_rebuild_matches_incremental(self):
+        for days_ago in (3, 1, 0):
+            self.complete(days_ago)
+        with self.app.app_context():
+            incremental = db.session.get(Streaks, self.user_id)
+            expected = (incremental.current_streak, incremental.longest_streak, incremental.last_completion_date)
+            db.session.delete(incremental)
+            db.session.commit()
+
+            rebuilt = rebuild_streak(self.user_id)
+            db.session.commit()
+            self.assertEqual((rebuilt.current_streak, rebuilt.longest_streak, rebuilt.last_completion_date), expected)
+            self.assertEqual(current_streak(rebuilt), 2)
+
+if __name__ == "__main__":
+    unittest.main()
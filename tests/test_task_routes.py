@@ -0,0 +1,480 @@
+import unittest
+from unittest import mock
+from sqlalchemy import event, update
+from app import create_app, db
+from app.models import Users, Tasks
+from app.routes import TASKS_MAX_PAGE_SIZE
+from app.util import decode_cursor, encode_cursor
+from datetime import datetime, timedelta, timezone
+
+class TaskRoutesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config["TESTING"] = True
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+        self.app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            db.create_all()
+
+            user = Users(
+                username="taskroutes",
+                first_name="Task",
+                last_name="Routes",
+                email="taskroutes@example.com"
+            )
+            user.set_password("securepass")
+            db.session.add(user)
+            db.session.commit()
+            self.user_id = user.id
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    # Adds tasks with a mix of due dates, including some that share a date and some without one
+    def add_tasks(self, count):
+        base = datetime(2025, 1, 1)
+        with self.app.app_context():
+            tasks = [
+                Tasks(
+                    user_id=self.user_id,
+                    task_name=f"Task {i}",
+                    due_date=None if i % 7 == 0 else base + timedelta(days=i % 5),
+                    task_type="short-term"
+                )
+                for i in range(count)
+            ]
+            db.session.add_all(tasks)
+            db.session.commit()
+
+    def test_get_tasks_pages_through_everything_once(self):
+        self.add_tasks(23)
+
+        seen = []
+        cursor = None
+        while True:
+            url = f"/tasks?user_id={self.user_id}&limit=5" + (f"&cursor={cursor}" if cursor else "")
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            body = response.get_json()
+            self.assertLessEqual(len(body["tasks"]), 5)
+            seen.extend(body["tasks"])
+            cursor = body["next_cursor"]
+            if not cursor:
+                break
+
+        # Every task exactly once, in due date order with undated tasks last
+        self.assertEqual(len(seen), 23)
+        self.assertEqual(len({task["id"] for task in seen}), 23)
+        due_dates = [task["due_date"] for task in seen]
+        dated = [due for due in due_dates if due is not None]
+        self.assertEqual(dated, sorted(dated))
+        self.assertEqual(due_dates[len(dated):], [None] * (23 - len(dated)))
+
+    def test_get_tasks_limit_is_capped(self):
+        self.add_tasks(TASKS_MAX_PAGE_SIZE + 50)
+        response = self.client.get(f"/tasks?user_id={self.user_id}&limit=1000")
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual(len(body["tasks"]), TASKS_MAX_PAGE_SIZE)
+        self.assertIsNotNone(body["next_cursor"])
+
+        # The rest fit on the next page
+        body = self.client.get(f"/tasks?user_id={self.user_id}&limit=1000&cursor={body['next_cursor']}").get_json()
+        self.assertEqual(len(body["tasks"]), 50)
+        self.assertIsNone(body["next_cursor"])
+
+    def test_get_tasks_invalid_cursor(self):
+        response = self.client.get("/tasks?cursor=not-a-cursor")
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_tasks_stream(self):
+        self.add_tasks(11)
+        # Small chunks so the stream is made of several pieces
+        with mock.patch("app.routes.STREAM_CHUNK_SIZE", 3):
+            response = self.client.get(f"/tasks?user_id={self.user_id}&stream=true")
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.is_streamed)
+            streamed = response.get_json()
+
+        paged = self.client.get(f"/tasks?user_id={self.user_id}").get_json()["tasks"]
+        self.assertEqual(streamed, paged)
+
+    def test_get_tasks_stream_empty(self):
+        response = self.client.get("/tasks?user_id=9999&stream=1")
+        self.assertEqual(response.get_json(), [])
+
+    def test_create_task_parses_due_date(self):
+        response = self.client.post("/tasks", json={
+            "user_id": self.user_id, "task_name": "Dated", "task_type": "short-term", "due_date": "2025-03-25"
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.get_json()["task"]["due_date"], "2025-03-25T00:00:00")
+
+        response = self.client.post("/tasks", json={
+            "user_id": self.user_id, "task_name": "Bad date", "task_type": "short-term", "due_date": "someday"
+        })
+        self.assertEqual(response.status_code, 400)
+
+    def test_create_tasks_batch(self):
+        tasks = [
+            {"task_name": f"Batch {i}", "task_type": "daily", "due_date": f"2025-03-{10 + i}"}
+            for i in range(5)
+        ]
+        inserts = []
+        with self.app.app_context():
+            engine = db.engine
+        listener = lambda conn, cursor, statement, *args: inserts.append(statement) if statement.startswith("INSERT INTO tasks") else None
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            response = self.client.post("/tasks/batch", json={"user_id": self.user_id, "tasks": tasks})
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        self.assertEqual(response.status_code, 201)
+        # Still one INSERT for the whole batch
+        self.assertEqual(len(inserts), 1)
+        results = response.get_json()["results"]
+        self.assertEqual([result["status"] for result in results], [201] * 5)
+        self.assertEqual([result["task"]["task_name"] for result in results], [task["task_name"] for task in tasks])
+
+        with self.app.app_context():
+            self.assertEqual(Tasks.query.filter_by(user_id=self.user_id).count(), 5)
+
+    def test_create_tasks_batch_reports_bad_items(self):
+        tasks = [
+            {"task_name": "Good", "task_type": "daily", "due_date": "2025-03-10"},
+            {"task_name": "No type", "due_date": "2025-03-10"},
+            {"task_name": "Bad type", "task_type": "weekly", "due_date": "2025-03-10"},
+            {"task_name": "Other user", "task_type": "daily", "due_date": "2025-03-10", "user_id": self.user_id + 1},
+            # Values the INSERT would choke on, failing the whole batch if they got that far
+            {"task_name": None, "task_type": "daily", "due_date": "2025-03-10"},
+            {"task_name": "", "task_type": "daily", "due_date": "2025-03-10"},
+            {"task_name": "x" * 256, "task_type": "daily", "due_date": "2025-03-10"},
+            {"task_name": "Yes", "task_type": "daily", "due_date": "2025-03-10", "task_complete": "yes"},
+            {"task_name": "Renewed", "task_type": "daily", "due_date": "2025-03-10", "task_renewed": 1},
+            {"task_name": "List type", "task_type": ["daily"], "due_date": "2025-03-10"},
+        ]
+        response = self.client.post("/tasks/batch", json={"user_id": self.user_id, "tasks": tasks})
+        self.assertEqual(response.status_code, 207)
+        statuses = [result["status"] for result in response.get_json()["results"]]
+        self.assertEqual(statuses, [201] + [400] * 9)
+
+        with self.app.app_context():
+            self.assertEqual(Tasks.query.filter_by(user_id=self.user_id).count(), 1)
+
+    def test_create_tasks_batch_unknown_user(self):
+        response = self.client.post("/tasks/batch", json={
+            "user_id": 9999, "tasks": [{"task_name": "x", "task_type": "daily", "due_date": "2025-03-10"}]
+        })
+        self.assertEqual(response.status_code, 404)
+
+    def test_update_tasks_batch_by_filter(self):
+        self.add_tasks(10)
+        response = self.client.patch("/tasks/batch", json={
+            "filter": {"user_id": self.user_id, "due_before": "2025-01-03"},
+            "values": {"task_complete": True}
+        })
+        self.assertEqual(response.status_code, 200)
+
+        with self.app.app_context():
+            expected = Tasks.query.filter(Tasks.user_id == self.user_id, Tasks.due_date < datetime(2025, 1, 3)).count()
+            self.assertEqual(response.get_json()["updated"], expected)
+            self.assertEqual(Tasks.query.filter_by(task_complete=True).count(), expected)
+
+    def test_update_tasks_batch_by_ids_returns_rows(self):
+        self.add_tasks(5)
+        with self.app.app_context():
+            ids = [task.id for task in Tasks.query.limit(3)]
+
+        response = self.client.patch("/tasks/batch", json={
+            "ids": ids, "values": {"task_complete": True, "task_name": "Done"}, "return": "rows"
+        })
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual(body["updated"], 3)
+        self.assertEqual(sorted(task["id"] for task in body["tasks"]), sorted(ids))
+        self.assertTrue(all(task["task_complete"] and task["task_name"] == "Done" for task in body["tasks"]))
+
+    def test_update_tasks_batch_needs_scope(self):
+        response = self.client.patch("/tasks/batch", json={"filter": {"task_type": "daily"}, "values": {"task_complete": True}})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch("/tasks/batch", json={"ids": [1], "values": {"user_id": 2}})
+        self.assertEqual(response.status_code, 400)
+        # Malformed filters are turned away, not a 500
+        for filters in ("x", [1], {"user_id": "1"}, {"user_id": True}, {"task_complete": "false"}, {"task_type": ["daily"]}):
+            response = self.client.patch("/tasks/batch", json={"ids": [1], "filter": filters, "values": {"task_complete": True}})
+            self.assertEqual(response.status_code, 400, filters)
+        # So are values the UPDATE would choke on, and ids that aren't ids
+        for values in ({"task_complete": "false"}, {"task_name": None}, {"task_name": ""}, {"task_renewed": 0}, {"task_type": "weekly"}):
+            response = self.client.patch("/tasks/batch", json={"ids": [1], "values": values})
+            self.assertEqual(response.status_code, 400, values)
+        response = self.client.patch("/tasks/batch", json={"ids": ["1"], "values": {"task_complete": True}})
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_tasks_etag(self):
+        self.add_tasks(3)
+        url = f"/tasks?user_id={self.user_id}"
+        first = self.client.get(url)
+        etag = first.headers["ETag"]
+        self.assertTrue(etag)
+
+        # Unchanged list, 304 without a body
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b"")
+
+        # Other query params are another representation, with their own ETag
+        self.assertNotEqual(self.client.get(url + "&limit=2").headers["ETag"], etag)
+
+        # Any task write changes it
+        self.client.post("/tasks", json={
+            "user_id": self.user_id, "task_name": "New", "task_type": "daily", "due_date": "2025-05-01"
+        })
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        etag = response.headers["ETag"]
+
+        self.client.patch("/tasks/batch", json={"filter": {"user_id": self.user_id}, "values": {"task_renewed": True}})
+        self.assertEqual(self.client.get(url, headers={"If-None-Match": etag}).status_code, 200)
+
+    def test_get_tasks_not_modified_skips_tasks_table(self):
+        url = f"/tasks?user_id={self.user_id}"
+        etag = self.client.get(url).headers["ETag"]
+
+        statements = []
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        with self.app.app_context():
+            engine = db.engine
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            response = self.client.get(url, headers={"If-None-Match": etag})
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([statement for statement in statements if "FROM tasks" in statement])
+
+    def test_get_tasks_sparse_fields(self):
+        self.add_tasks(7)
+        statements = []
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        with self.app.app_context():
+            engine = db.engine
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            response = self.client.get(f"/tasks?user_id={self.user_id}&fields=id,task_name&limit=4")
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+        body = response.get_json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([set(task) for task in body["tasks"]], [{"id", "task_name"}] * 4)
+        select = [statement for statement in statements if "FROM tasks" in statement][0]
+        self.assertNotIn("task_type", select)
+        self.assertNotIn("created_date", select)
+
+        # Paging still works off the narrowed rows
+        rest = self.client.get(f"/tasks?user_id={self.user_id}&fields=id,task_name&cursor={body['next_cursor']}").get_json()
+        self.assertEqual(len(rest["tasks"]), 3)
+
+    def test_get_tasks_unknown_field(self):
+        response = self.client.get("/tasks?fields=id,password_hash")
+        self.assertEqual(response.status_code, 400)
+
+    def test_deleted_tasks_are_tombstoned(self):
+        self.add_tasks(2)
+        with self.app.app_context():
+            task_id = Tasks.query.first().id
+
+        self.assertEqual(self.client.delete("/tasks", json={"id": task_id}).status_code, 200)
+        listed = self.client.get(f"/tasks?user_id={self.user_id}").get_json()["tasks"]
+        self.assertNotIn(task_id, [task["id"] for task in listed])
+        self.assertEqual(self.client.patch("/tasks", json={"id": task_id, "task_name": "Back"}).status_code, 404)
+        self.assertEqual(self.client.delete("/tasks", json={"id": task_id}).status_code, 404)
+
+        with self.app.app_context():
+            self.assertIsNotNone(db.session.get(Tasks, task_id).deleted_at)
+
+    def test_task_changes_since_token(self):
+        self.add_tasks(4)
+        url = f"/tasks/changes?user_id={self.user_id}"
+        first = self.client.get(url).get_json()
+        self.assertEqual(len(first["changes"]), 4)
+        self.assertFalse(first["has_more"])
+        token = first["next_token"]
+
+        # Nothing changed yet
+        self.assertEqual(self.client.get(f"{url}&since={token}").get_json()["changes"], [])
+
+        ids = [change["id"] for change in first["changes"]]
+        self.client.patch("/tasks", json={"id": ids[0], "task_name": "Renamed"})
+        self.client.delete("/tasks", json={"id": ids[1]})
+        self.client.post("/tasks", json={
+            "user_id": self.user_id, "task_name": "Fresh", "task_type": "daily", "due_date": "2025-06-01"
+        })
+
+        changes = self.client.get(f"{url}&since={token}").get_json()["changes"]
+        self.assertEqual(len(changes), 3)
+        by_id = {change["id"]: change for change in changes}
+        self.assertEqual(by_id[ids[0]]["task_name"], "Renamed")
+        self.assertTrue(by_id[ids[1]]["deleted"])
+        self.assertEqual([change["task_name"] for change in changes if change["id"] not in ids], ["Fresh"])
+
+    def test_task_changes_committed_late(self):
+        self.add_tasks(2)
+        url = f"/tasks/changes?user_id={self.user_id}"
+        first = self.client.get(url).get_json()
+        token = first["next_token"]
+
+        # A write stamped (at flush) before the client synced, but committed after it
+        task_id = first["changes"][0]["id"]
+        self.client.patch("/tasks", json={"id": task_id, "task_name": "Slow"})
+        with self.app.app_context():
+            db.session.execute(
+                update(Tasks.__table__).where(Tasks.id == task_id).values(updated_at=datetime(2000, 1, 1))
+            )
+            db.session.commit()
+
+        changes = self.client.get(f"{url}&since={token}").get_json()["changes"]
+        self.assertEqual([(change["id"], change["task_name"]) for change in changes], [(task_id, "Slow")])
+
+    def test_task_changes_token_dated_when_issued(self):
+        self.add_tasks(2)
+        # Last changed long ago, the token is still as fresh as the sync that handed it out
+        with self.app.app_context():
+            db.session.execute(update(Tasks.__table__).values(updated_at=datetime(2000, 1, 1)))
+            db.session.commit()
+        url = f"/tasks/changes?user_id={self.user_id}"
+        first = self.client.get(url).get_json()
+        self.assertEqual(self.client.get(f"{url}&since={first['next_token']}").status_code, 200)
+
+        # Nothing new since an aging token, the same position comes back issued now
+        last_seq, last_id, _ = decode_cursor(first["next_token"])
+        aging = encode_cursor(last_seq, last_id, (datetime.now(timezone.utc) - timedelta(days=29)).isoformat())
+        body = self.client.get(f"{url}&since={aging}").get_json()
+        self.assertEqual(body["changes"], [])
+        seq, task_id, issued_at = decode_cursor(body["next_token"])
+        self.assertEqual((seq, task_id), (last_seq, last_id))
+        self.assertLess(datetime.now(timezone.utc).replace(tzinfo=None) - datetime.fromisoformat(issued_at), timedelta(minutes=1))
+
+    def test_task_changes_pages(self):
+        self.add_tasks(5)
+        url = f"/tasks/changes?user_id={self.user_id}&limit=2"
+        seen = []
+        token = None
+        while True:
+            body = self.client.get(url + (f"&since={token}" if token else "")).get_json()
+            seen.extend(change["id"] for change in body["changes"])
+            token = body["next_token"]
+            if not body["has_more"]:
+                break
+        self.assertEqual(len(set(seen)), 5)
+
+    def test_search_tasks_ranked_and_in_sync(self):
+        with self.app.app_context():
+            tasks = [
+                Tasks(user_id=self.user_id, task_name="Do the laundry", task_type="daily"),
+                Tasks(user_id=self.user_id, task_name="Laundry laundry laundry", task_type="daily"),
+                Tasks(user_id=self.user_id, task_name="Walk the dog", task_type="daily"),
+            ]
+            db.session.add_all(tasks)
+            db.session.commit()
+            laundry, heavy, dog = [task.id for task in tasks]
+
+        url = f"/tasks/search?user_id={self.user_id}&q="
+        body = self.client.get(url + "laundry").get_json()
+        self.assertEqual([task["id"] for task in body["tasks"]], [heavy, laundry])
+
+        # Renames and deletes reach the index
+        self.client.patch("/tasks", json={"id": dog, "task_name": "Fold the laundries"})
+        self.client.delete("/tasks", json={"id": laundry})
+        body = self.client.get(url + "laundry").get_json()
+        self.assertEqual({task["id"] for task in body["tasks"]}, {heavy, dog})
+        self.assertEqual(self.client.get(url + "dog").get_json()["tasks"], [])
+
+    def test_search_tasks_pages(self):
+        with self.app.app_context():
+            db.session.add_all([
+                Tasks(user_id=self.user_id, task_name=f"Read chapter {i}", task_type="short-term")
+                for i in range(7)
+            ])
+            db.session.commit()
+
+        seen = []
+        cursor = None
+        while True:
+            url = f"/tasks/search?user_id={self.user_id}&q=chapter&limit=3" + (f"&cursor={cursor}" if cursor else "")
+            body = self.client.get(url).get_json()
+            seen.extend(task["id"] for task in body["tasks"])
+            cursor = body["next_cursor"]
+            if not cursor:
+                break
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(len(set(seen)), 7)
+
+    def test_search_tasks_needs_words(self):
+        self.assertEqual(self.client.get('/tasks/search?q="*').status_code, 400)
+        self.assertEqual(self.client.get("/tasks/search?q=x&cursor=bad").status_code, 400)
+        self.assertEqual(self.client.get(f"/tasks/search?q=x&cursor={encode_cursor(-5)}").status_code, 400)
+
+    def test_task_stats(self):
+        now = datetime.utcnow()
+        with self.app.app_context():
+            db.session.add_all([
+                Tasks(user_id=self.user_id, task_name="Done", task_type="daily", task_complete=True),
+                Tasks(user_id=self.user_id, task_name="Late", task_type="daily", due_date=now - timedelta(days=1)),
+                Tasks(user_id=self.user_id, task_name="Later", task_type="long-term", due_date=now + timedelta(days=1)),
+                Tasks(user_id=self.user_id, task_name="Old", task_type="long-term", created_date=datetime(2020, 1, 1)),
+            ])
+            db.session.commit()
+
+        body = self.client.get(f"/tasks/stats?user_id={self.user_id}").get_json()
+        self.assertEqual((body["total"], body["completed"], body["overdue"]), (4, 1, 1))
+        self.assertEqual(body["completion_rate"], 0.25)
+        self.assertEqual(body["by_type"]["daily"], {"total": 2, "completed": 1, "completion_rate": 0.5, "overdue": 1})
+        self.assertEqual(body["by_type"]["short-term"]["total"], 0)
+
+        # Date range is on created_date
+        body = self.client.get(f"/tasks/stats?user_id={self.user_id}&start=2021-01-01").get_json()
+        self.assertEqual(body["by_type"]["long-term"]["total"], 1)
+
+    def test_task_stats_cached_until_a_write(self):
+        self.add_tasks(3)
+        url = f"/tasks/stats?user_id={self.user_id}"
+        cache = self.app.extensions["task_stats_cache"]
+        self.assertEqual(self.client.get(url).get_json()["total"], 3)
+
+        # Served from the cache, the tasks table isn't read
+        statements = []
+        with self.app.app_context():
+            engine = db.engine
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            self.assertEqual(self.client.get(url).get_json()["total"], 3)
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        self.assertFalse([s for s in statements if "FROM tasks" in s])
+        self.assertEqual(cache.stats()["hits"], 1)
+
+        # A write invalidates it
+        self.client.post("/tasks", json={
+            "user_id": self.user_id, "task_name": "New", "task_type": "daily", "due_date": "2025-03-25"
+        })
+        self.assertEqual(self.client.get(url).get_json()["total"], 4)
+
+    def test_task_stats_bad_params(self):
+        self.assertEqual(self.client.get("/tasks/stats").status_code, 400)
+        self.assertEqual(self.client.get(f"/tasks/stats?user_id={self.user_id}&start=soon").status_code, 400)
+        self.assertEqual(self.client.get("/tasks/stats?user_id=999").status_code, 404)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,13 @@
+import os
+import random
+import tempfile
+import threading
 import unittest
-from sqlalchemy import text
+from unittest import mock
+from sqlalchemy import delete, text
 from app import create_app, db
-from app.models import Users, CustomizationItems, Transactions
+from app.models import Users, CustomizationItems, Transactions, Wallets, WalletLedger
+from app.util import sign_token
 
 
 class TestTransactionsModel(unittest.TestCase):
@@ -91,6 +97,195 @@ class TestTransactionsModel(unittest.TestCase):
             with self.assertRaises(Exception):
                 db.session.commit()
 
+
+class TestPurchaseRoute(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config["TESTING"] = True
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            user = Users(username="buyer", first_name="Buy", last_name="Er", email="buyer@example.com", password_hash="x")
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(Wallets(user_id=user.id, balance=100))
+            item = CustomizationItems(item_type="shirt", name="Blue Shirt", item_cost=60, model_key="blue_shirt")
+            db.session.add(item)
+            db.session.commit()
+            self.user_id, self.item_id = user.id, item.id
+        self.headers = {"Authorization": f"Bearer {sign_token({'id': self.user_id})}"}
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def buy(self, item_id=None, user_id=None):
+        body = {"user_id": user_id or self.user_id, "item_id": item_id or self.item_id}
+        return self.client.post("/items", json=body, headers=self.headers)
+
+    def test_purchase_charges_once(self):
+        response = self.buy()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.get_json()["remaining_balance"], 40)
+        self.assertEqual(self.buy().get_json()["message"], "Item already owned.")
+        with self.app.app_context():
+            self.assertEqual(Wallets.query.filter_by(user_id=self.user_id).one().balance, 40)
+            entry = WalletLedger.query.one()
+            self.assertEqual((entry.amount, entry.balance_after, entry.reason, entry.item_id), (-60, 40, "purchase", self.item_id))
+
+    def test_purchase_failures_leave_nothing_behind(self):
+        with self.app.app_context():
+            pricey = CustomizationItems(item_type="shoes", name="Gold Shoes", item_cost=500, model_key="gold_shoes")
+            db.session.add(pricey)
+            db.session.commit()
+            pricey_id = pricey.id
+
+        self.assertEqual(self.buy(item_id=pricey_id).get_json()["error"], "Insufficient funds")
+        self.assertEqual(self.buy(item_id=9999).get_json()["error"], "Item not found")
+        self.assertEqual(self.buy(user_id=9999).get_json()["error"], "User not found")
+        with self.app.app_context():
+            self.assertEqual(Transactions.query.count(), 0)
+            self.assertEqual(Wallets.query.filter_by(user_id=self.user_id).one().balance, 100)
+
+    def add_items(self, *costs):
+        with self.app.app_context():
+            items = [CustomizationItems(item_type="shoes", name=f"Shoes {i}", item_cost=cost, model_key=f"shoes_{i}") for i, cost in enumerate(costs)]
+            db.session.add_all(items)
+            db.session.commit()
+            return [item.id for item in items]
+
+    def checkout(self, item_ids):
+        return self.client.post("/items/checkout", json={"user_id": self.user_id, "item_ids": item_ids}, headers=self.headers)
+
+    def test_checkout_buys_cart_in_one_go(self):
+        self.buy()
+        cheap, other = self.add_items(15, 20)
+        response = self.checkout([self.item_id, cheap, other, cheap, 9999])
+        self.assertEqual(response.status_code, 201)
+        body = response.get_json()
+        self.assertEqual([(item["item_id"], item["status"]) for item in body["items"]], [
+            (self.item_id, "owned"), (cheap, "purchased"), (other, "purchased"), (9999, "not_found")
+        ])
+        self.assertEqual((body["total_cost"], body["remaining_balance"]), (35, 5))
+
+        # Everything owned already, nothing is charged
+        response = self.checkout([cheap, other])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["remaining_balance"], 5)
+        with self.app.app_context():
+            self.assertEqual(Transactions.query.filter_by(user_id=self.user_id).count(), 3)
+
+    def test_checkout_is_all_or_nothing(self):
+        cheap, pricey = self.add_items(10, 95)
+        response = self.checkout([cheap, pricey])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json(), {"error": "Insufficient funds", "total_cost": 105})
+        with self.app.app_context():
+            self.assertEqual(Transactions.query.count(), 0)
+            self.assertEqual(Wallets.query.filter_by(user_id=self.user_id).one().balance, 100)
+        self.assertEqual(self.checkout("nope").status_code, 400)
+        self.assertEqual(self.checkout([True]).status_code, 400)
+
+    def test_checkout_spends_only_own_coins(self):
+        cheap, = self.add_items(10)
+        with self.app.app_context():
+            other = Users(username="victim", first_name="Vic", last_name="Tim", email="victim@example.com", password_hash="x")
+            db.session.add(other)
+            db.session.flush()
+            db.session.add(Wallets(user_id=other.id, balance=100))
+            db.session.commit()
+            other_id = other.id
+
+        response = self.client.post("/items/checkout", json={"user_id": other_id, "item_ids": [cheap]}, headers=self.headers)
+        self.assertEqual(response.status_code, 403)
+        # Without user_id the buyer comes from the token
+        response = self.client.post("/items/checkout", json={"item_ids": [cheap]}, headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        with self.app.app_context():
+            self.assertEqual(Wallets.query.filter_by(user_id=other_id).one().balance, 100)
+            self.assertEqual(Wallets.query.filter_by(user_id=self.user_id).one().balance, 90)
+        self.assertEqual(self.checkout(list(range(1, 200))).status_code, 413)
+
+    def test_checkout_with_rows_gone(self):
+        cheap, gone = self.add_items(10, 20)
+        self.client.get("/items") # loads the catalog with both
+        with self.app.app_context():
+            # Enforce foreign keys like Postgres does
+            db.session.execute(text("PRAGMA foreign_keys = ON"))
+            # Still in the catalog, the delete skipped the ORM that would have invalidated it
+            db.session.execute(delete(CustomizationItems.__table__).where(CustomizationItems.id == gone))
+            db.session.commit()
+
+            response = self.checkout([cheap, gone])
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.get_json(), {"error": "Item not found", "item_ids": [gone]})
+            # A token for an account that no longer exists
+            ghost = {"Authorization": f"Bearer {sign_token({'id': 9999})}"}
+            response = self.client.post("/items/checkout", json={"item_ids": [cheap]}, headers=ghost)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.get_json()["error"], "User not found")
+            self.assertEqual(Transactions.query.count(), 0)
+
+
+# Many threads buying from one wallet against a database file, where each request gets its own connection
+class TestConcurrentPurchases(unittest.TestCase):
+    THREADS = 8
+    ITEMS = 30
+
+    def setUp(self):
+        self.db_file = os.path.join(tempfile.mkdtemp(), "purchases.db")
+        env = {"APP_ENV": "local", "LOCAL_DATABASE_URL": f"sqlite:///{self.db_file}"}
+        with mock.patch.dict(os.environ, env):
+            self.app = create_app()
+        self.app.config["TESTING"] = True
+        with self.app.app_context():
+            db.create_all()
+            user = Users(username="spender", first_name="Spend", last_name="Er", email="spend@example.com", password_hash="x")
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(Wallets(user_id=user.id, balance=100))
+            db.session.add_all([
+                CustomizationItems(item_type="shirt", name=f"Shirt {i}", item_cost=10, model_key=f"shirt_{i}")
+                for i in range(self.ITEMS)
+            ])
+            db.session.commit()
+            self.user_id = user.id
+            self.item_ids = [item.id for item in CustomizationItems.query]
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        os.remove(self.db_file)
+
+    def test_no_double_spend(self):
+        headers = {"Authorization": f"Bearer {sign_token({'id': self.user_id})}"}
+        statuses = []
+        lock = threading.Lock()
+
+        def shopper(seed):
+            client = self.app.test_client()
+            item_ids = list(self.item_ids)
+            random.Random(seed).shuffle(item_ids)
+            for item_id in item_ids:
+                status = client.post("/items", json={"user_id": self.user_id, "item_id": item_id}, headers=headers).status_code
+                with lock:
+                    statuses.append(status)
+
+        threads = [threading.Thread(target=shopper, args=(seed,)) for seed in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # 100 coins buy exactly 10 items, however the requests interleave
+        self.assertEqual(statuses.count(201), 10)
+        self.assertEqual(set(statuses) - {200, 201, 400}, set())
+        with self.app.app_context():
+            self.assertEqual(Wallets.query.filter_by(user_id=self.user_id).one().balance, 0)
+            self.assertEqual(Transactions.query.filter_by(user_id=self.user_id).count(), 10)
+
 if __name__ == '__main__':
     unittest.main()
 
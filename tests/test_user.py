@@ -1,6 +1,8 @@
 import unittest
+from unittest import mock
+from sqlalchemy.exc import IntegrityError
 from app import create_app, db
-from app.models import Users
+from app.models import Users, Avatar, Wallets, CustomizationItems
 
 class UserModelTestCase(unittest.TestCase):
     def setUp(self):
@@ -37,7 +39,62 @@ class UserModelTestCase(unittest.TestCase):
             self.assertTrue(retrieved_user.check_password("securepass"))
             self.assertFalse(retrieved_user.check_password("wrongpass"))
 
-    # Add more tests as needed, e.g., test for duplicate email, etc.
+    def add_default_items(self):
+        with self.app.app_context():
+            db.session.add_all([
+                CustomizationItems(item_type="skin", name="Default Skin", item_cost=0, model_key="default_skin"),
+                CustomizationItems(item_type="shirt", name="White Shirt", item_cost=0, model_key="white_shirt"),
+                CustomizationItems(item_type="shoes", name="Black Shoes", item_cost=0, model_key="black_shoes"),
+            ])
+            db.session.commit()
+
+    def signup(self, username="newuser", email="new@example.com"):
+        return self.client.post("/signup", json={
+            "username": username, "first_name": "New", "last_name": "User", "email": email, "password": "securepass"
+        })
+
+    def test_signup_creates_user_avatar_and_wallet(self):
+        self.add_default_items()
+        response = self.signup()
+        self.assertEqual(response.status_code, 201)
+        user_id = response.get_json()["user"]["id"]
+
+        with self.app.app_context():
+            avatar = Avatar.query.filter_by(user_id=user_id).one()
+            self.assertEqual(avatar.skin.name, "Default Skin")
+            self.assertEqual(avatar.shoes.name, "Black Shoes")
+            self.assertEqual(Wallets.query.filter_by(user_id=user_id).one().balance, 0)
+            # No energy decay unless it is switched on
+            self.assertEqual(avatar.energy_rate, 0)
+
+        # Default items come from the catalog, not from a query per signup
+        self.assertIn("Default Skin", self.app.extensions["catalog"].snapshot.by_name)
+        self.assertEqual(self.signup("second", "second@example.com").status_code, 201)
+
+    def test_signup_uses_configured_energy_rate(self):
+        self.app.config["AVATAR_ENERGY_RATE"] = -1.5
+        response = self.signup()
+        self.assertEqual(response.status_code, 201)
+        with self.app.app_context():
+            self.assertEqual(Avatar.query.one().energy_rate, -1.5)
+
+    def test_signup_duplicates(self):
+        self.add_default_items()
+        self.assertEqual(self.signup().status_code, 201)
+        self.assertEqual(self.signup(username="other").status_code, 409)
+        response = self.signup(email="other@example.com")
+        self.assertEqual(response.status_code, 409)
+        self.assertIn("username", response.get_json()["message"])
+
+    def test_signup_is_all_or_nothing(self):
+        self.add_default_items()
+        # A wallet that breaks its check constraint fails the whole signup
+        with mock.patch("app.routes.Wallets", lambda user: Wallets(user=user, balance=-1)):
+            with self.assertRaises(IntegrityError):
+                self.signup()
+        with self.app.app_context():
+            self.assertEqual(Users.query.count(), 0)
+            self.assertEqual(Avatar.query.count(), 0)
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,6 +1,20 @@
+import io
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
+from collections import defaultdict
+from contextlib import redirect_stdout
+from unittest import mock
 from app import create_app, db
-from app.models import Users, Wallets
+from app.models import Users, Wallets, WalletLedger, WalletSnapshots
+from app.util import sign_token
+from app.credits import CreditBuffer, start_credit_buffer
+from app.wallets import adjust_balance, snapshot_wallets
 
 class TestWalletsModel(unittest.TestCase):
     def setUp(self):
@@ -77,5 +91,243 @@ class TestWalletsModel(unittest.TestCase):
             with self.assertRaises(Exception):
                 db.session.commit()
 
+
+class TestWalletLedger(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            user = Users(username='saver', first_name='Sa', last_name='Ver', email='saver@example.com', password_hash='x')
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(Wallets(user_id=user.id, balance=0))
+            db.session.commit()
+            self.user_id = user.id
+        self.headers = {"Authorization": f"Bearer {sign_token({'id': self.user_id})}"}
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def adjust(self, amount):
+        return self.client.post("/balance", json={"amount": amount}, headers=self.headers)
+
+    def test_adjustments_are_recorded(self):
+        self.assertEqual(self.adjust(50).get_json(), {"balance": 50})
+        self.assertEqual(self.adjust(-20).get_json(), {"balance": 30})
+
+        # Going below 0 changes nothing, and leaves no ledger entry behind
+        response = self.adjust(-31)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Current Balance: 30", response.get_json()["error"])
+        self.assertEqual(self.adjust("10").status_code, 400)
+        with self.app.app_context():
+            entries = WalletLedger.query.order_by(WalletLedger.id).all()
+            self.assertEqual([(entry.amount, entry.balance_after, entry.reason) for entry in entries], [(50, 50, "adjustment"), (-20, 30, "adjustment")])
+            self.assertEqual(db.session.get(Wallets, 1).balance, 30)
+
+    def test_history_pages_by_keyset(self):
+        for amount in range(1, 6):
+            self.adjust(amount)
+        response = self.client.get("/balance/history?limit=2", headers=self.headers).get_json()
+        self.assertEqual([entry["amount"] for entry in response["entries"]], [5, 4])
+        seen = [5, 4]
+        while response["next_cursor"]:
+            response = self.client.get(f"/balance/history?limit=2&cursor={response['next_cursor']}", headers=self.headers).get_json()
+            seen += [entry["amount"] for entry in response["entries"]]
+        self.assertEqual(seen, [5, 4, 3, 2, 1])
+        self.assertEqual(self.client.get("/balance/history?cursor=nope", headers=self.headers).status_code, 400)
+
+    def test_snapshots_fold_the_ledger(self):
+        self.adjust(40)
+        self.adjust(-15)
+        with self.app.app_context():
+            self.assertEqual(snapshot_wallets(), 1)
+            self.assertEqual(snapshot_wallets(), 0) # nothing new since
+            self.adjust(10)
+            self.assertEqual(snapshot_wallets(), 1)
+            balances = [snapshot.balance for snapshot in WalletSnapshots.query.order_by(WalletSnapshots.id)]
+            self.assertEqual(balances, [25, 35])
+
+            # A balance change that skipped the ledger shows up at the next fold
+            db.session.get(Wallets, 1).balance = 100
+            db.session.commit()
+            adjust_balance(self.user_id, 1, "adjustment")
+            db.session.commit()
+            output = io.StringIO()
+            with redirect_stdout(output):
+                snapshot_wallets()
+            self.assertIn("doesn't add up", output.getvalue())
+
+    def test_coalesced_credits(self):
+        # A long window, so nothing is written until we say so
+        buffer = start_credit_buffer(self.app, window=60, max_count=1000)
+        try:
+            for _ in range(10):
+                self.assertEqual(self.adjust(3).status_code, 200)
+            # Read your writes, before anything reached the database
+            self.assertEqual(self.client.get("/balance", headers=self.headers).get_json(), {"balance": 30})
+            with self.app.app_context():
+                self.assertEqual(db.session.get(Wallets, 1).balance, 0)
+
+            # A debit writes the buffered credits out first
+            self.assertEqual(self.adjust(-25).get_json(), {"balance": 5})
+            self.adjust(4)
+        finally:
+            buffer.stop()
+
+        # Stopping writes out the rest, as one increment
+        with self.app.app_context():
+            self.assertEqual(db.session.get(Wallets, 1).balance, 9)
+            entries = WalletLedger.query.order_by(WalletLedger.id).all()
+            self.assertEqual([(entry.amount, entry.reason) for entry in entries], [(30, "credits"), (-25, "adjustment"), (4, "credits")])
+        self.assertEqual(self.client.get("/balance", headers=self.headers).get_json(), {"balance": 9})
+
+    def test_full_buffer_flushes_early(self):
+        buffer = start_credit_buffer(self.app, window=60, max_count=3)
+        try:
+            for _ in range(3):
+                self.adjust(1)
+            # The thread wakes up and flushes without waiting for the window
+            deadline = time.monotonic() + 5
+            while buffer.buffered(self.user_id) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            with self.app.app_context():
+                self.assertEqual(db.session.get(Wallets, 1).balance, 3)
+        finally:
+            buffer.stop()
+
+    def test_user_flush_keeps_count(self):
+        buffer = CreditBuffer(self.app, window=60, max_count=5)
+        for _ in range(3):
+            buffer.add(self.user_id, 1)
+        buffer.add(self.user_id + 1, 1)
+        buffer.flush(self.user_id)
+        self.assertEqual(buffer.count, 1)
+        # Three more don't fill a buffer of five yet
+        for _ in range(3):
+            buffer.add(self.user_id, 1)
+        self.assertFalse(buffer.wake.is_set())
+        buffer.add(self.user_id, 1)
+        self.assertTrue(buffer.wake.is_set())
+
+    def test_balance_reads_skip_the_flush_lock(self):
+        buffer = CreditBuffer(self.app, window=60, max_count=1000)
+        buffer.add(self.user_id, 4)
+        results = []
+
+        def read():
+            with self.app.app_context():
+                results.append(buffer.balance(self.user_id))
+
+        # Some other batch is being written, reads go ahead regardless
+        with buffer.flush_lock:
+            reader = threading.Thread(target=read)
+            reader.start()
+            reader.join(5)
+        self.assertEqual(results, [4])
+
+        # The user's own credits are being written: the read waits for that batch and counts it once
+        with buffer.lock:
+            buffer.flushing, buffer.pending = dict(buffer.pending), defaultdict(int)
+        reader = threading.Thread(target=read)
+        reader.start()
+        time.sleep(0.1)
+        self.assertTrue(reader.is_alive())
+        with self.app.app_context():
+            adjust_balance(self.user_id, 4, "credits")
+            db.session.commit()
+        buffer.add(self.user_id, 1)
+        with buffer.lock:
+            buffer.finish_batch()
+        reader.join(5)
+        self.assertEqual(results, [4, 5])
+
+
+# Buffers credits in a process that then gets SIGTERM, the way docker stop ends it
+TERMINATED_EARNER = """
+import sys, time
+from app import create_app
+from app.credits import CreditBuffer, start_credit_buffer
+app = create_app()
+buffer = start_credit_buffer(app, window=60, max_count=1000)
+for _ in range(7):
+    buffer.add(1, 5)
+print("buffered", flush=True)
+while True:
+    time.sleep(1)
+"""
+
+class TestCreditsOnShutdown(unittest.TestCase):
+    def test_sigterm_writes_out_buffered_credits(self):
+        db_file = os.path.join(tempfile.mkdtemp(), "credits.db")
+        env = {**os.environ, "APP_ENV": "local", "LOCAL_DATABASE_URL": f"sqlite:///{db_file}", "PYTHONPATH": os.getcwd()}
+        with mock.patch.dict(os.environ, env):
+            app = create_app()
+        with app.app_context():
+            db.create_all()
+            user = Users(username='leaver', first_name='Lea', last_name='Ver', email='leaver@example.com', password_hash='x')
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(Wallets(user_id=user.id, balance=0))
+            db.session.commit()
+
+        process = subprocess.Popen([sys.executable, "-c", TERMINATED_EARNER], env=env, stdout=subprocess.PIPE, text=True)
+        try:
+            # Wait for the credits to be buffered, past whatever the app prints while starting
+            for line in process.stdout:
+                if line.startswith("buffered"):
+                    break
+            process.send_signal(signal.SIGTERM)
+            self.assertEqual(process.wait(timeout=30), 128 + signal.SIGTERM)
+        finally:
+            process.kill()
+            process.stdout.close()
+
+        with app.app_context():
+            self.assertEqual(Wallets.query.one().balance, 35)
+            self.assertEqual([entry.amount for entry in WalletLedger.query], [35])
+            db.session.remove()
+            db.engine.dispose()
+        os.remove(db_file)
+
+
+# Concurrent rewards against a database file, none of them may be lost
+class TestConcurrentAdjustments(unittest.TestCase):
+    def test_no_lost_updates(self):
+        db_file = os.path.join(tempfile.mkdtemp(), "wallets.db")
+        with mock.patch.dict(os.environ, {"APP_ENV": "local", "LOCAL_DATABASE_URL": f"sqlite:///{db_file}"}):
+            app = create_app()
+        app.config['TESTING'] = True
+        with app.app_context():
+            db.create_all()
+            user = Users(username='earner', first_name='Ear', last_name='Ner', email='earner@example.com', password_hash='x')
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(Wallets(user_id=user.id, balance=0))
+            db.session.commit()
+            headers = {"Authorization": f"Bearer {sign_token({'id': user.id})}"}
+
+        def earner():
+            client = app.test_client()
+            for _ in range(25):
+                client.post("/balance", json={"amount": 2}, headers=headers)
+
+        threads = [threading.Thread(target=earner) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with app.app_context():
+            self.assertEqual(Wallets.query.one().balance, 400)
+            self.assertEqual(WalletLedger.query.count(), 200)
+            db.session.remove()
+            db.engine.dispose()
+        os.remove(db_file)
+
 if __name__ == '__main__':
     unittest.main()